@@ -3,28 +3,30 @@ import requests
 import json
 import time
 import os
+import sys
+import argparse
 import datetime
-import re
 from typing import List, Dict, Any, Optional
-
-# Try to import from local modules, otherwise use defaults
-try:
-    from config import OLLAMA_BASE
-except ImportError:
-    OLLAMA_BASE = os.getenv("OLLAMA_BASE", "http://localhost:11434")
-
-try:
-    from utils import robust_json_parser
-except ImportError:
-    def robust_json_parser(text):
-        # Simple fallback parser
-        text = re.sub(r"```json", "", text, flags=re.IGNORECASE)
-        text = re.sub(r"```", "", text)
-        return text.strip()
+from concurrent.futures import ThreadPoolExecutor
+
+# The workload replays the server's own prompts, schemas and options, and
+# runs are indexed by benchmark_history, so this script runs from the
+# repository (python benchmark.py)
+from benchmark_history import append_index, compare_main
+from config import OLLAMA_BASE, OLLAMA_STRUCTURED_OUTPUTS, OLLAMA_OPTIONS_PROFILE
+from models import ExpandRequest, AnalysisRequest
+from options_profile import OptionsProfile
+from prompts import LESSON_MODES, build_expand_prompt, build_lesson_prompt
+from schemas import expand_schema, lesson_schema
+from utils import robust_json_parser, filter_children_response, validate_timeline_event, validate_quiz_question
 
 # Configuration
 OUTPUT_BASE_DIR = "benchmark_results"
 TIMEOUT_SECONDS = 90  # Increased for potentially slower code generation/summarization
+CONCURRENCY_LEVELS = [1, 2, 4, 8]
+
+# Tuned options the server applies per model; loaded by main()
+options_profile = OptionsProfile(OLLAMA_OPTIONS_PROFILE)
 
 # Test Prompts
 TEST_SUITE = [
@@ -82,10 +84,39 @@ TEST_SUITE = [
     }
 ]
 
+# Production-shaped workloads: the prompts server.py sends, over topics at
+# several depths. Deeper entries carry the sibling/parent names the frontend
+# sends as recent_nodes, so forbidden-topic filtering is exercised too.
+WORKLOAD_TOPICS = [
+    {"node": "Physics", "context": "Physics", "recent_nodes": []},
+    {"node": "Optics", "context": "Physics > Optics",
+     "recent_nodes": ["Optics", "Mechanics", "Thermodynamics", "Electromagnetism", "Quantum Mechanics"]},
+    {"node": "Total Internal Reflection", "context": "Physics > Optics > Refraction > Total Internal Reflection",
+     "recent_nodes": ["Total Internal Reflection", "Snell's Law", "Refractive Index", "Dispersion", "Refraction"]},
+    {"node": "The Roman Empire", "context": "The Roman Empire", "recent_nodes": []},
+    {"node": "Photosynthesis", "context": "Biology > Plant Biology > Photosynthesis",
+     "recent_nodes": ["Photosynthesis", "Plant Anatomy", "Plant Hormones", "Transpiration", "Botany"]},
+]
+WORKLOAD_LESSON_MODES = list(LESSON_MODES)
+# What the frontend sends for a click (regenerate uses 0.7)
+EXPAND_TEMPERATURE = 0.5
+EXPECTED_CHILDREN = 5
+WORKLOAD_QUIZ_QUESTIONS = 3
+
 def ensure_dir(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
+def get_ollama_version() -> Optional[str]:
+    try:
+        res = requests.get(f"{OLLAMA_BASE}/api/version", timeout=5)
+        if res.status_code == 200:
+            version = res.json().get("version")
+            return version if isinstance(version, str) else None
+    except Exception:
+        pass
+    return None
+
 def get_models() -> List[str]:
     print("🔍 Scanning for models...")
     try:
@@ -100,90 +131,98 @@ def get_models() -> List[str]:
         print("Please ensure Ollama is running.")
     return []
 
-def run_test(model: str, test: Dict[str, Any]) -> Dict[str, Any]:
-    print(f"    Running test: {test['name']}...", end="", flush=True)
+def stream_generate(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Streams one /api/generate call and returns the text plus timings.
+    Ollama reports its own durations (nanoseconds) in the final chunk:
+    load_duration is time spent loading the model, prompt_eval_* the prefill
+    and eval_* the generation; ttft is measured here on the wire.
+    """
+    start_time = time.perf_counter()
+    res = requests.post(f"{OLLAMA_BASE}/api/generate", json=dict(payload, stream=True),
+                        timeout=TIMEOUT_SECONDS, stream=True)
+    try:
+        if res.status_code != 200:
+            raise RuntimeError(f"HTTP {res.status_code}: {res.text}")
+        ttft = None
+        parts = []
+        final = {}
+        for line in res.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            if chunk.get("response"):
+                if ttft is None:
+                    ttft = time.perf_counter() - start_time
+                parts.append(chunk["response"])
+            if chunk.get("done"):
+                final = chunk
+    finally:
+        res.close()
+    duration = time.perf_counter() - start_time
+
+    eval_count = final.get("eval_count", 0)
+    eval_duration = final.get("eval_duration", 0)
+    prompt_eval_count = final.get("prompt_eval_count", 0)
+    prompt_eval_duration = final.get("prompt_eval_duration", 0)
+    return {
+        "response": "".join(parts),
+        "duration": duration,
+        "ttft": ttft if ttft is not None else duration,
+        "load_duration": final.get("load_duration", 0) / 1e9,
+        "prompt_eval_count": prompt_eval_count,
+        "prompt_eval_duration": prompt_eval_duration / 1e9,
+        "prompt_tokens_per_second": prompt_eval_count / (prompt_eval_duration / 1e9) if prompt_eval_duration > 0 else 0,
+        "eval_count": eval_count,
+        "tokens_per_second": eval_count / (eval_duration / 1e9) if eval_duration > 0 else 0,
+    }
 
-    payload = {
+def build_payload(model: str, test: Dict[str, Any]) -> Dict[str, Any]:
+    return {
         "model": model,
         "prompt": test['prompt'],
         "system": test.get('system', ""),
-        "stream": False,
         "options": {
             "temperature": 0.1, # Low temp for deterministic results in benchmarks
             "num_ctx": 4096
         }
     }
 
-    start_time = time.perf_counter()
+def unload_model(model: str):
+    """Evicts the model so the next request measures a cold start."""
     try:
-        res = requests.post(f"{OLLAMA_BASE}/api/generate", json=payload, timeout=TIMEOUT_SECONDS)
-        end_time = time.perf_counter()
-        duration = end_time - start_time
-
-        if res.status_code == 200:
-            data = res.json()
-            response_text = data.get("response", "")
-            eval_count = data.get("eval_count", 0)
-            eval_duration = data.get("eval_duration", 0) # in nanoseconds
-
-            tokens_per_second = 0
-            if eval_duration > 0:
-                tokens_per_second = eval_count / (eval_duration / 1e9)
+        requests.post(f"{OLLAMA_BASE}/api/generate", json={"model": model, "keep_alive": 0}, timeout=TIMEOUT_SECONDS)
+    except Exception as e:
+        print(f"    ⚠️ Could not unload {model}: {e}")
 
-            # Validation
-            passed = False
-            error_msg = None
+def run_cold_start(model: str) -> Dict[str, Any]:
+    """Times the sanity prompt right after unloading, so load time is reported on its own."""
+    print("    Cold start...", end="", flush=True)
+    unload_model(model)
+    try:
+        stats = stream_generate(build_payload(model, TEST_SUITE[0]))
+    except Exception as e:
+        print(f" Error ({str(e)})")
+        return {"status": "error", "error": str(e)}
+    stats.pop("response")
+    print(f" Done (load {stats['load_duration']:.2f}s, TTFT {stats['ttft']:.2f}s)")
+    return dict(stats, status="success", run="cold")
 
-            if test['type'] == 'json':
-                json_text = robust_json_parser(response_text)
-                try:
-                    json.loads(json_text)
-                    passed = True
-                except json.JSONDecodeError as e:
-                    passed = False
-                    error_msg = f"JSON Error: {str(e)}"
-            elif test.get('validator'):
-                try:
-                    passed = test['validator'](response_text)
-                    if not passed:
-                        error_msg = "Validator returned False"
-                except Exception as e:
-                    passed = False
-                    error_msg = f"Validator Error: {str(e)}"
-            else:
-                passed = True # No validation, just completion
-
-            print(f" Done ({duration:.2f}s, {tokens_per_second:.1f} t/s) [{'Pass' if passed else 'Fail'}]")
-
-            return {
-                "test_id": test['id'],
-                "status": "success",
-                "duration": duration,
-                "response": response_text,
-                "passed": passed,
-                "tokens_per_second": tokens_per_second,
-                "eval_count": eval_count,
-                "error": error_msg
-            }
-        else:
-            print(f" Error (HTTP {res.status_code})")
-            return {
-                "test_id": test['id'],
-                "status": "error",
-                "duration": 0,
-                "response": None,
-                "passed": False,
-                "tokens_per_second": 0,
-                "eval_count": 0,
-                "error": f"HTTP {res.status_code}: {res.text}"
-            }
+def run_test(model: str, test: Dict[str, Any]) -> Dict[str, Any]:
+    print(f"    Running test: {test['name']}...", end="", flush=True)
 
+    try:
+        stats = stream_generate(build_payload(model, test))
     except Exception as e:
         print(f" Error ({str(e)})")
         return {
             "test_id": test['id'],
             "status": "error",
+            "run": "warm",
             "duration": 0,
+            "ttft": 0,
             "response": None,
             "passed": False,
             "tokens_per_second": 0,
@@ -191,19 +230,245 @@ def run_test(model: str, test: Dict[str, Any]) -> Dict[str, Any]:
             "error": str(e)
         }
 
-def analyze_results(results: Dict[str, List[Dict]], timestamp: str) -> List[tuple]:
+    response_text = stats["response"]
+
+    # Validation
+    passed = False
+    error_msg = None
+
+    if test['type'] == 'json':
+        json_text = robust_json_parser(response_text)
+        try:
+            json.loads(json_text)
+            passed = True
+        except json.JSONDecodeError as e:
+            passed = False
+            error_msg = f"JSON Error: {str(e)}"
+    elif test.get('validator'):
+        try:
+            passed = test['validator'](response_text)
+            if not passed:
+                error_msg = "Validator returned False"
+        except Exception as e:
+            passed = False
+            error_msg = f"Validator Error: {str(e)}"
+    else:
+        passed = True # No validation, just completion
+
+    print(f" Done ({stats['duration']:.2f}s, TTFT {stats['ttft']:.2f}s, {stats['tokens_per_second']:.1f} t/s) "
+          f"[{'Pass' if passed else 'Fail'}]")
+
+    return dict(stats, test_id=test['id'], status="success", run="warm", passed=passed, error=error_msg)
+
+def run_concurrency_sweep(model: str, levels: List[int]) -> List[Dict[str, Any]]:
+    """
+    Fires `n` identical streaming requests at once for each level and reports
+    aggregate generation throughput. Ollama serves up to OLLAMA_NUM_PARALLEL
+    requests together; beyond that they queue, which shows as flat aggregate
+    tokens/s and a growing TTFT.
+    """
+    payload = build_payload(model, TEST_SUITE[-1])
+    sweep = []
+    for n in levels:
+        print(f"    Concurrency {n}...", end="", flush=True)
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            futures = [pool.submit(stream_generate, payload) for _ in range(n)]
+            outcomes = []
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append({"error": str(e)})
+        wall = time.perf_counter() - start_time
+        ok = [o for o in outcomes if "error" not in o]
+        tokens = sum(o["eval_count"] for o in ok)
+        level = {
+            "concurrency": n,
+            "requests": n,
+            "errors": n - len(ok),
+            "wall_seconds": wall,
+            "aggregate_tokens_per_second": tokens / wall if wall > 0 else 0,
+            "avg_tokens_per_second": sum(o["tokens_per_second"] for o in ok) / len(ok) if ok else 0,
+            "avg_ttft": sum(o["ttft"] for o in ok) / len(ok) if ok else 0,
+            "max_ttft": max((o["ttft"] for o in ok), default=0),
+        }
+        print(f" {level['aggregate_tokens_per_second']:.1f} t/s aggregate, TTFT avg {level['avg_ttft']:.2f}s"
+              + (f", {level['errors']} errors" if level['errors'] else ""))
+        sweep.append(level)
+    return sweep
+
+def saturation_point(sweep: List[Dict[str, Any]], gain: float = 0.1) -> Optional[int]:
+    """Lowest concurrency after which aggregate throughput grows by less than `gain`."""
+    for prev, cur in zip(sweep, sweep[1:]):
+        if cur["aggregate_tokens_per_second"] < prev["aggregate_tokens_per_second"] * (1 + gain):
+            return prev["concurrency"]
+    return None
+
+def build_workload(topics: List[Dict[str, Any]], modes: List[str]) -> List[Dict[str, Any]]:
+    """One expand item per topic plus one lesson item per (topic, mode)."""
+    items = []
+    for topic in topics:
+        depth = len(topic["context"].split(">"))
+        items.append({"kind": "expand", "node": topic["node"], "context": topic["context"], "depth": depth,
+                      "recent_nodes": topic["recent_nodes"]})
+        for mode in modes:
+            items.append({"kind": mode, "node": topic["node"], "context": topic["context"], "depth": depth})
+    return items
+
+def workload_payload(model: str, item: Dict[str, Any], options: Optional[Dict[str, Any]] = None,
+                     profile: Optional[OptionsProfile] = None) -> Dict[str, Any]:
+    """
+    The payload server.py would send for this item (/api/generate form),
+    with the tuned options from `profile` (default: the server's
+    OLLAMA_OPTIONS_PROFILE) and then any extra `options`.
+    """
+    profile = profile or options_profile
+    if item["kind"] == "expand":
+        req = ExpandRequest(node=item["node"], context=item["context"], model=model,
+                            temperature=EXPAND_TEMPERATURE, recent_nodes=item["recent_nodes"])
+        payload = {"model": model, "prompt": build_expand_prompt(req),
+                   "options": profile.expand_options(model, req.temperature)}
+        schema = expand_schema()
+    else:
+        req = AnalysisRequest(node=item["node"], context=item["context"], model=model, mode=item["kind"],
+                              num_questions=WORKLOAD_QUIZ_QUESTIONS)
+        payload = {"model": model, "prompt": build_lesson_prompt(req), "options": profile.lesson_options(model)}
+        schema = lesson_schema(req.mode, req.num_questions)
+    if schema is not None and OLLAMA_STRUCTURED_OUTPUTS:
+        payload["format"] = schema
+    if options:
+        payload["options"] = {**payload["options"], **options}
+    return payload
+
+def parse_json(text: str):
+    try:
+        return json.loads(robust_json_parser(text))
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+def score_workload_item(item: Dict[str, Any], text: str) -> Dict[str, Any]:
+    """Checks a response the way the server consumes it."""
+    kind = item["kind"]
+    if kind == "expand":
+        data = parse_json(text)
+        raw = data.get("children") if isinstance(data, dict) else data
+        raw_count = len(raw) if isinstance(raw, list) else 0
+        filtered = filter_children_response(data, item["recent_nodes"]) if data is not None else None
+        kept = len(filtered["children"]) if filtered else 0
+        return {
+            "json_valid": data is not None,
+            "child_count": raw_count,
+            "kept": kept,
+            "dropped": raw_count - kept,
+            "passed": kept == EXPECTED_CHILDREN,
+        }
+    if kind == "history":
+        data = parse_json(text)
+        events = [e for e in data if validate_timeline_event(e)] if isinstance(data, list) else []
+        return {"json_valid": data is not None, "items": len(events), "passed": bool(events)}
+    if kind == "quiz":
+        data = parse_json(text)
+        raw = data.get("questions") if isinstance(data, dict) else None
+        questions = [q for q in raw if validate_quiz_question(q)] if isinstance(raw, list) else []
+        return {"json_valid": data is not None, "items": len(questions), "passed": len(questions) == WORKLOAD_QUIZ_QUESTIONS}
+    # Markdown modes only need to say something
+    return {"passed": bool(text.strip())}
+
+def run_workload(model: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    print(f"    Running workload: {len(items)} production prompts...")
+    results = []
+    for item in items:
+        entry = {"kind": item["kind"], "node": item["node"], "depth": item["depth"]}
+        try:
+            stats = stream_generate(workload_payload(model, item))
+        except Exception as e:
+            results.append(dict(entry, status="error", passed=False, error=str(e)))
+            continue
+        text = stats.pop("response")
+        results.append(dict(entry, **stats, status="success", **score_workload_item(item, text)))
+    passed = sum(1 for r in results if r["passed"])
+    print(f"    Workload done ({passed}/{len(results)} passed)")
+    return results
+
+def summarize_workload(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-kind pass/JSON rates and latencies, plus the expand-specific child counts."""
+    def rate(rows, key):
+        return sum(1 for r in rows if r.get(key)) / len(rows) if rows else 0
+
+    def mean(rows, key):
+        rows = [r for r in rows if r["status"] == "success"]
+        return sum(r.get(key, 0) for r in rows) / len(rows) if rows else 0
+
+    kinds = {}
+    for r in results:
+        kinds.setdefault(r["kind"], []).append(r)
+    summary = {
+        kind: {
+            "requests": len(rows),
+            "pass_rate": rate(rows, "passed"),
+            "avg_duration": mean(rows, "duration"),
+            "avg_ttft": mean(rows, "ttft"),
+        }
+        for kind, rows in kinds.items()
+    }
+    for kind in ("expand", "history", "quiz"):
+        if kind in summary:
+            summary[kind]["json_rate"] = rate(kinds[kind], "json_valid")
+    expand = kinds.get("expand", [])
+    if expand:
+        returned = sum(r.get("child_count", 0) for r in expand)
+        summary["expand"]["avg_children"] = mean(expand, "kept")
+        summary["expand"]["drop_rate"] = sum(r.get("dropped", 0) for r in expand) / returned if returned else 0
+    markdown = [r for r in results if r["kind"] not in ("expand", "history", "quiz")]
+    summary["markdown_pass_rate"] = rate(markdown, "passed")
+    summary["tokens_per_second"] = mean(results, "tokens_per_second")
+    return summary
+
+def workload_score(summary: Dict[str, Any]) -> Optional[float]:
+    """
+    Composite score from the production workload, or None when the model
+    cannot drive the site (fewer than 80% of expansions parse as JSON).
+    """
+    expand = summary.get("expand")
+    if not expand or expand.get("json_rate", 0) < 0.8:
+        return None
+    score = 1000 * expand["pass_rate"]
+    score += 300 * summary.get("quiz", {}).get("pass_rate", 0)
+    score += 200 * summary.get("history", {}).get("pass_rate", 0)
+    score += 100 * summary["markdown_pass_rate"]
+    score -= 200 * expand["drop_rate"]
+    # Expansion latency is what a learner waits on for every click
+    score -= 50 * expand["avg_duration"]
+    score += 10 * summary["tokens_per_second"]
+    return score
+
+def test_pass_map(tests: List[Dict]) -> Dict[str, bool]:
+    """A test passes only if every repeat of it succeeded and passed."""
+    pass_map = {}
+    for t in tests:
+        pass_map[t['test_id']] = pass_map.get(t['test_id'], True) and t['status'] == 'success' and t['passed']
+    return pass_map
+
+def analyze_results(results: Dict[str, List[Dict]], timestamp: str,
+                    workloads: Optional[Dict[str, Dict[str, Any]]] = None) -> List[tuple]:
+    """
+    Prints the summary and ranks the models. With workload summaries the
+    ranking comes from the production prompts (workload_score); the generic
+    suite is then only reported.
+    """
     print("\n" + "="*80)
     print("📊 BENCHMARK SUMMARY")
     print("="*80)
 
     # Header
-    print(f"{'Model':<20} | {'JSON':<5} | {'Logic':<5} | {'Code':<5} | {'Summ':<5} | {'Avg T/s':<8} | {'Avg Lat':<8}")
-    print("-" * 90)
+    print(f"{'Model':<20} | {'JSON':<5} | {'Logic':<5} | {'Code':<5} | {'Summ':<5} | {'Avg T/s':<8} | {'Avg Lat':<8} | {'TTFT':<6}")
+    print("-" * 100)
 
     recommendation_candidates = []
 
     for model, tests in results.items():
-        pass_map = {t['test_id']: t['passed'] for t in tests if t['status'] == 'success'}
+        pass_map = test_pass_map(tests)
 
         json_pass = pass_map.get('json_strict', False)
         logic_pass = pass_map.get('reasoning', False)
@@ -214,11 +479,13 @@ def analyze_results(results: Dict[str, List[Dict]], timestamp: str) -> List[tupl
         if valid_tests:
             avg_tps = sum(t.get('tokens_per_second', 0) for t in valid_tests) / len(valid_tests)
             avg_lat = sum(t['duration'] for t in valid_tests) / len(valid_tests)
+            avg_ttft = sum(t.get('ttft', 0) for t in valid_tests) / len(valid_tests)
         else:
             avg_tps = 0
             avg_lat = 0
+            avg_ttft = 0
 
-        print(f"{model:<20} | {'✅' if json_pass else '❌':<5} | {'✅' if logic_pass else '❌':<5} | {'✅' if code_pass else '❌':<5} | {'✅' if summ_pass else '❌':<5} | {avg_tps:.1f} t/s  | {avg_lat:.2f}s")
+        print(f"{model:<20} | {'✅' if json_pass else '❌':<5} | {'✅' if logic_pass else '❌':<5} | {'✅' if code_pass else '❌':<5} | {'✅' if summ_pass else '❌':<5} | {avg_tps:.1f} t/s  | {avg_lat:.2f}s    | {avg_ttft:.2f}s")
 
         # Scoring Logic
         # JSON is critical (weight 1000)
@@ -227,7 +494,11 @@ def analyze_results(results: Dict[str, List[Dict]], timestamp: str) -> List[tupl
         # Summarization is bonus (weight 100)
         # Speed: + 10 * tokens/sec
 
-        if json_pass:
+        if workloads is not None:
+            score = workload_score(workloads.get(model, {}))
+            if score is not None:
+                recommendation_candidates.append((model, score, avg_tps))
+        elif json_pass:
             score = 1000
             if logic_pass: score += 500
             if code_pass: score += 200
@@ -237,9 +508,25 @@ def analyze_results(results: Dict[str, List[Dict]], timestamp: str) -> List[tupl
 
     print("="*80)
 
+    if workloads:
+        print("\n🧭 PRODUCTION WORKLOAD")
+        print(f"{'Model':<20} | {'Expand JSON':<11} | {'5 kept':<6} | {'Dropped':<7} | {'Expand Lat':<10} | {'History':<7} | {'Quiz':<5} | {'Markdown':<8} | {'Score':<6}")
+        print("-" * 110)
+        for model, summary in workloads.items():
+            expand = summary.get("expand", {})
+            score = workload_score(summary)
+            score_text = f"{score:.0f}" if score is not None else "-"
+            print(f"{model:<20} | {expand.get('json_rate', 0) * 100:>10.0f}% | {expand.get('pass_rate', 0) * 100:>5.0f}% | "
+                  f"{expand.get('drop_rate', 0) * 100:>6.0f}% | {expand.get('avg_duration', 0):>9.2f}s | "
+                  f"{summary.get('history', {}).get('pass_rate', 0) * 100:>6.0f}% | {summary.get('quiz', {}).get('pass_rate', 0) * 100:>4.0f}% | "
+                  f"{summary.get('markdown_pass_rate', 0) * 100:>7.0f}% | {score_text}")
+
     # Recommendation
     print("\n🏆 RECOMMENDATION:")
-    if not recommendation_candidates:
+    if not recommendation_candidates and workloads is not None:
+        print("No model returned parseable expansions for at least 80% of the production prompts.")
+        print("Consider using a more capable model like 'mistral', 'llama3', or 'qwen2.5'.")
+    elif not recommendation_candidates:
         print("No models passed the JSON strictness test. The website relies heavily on JSON.")
         print("Consider using a more capable model like 'mistral', 'llama3', or 'qwen2.5'.")
     else:
@@ -248,7 +535,10 @@ def analyze_results(results: Dict[str, List[Dict]], timestamp: str) -> List[tupl
         best_model = recommendation_candidates[0][0]
         best_tps = recommendation_candidates[0][2]
         print(f"The best model for this website appears to be: **{best_model}**")
-        print(f"It passed strict JSON validation and had the highest composite score (incl. {best_tps:.1f} t/s).")
+        if workloads is not None:
+            print(f"It handled the production expand/lesson prompts best (incl. {best_tps:.1f} t/s).")
+        else:
+            print(f"It passed strict JSON validation and had the highest composite score (incl. {best_tps:.1f} t/s).")
 
         # Save recommendation
         with open(os.path.join(OUTPUT_BASE_DIR, f"run_{timestamp}", "recommendation.txt"), "w") as f:
@@ -256,7 +546,38 @@ def analyze_results(results: Dict[str, List[Dict]], timestamp: str) -> List[tupl
 
     return recommendation_candidates
 
-def generate_report(results: Dict[str, List[Dict]], candidates: List[tuple], run_dir: str):
+def warm_stats(tests: List[Dict]) -> Dict[str, float]:
+    """Averages over the successful warm runs of one model."""
+    valid = [t for t in tests if t['status'] == 'success']
+    if not valid:
+        return {"ttft": 0, "load_duration": 0, "prompt_tokens_per_second": 0, "tokens_per_second": 0}
+    return {
+        key: sum(t.get(key, 0) for t in valid) / len(valid)
+        for key in ("ttft", "load_duration", "prompt_tokens_per_second", "tokens_per_second")
+    }
+
+def print_latency_breakdown(results: Dict[str, List[Dict]], cold_start: Dict[str, Dict], sweeps: Dict[str, List[Dict]]):
+    print("\n⏱️ LATENCY BREAKDOWN (cold = first request after unloading the model)")
+    print(f"{'Model':<20} | {'Cold load':<9} | {'Cold TTFT':<9} | {'Warm TTFT':<9} | {'Prompt t/s':<10} | {'Gen t/s':<8}")
+    print("-" * 80)
+    for model, tests in results.items():
+        cold = cold_start.get(model, {})
+        warm = warm_stats(tests)
+        cold_load = f"{cold['load_duration']:.2f}s" if cold.get('status') == 'success' else "-"
+        cold_ttft = f"{cold['ttft']:.2f}s" if cold.get('status') == 'success' else "-"
+        print(f"{model:<20} | {cold_load:<9} | {cold_ttft:<9} | {warm['ttft']:.2f}s{'':<4} | "
+              f"{warm['prompt_tokens_per_second']:<10.1f} | {warm['tokens_per_second']:.1f}")
+
+    if sweeps:
+        print("\n📈 CONCURRENCY SWEEP (aggregate generated tokens/s)")
+        for model, sweep in sweeps.items():
+            levels = ", ".join(f"{l['concurrency']}x: {l['aggregate_tokens_per_second']:.1f}" for l in sweep)
+            saturated = saturation_point(sweep)
+            print(f"{model:<20} | {levels}" + (f" | saturates at {saturated}" if saturated else ""))
+
+def generate_report(results: Dict[str, List[Dict]], candidates: List[tuple], run_dir: str,
+                    cold_start: Optional[Dict[str, Dict]] = None, sweeps: Optional[Dict[str, List[Dict]]] = None,
+                    workloads: Optional[Dict[str, Dict[str, Any]]] = None):
     report_path = os.path.join(run_dir, "REPORT.md")
 
     with open(report_path, "w") as f:
@@ -274,7 +595,7 @@ def generate_report(results: Dict[str, List[Dict]], candidates: List[tuple], run
         f.write("|---|---|---|---|---|---|---|\n")
 
         for model, tests in results.items():
-            pass_map = {t['test_id']: t['passed'] for t in tests if t['status'] == 'success'}
+            pass_map = test_pass_map(tests)
             valid_tests = [t for t in tests if t['status'] == 'success']
 
             if valid_tests:
@@ -291,6 +612,59 @@ def generate_report(results: Dict[str, List[Dict]], candidates: List[tuple], run
 
             f.write(f"| {model} | {json_icon} | {logic_icon} | {code_icon} | {summ_icon} | {avg_tps:.2f} | {avg_lat:.2f}s |\n")
 
+        if workloads:
+            f.write("\n## Production Workload\n\n")
+            f.write("The prompts server.py sends for /expand and every /analyze mode, over topics at several depths. "
+                    "The recommendation is ranked on these.\n\n")
+            f.write("| Model | Expand JSON | 5 Children Kept | Duplicate/Forbidden | Expand Latency | History | Quiz | Markdown | Lesson TTFT | Score |\n")
+            f.write("|---|---|---|---|---|---|---|---|---|---|\n")
+            for model, summary in workloads.items():
+                expand = summary.get("expand", {})
+                lessons = [v for k, v in summary.items() if isinstance(v, dict) and k != "expand"]
+                lesson_ttft = sum(v["avg_ttft"] for v in lessons) / len(lessons) if lessons else 0
+                score = workload_score(summary)
+                f.write(f"| {model} | {expand.get('json_rate', 0) * 100:.0f}% | {expand.get('pass_rate', 0) * 100:.0f}% | "
+                        f"{expand.get('drop_rate', 0) * 100:.0f}% | {expand.get('avg_duration', 0):.2f}s | "
+                        f"{summary.get('history', {}).get('pass_rate', 0) * 100:.0f}% | "
+                        f"{summary.get('quiz', {}).get('pass_rate', 0) * 100:.0f}% | "
+                        f"{summary.get('markdown_pass_rate', 0) * 100:.0f}% | {lesson_ttft:.2f}s | "
+                        f"{f'{score:.0f}' if score is not None else '-'} |\n")
+
+            f.write("\n### Per Mode\n\n")
+            f.write("| Model | Mode | Requests | Pass | Avg Latency | Avg TTFT |\n")
+            f.write("|---|---|---|---|---|---|\n")
+            for model, summary in workloads.items():
+                for kind, v in summary.items():
+                    if isinstance(v, dict):
+                        f.write(f"| {model} | {kind} | {v['requests']} | {v['pass_rate'] * 100:.0f}% | "
+                                f"{v['avg_duration']:.2f}s | {v['avg_ttft']:.2f}s |\n")
+
+        f.write("\n## Latency Breakdown\n\n")
+        f.write("Cold runs are the first request after unloading the model, so their load time is not mixed into the tests below.\n\n")
+        f.write("| Model | Cold Load | Cold TTFT | Warm TTFT | Warm Load | Prompt Tokens/s | Gen Tokens/s |\n")
+        f.write("|---|---|---|---|---|---|---|\n")
+        for model, tests in results.items():
+            cold = (cold_start or {}).get(model, {})
+            warm = warm_stats(tests)
+            cold_ok = cold.get('status') == 'success'
+            cold_load = f"{cold['load_duration']:.2f}s" if cold_ok else "-"
+            cold_ttft = f"{cold['ttft']:.2f}s" if cold_ok else "-"
+            f.write(f"| {model} | {cold_load} | {cold_ttft} | {warm['ttft']:.2f}s | {warm['load_duration']:.2f}s | "
+                    f"{warm['prompt_tokens_per_second']:.1f} | {warm['tokens_per_second']:.1f} |\n")
+
+        if sweeps:
+            f.write("\n## Concurrency Sweep\n\n")
+            f.write("The summarization prompt sent N times at once. Aggregate throughput stops growing once Ollama's parallel slots are full.\n\n")
+            f.write("| Model | Parallel | Aggregate Tokens/s | Per-Request Tokens/s | Avg TTFT | Max TTFT | Errors |\n")
+            f.write("|---|---|---|---|---|---|---|\n")
+            for model, sweep in sweeps.items():
+                for l in sweep:
+                    f.write(f"| {model} | {l['concurrency']} | {l['aggregate_tokens_per_second']:.1f} | "
+                            f"{l['avg_tokens_per_second']:.1f} | {l['avg_ttft']:.2f}s | {l['max_ttft']:.2f}s | {l['errors']} |\n")
+                saturated = saturation_point(sweep)
+                if saturated:
+                    f.write(f"\n**{model}** saturates at {saturated} parallel requests.\n\n")
+
         f.write("\n## Detailed Results\n")
 
         for model, tests in results.items():
@@ -301,41 +675,90 @@ def generate_report(results: Dict[str, List[Dict]], candidates: List[tuple], run
                 if not t['passed'] and t.get('error'):
                      f.write(f"  - Error: {t['error']}\n")
                 f.write(f"  - Duration: {t['duration']:.2f}s\n")
+                if t.get('ttft'):
+                    f.write(f"  - Time to first token: {t['ttft']:.2f}s\n")
                 if t.get('tokens_per_second'):
                     f.write(f"  - Speed: {t['tokens_per_second']:.2f} t/s\n")
+                if t.get('prompt_tokens_per_second'):
+                    f.write(f"  - Prompt: {t['prompt_eval_count']} tokens in {t['prompt_eval_duration']:.2f}s "
+                            f"({t['prompt_tokens_per_second']:.1f} t/s)\n")
 
     print(f"\n📄 Detailed report generated at: {report_path}")
 
-def main():
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the installed Ollama models for OmniWeb")
+    parser.add_argument("--models", nargs="+", help="Only these models (default: all installed)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY_LEVELS,
+                        help="Parallel request levels for the sweep")
+    parser.add_argument("--no-sweep", action="store_true", help="Skip the concurrency sweep")
+    parser.add_argument("--no-cold", action="store_true", help="Do not unload models to measure cold starts")
+    parser.add_argument("--no-workload", action="store_true",
+                        help="Skip the production workload and rank on the generic suite")
+    parser.add_argument("--workload-topics", type=int, default=len(WORKLOAD_TOPICS),
+                        help="Use only the first N workload topics")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs of every test and workload prompt (3+ gives confidence intervals)")
+    parser.add_argument("--compare", nargs="?", const="baseline", metavar="RUN",
+                        help="Compare this run with RUN (default: the stored baseline); exit 1 on regressions")
+    args = parser.parse_args(argv or [])
+
     print("🚀 STARTING OLLAMA MODEL BENCHMARK")
     print(f"Checking {OLLAMA_BASE}...\n")
+    options_profile.load()
 
     models = get_models()
+    if args.models:
+        models = [m for m in models if m in args.models]
     if not models:
-        return
+        return 0
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     run_dir = os.path.join(OUTPUT_BASE_DIR, f"run_{timestamp}")
     ensure_dir(run_dir)
 
     all_results = {}
+    cold_start = {}
+    sweeps = {}
+    workload_results = {}
+    workloads = None if args.no_workload else {}
+    workload_items = build_workload(WORKLOAD_TOPICS[:args.workload_topics], WORKLOAD_LESSON_MODES)
 
     for model in models:
         print(f"\n🧪 Testing Model: {model}")
+        if not args.no_cold:
+            cold_start[model] = run_cold_start(model)
         model_results = []
-        for test in TEST_SUITE:
-            result = run_test(model, test)
-            model_results.append(result)
+        for repeat in range(args.repeat):
+            for test in TEST_SUITE:
+                result = run_test(model, test)
+                model_results.append(dict(result, repeat=repeat))
         all_results[model] = model_results
+        if workloads is not None:
+            workload_results[model] = [
+                dict(r, repeat=repeat) for repeat in range(args.repeat) for r in run_workload(model, workload_items)
+            ]
+            workloads[model] = summarize_workload(workload_results[model])
+        if not args.no_sweep:
+            sweeps[model] = run_concurrency_sweep(model, args.concurrency)
 
     # Save raw data
+    results = {"tests": all_results, "cold_start": cold_start, "concurrency": sweeps,
+               "workload": workload_results, "workload_summary": workloads, "repeat": args.repeat}
     with open(os.path.join(run_dir, "results.json"), "w") as f:
-        json.dump(all_results, f, indent=2)
+        json.dump(results, f, indent=2)
+    append_index(run_dir, results, OUTPUT_BASE_DIR, ollama_version=get_ollama_version())
 
     print(f"\n💾 Results saved to {run_dir}/results.json")
 
-    candidates = analyze_results(all_results, timestamp)
-    generate_report(all_results, candidates, run_dir)
+    candidates = analyze_results(all_results, timestamp, workloads)
+    print_latency_breakdown(all_results, cold_start, sweeps)
+    generate_report(all_results, candidates, run_dir, cold_start, sweeps, workloads)
+
+    if args.compare:
+        print()
+        return compare_main([args.compare, run_dir], OUTPUT_BASE_DIR, min_change=0.05,
+                            output=os.path.join(run_dir, "COMPARE.md"))
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main(sys.argv[1:]))
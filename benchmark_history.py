@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Run history for benchmark.py: an append-only index of runs, comparisons
+between runs with confidence intervals, and trend reports.
+
+  compare   deltas in latency, TTFT and tokens/s per model and test between
+            a baseline run and one or more later runs; exits 1 when any
+            regression is statistically significant, so it can gate
+            Ollama/model upgrades
+  baseline  pins a run as the stored baseline
+  trend     one metric over every indexed run
+
+Runs are given as a run directory, its results.json, a run id
+(run_20250101_120000), "latest" or "baseline". As the base of a
+comparison, "latest" skips the runs being compared. Test intervals need
+repeats (run benchmark.py with --repeat 3 or more); workload prompts are
+paired per topic, so two or more topics are enough.
+
+Usage:
+  python benchmark_history.py baseline latest
+  python benchmark_history.py compare latest                 # against the baseline
+  python benchmark_history.py compare run_A run_B run_C      # B and C against A
+  python benchmark_history.py trend --metric tokens_per_second
+"""
+import os
+import sys
+import json
+import math
+import argparse
+import datetime
+import subprocess
+
+OUTPUT_BASE_DIR = "benchmark_results"
+INDEX_FILE = "index.jsonl"
+BASELINE_FILE = "baseline.json"
+
+# Metric -> True when higher is better
+METRICS = {
+    "duration": False,
+    "ttft": False,
+    "tokens_per_second": True,
+}
+
+# Two-sided 95% Student t critical values for 1-30 degrees of freedom
+T_95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def t_critical(df):
+    if df < 1:
+        return float("inf")
+    return T_95[int(df) - 1] if df <= len(T_95) else 1.96
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+def stdev(values):
+    if len(values) < 2:
+        return 0.0
+    m = mean(values)
+    return math.sqrt(sum((v - m) ** 2 for v in values) / (len(values) - 1))
+
+
+def run_samples(results):
+    """
+    {model: {key: {metric: [values]}}} from a results.json. Keys are
+    "test:<id>" for the generic suite and "workload:<mode>" for the
+    production workload; failed requests contribute no samples.
+    """
+    # Runs from before the cold-start/workload split stored {model: [tests]}
+    tests = results["tests"] if "tests" in results else results
+    rows = {model: [("test:" + t["test_id"], t) for t in entries] for model, entries in tests.items()}
+    for model, entries in (results.get("workload") or {}).items():
+        rows.setdefault(model, []).extend(("workload:" + r["kind"], r) for r in entries)
+
+    samples = {}
+    for model, entries in rows.items():
+        for key, row in entries:
+            if row.get("status") != "success":
+                continue
+            metrics = samples.setdefault(model, {}).setdefault(key, {})
+            for metric in METRICS:
+                if row.get(metric):
+                    metrics.setdefault(metric, []).append(row[metric])
+    return samples
+
+
+def workload_items(results):
+    """
+    {model: {"workload:<mode>": {node: {metric: [values]}}}}: the workload
+    samples of each topic, for paired comparisons. Rows from runs that did
+    not record the node are left out.
+    """
+    items = {}
+    for model, entries in (results.get("workload") or {}).items():
+        for row in entries:
+            if row.get("status") != "success" or not row.get("node"):
+                continue
+            metrics = items.setdefault(model, {}).setdefault("workload:" + row["kind"], {}).setdefault(row["node"], {})
+            for metric in METRICS:
+                if row.get(metric):
+                    metrics.setdefault(metric, []).append(row[metric])
+    return items
+
+
+def _judge(result, low, high, metric, min_change):
+    """
+    A change is significant when the interval excludes zero and the
+    relative change is at least `min_change`; a regression when it is also
+    on the bad side.
+    """
+    result["ci"] = [low, high]
+    result["significant"] = (low > 0 or high < 0) and abs(result["rel"]) >= min_change
+    worse = result["delta"] < 0 if METRICS[metric] else result["delta"] > 0
+    result["regression"] = result["significant"] and worse
+    return result
+
+
+def compare_samples(base, new, metric, min_change=0.05):
+    """Difference of means (new - base) with a Welch 95% confidence interval."""
+    delta = mean(new) - mean(base)
+    base_mean = mean(base)
+    rel = delta / base_mean if base_mean else 0.0
+    result = {
+        "base_mean": base_mean, "new_mean": mean(new), "delta": delta, "rel": rel,
+        "n_base": len(base), "n_new": len(new), "ci": None, "significant": False, "regression": False,
+    }
+    if len(base) < 2 or len(new) < 2:
+        return result
+
+    va, vb = stdev(base) ** 2 / len(base), stdev(new) ** 2 / len(new)
+    se = math.sqrt(va + vb)
+    if se == 0:
+        return _judge(result, delta, delta, metric, min_change)
+    df = (va + vb) ** 2 / (va ** 2 / (len(base) - 1) + vb ** 2 / (len(new) - 1))
+    margin = t_critical(df) * se
+    return _judge(result, delta - margin, delta + margin, metric, min_change)
+
+
+def compare_paired(base, new, metric, min_change=0.05):
+    """
+    Mean per-item difference (new - base) over the items both runs measured,
+    with a paired 95% confidence interval. Every topic is compared with
+    itself, so how much topics differ from each other does not widen the
+    interval. None when no item has the metric in both runs.
+    """
+    pairs = [
+        (mean(base[item][metric]), mean(new[item][metric]))
+        for item in sorted(set(base) & set(new)) if base[item].get(metric) and new[item].get(metric)
+    ]
+    if not pairs:
+        return None
+    deltas = [n - b for b, n in pairs]
+    base_mean = mean([b for b, _ in pairs])
+    delta = mean(deltas)
+    result = {
+        "base_mean": base_mean, "new_mean": mean([n for _, n in pairs]), "delta": delta,
+        "rel": delta / base_mean if base_mean else 0.0, "n_base": len(pairs), "n_new": len(pairs),
+        "ci": None, "significant": False, "regression": False, "paired": True,
+    }
+    if len(pairs) < 2:
+        return result
+    margin = t_critical(len(pairs) - 1) * stdev(deltas) / math.sqrt(len(pairs))
+    return _judge(result, delta - margin, delta + margin, metric, min_change)
+
+
+def compare_runs(base_results, new_results, min_change=0.05):
+    """
+    Rows for every (model, key, metric) both runs measured. Workload keys
+    are paired per topic when both runs recorded it.
+    """
+    base, new = run_samples(base_results), run_samples(new_results)
+    base_items, new_items = workload_items(base_results), workload_items(new_results)
+    rows = []
+    for model in sorted(set(base) & set(new)):
+        for key in sorted(set(base[model]) & set(new[model])):
+            for metric in METRICS:
+                a, b = base[model][key].get(metric), new[model][key].get(metric)
+                if not (a and b):
+                    continue
+                row = None
+                items_a, items_b = base_items.get(model, {}).get(key), new_items.get(model, {}).get(key)
+                if items_a and items_b:
+                    row = compare_paired(items_a, items_b, metric, min_change)
+                if row is None:
+                    row = compare_samples(a, b, metric, min_change)
+                rows.append(dict(row, model=model, key=key, metric=metric))
+    return rows
+
+
+def _index_path(base_dir):
+    return os.path.join(base_dir, INDEX_FILE)
+
+
+def read_index(base_dir=OUTPUT_BASE_DIR):
+    path = _index_path(base_dir)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def append_index(run_dir, results, base_dir=OUTPUT_BASE_DIR, ollama_version=None):
+    """Appends one line summarizing the run; existing lines are never rewritten."""
+    summary = {
+        model: {
+            key: dict({metric: mean(values) for metric, values in metrics.items()},
+                      n=max(len(v) for v in metrics.values()))
+            for key, metrics in keys.items() if metrics
+        }
+        for model, keys in run_samples(results).items()
+    }
+    entry = {
+        "run": os.path.basename(os.path.normpath(run_dir)),
+        "path": run_dir,
+        "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "ollama_version": ollama_version,
+        "git_commit": _git_commit(),
+        "models": summary,
+    }
+    os.makedirs(base_dir, exist_ok=True)
+    with open(_index_path(base_dir), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def resolve_run(ref, base_dir=OUTPUT_BASE_DIR, exclude=()):
+    """Path of the results.json a run reference points at; "latest" skips the run ids in `exclude`."""
+    if ref == "baseline":
+        path = os.path.join(base_dir, BASELINE_FILE)
+        if not os.path.exists(path):
+            raise SystemExit("No baseline set. Use: python benchmark_history.py baseline <run>")
+        with open(path) as f:
+            ref = json.load(f)["run"]
+    elif ref == "latest":
+        runs = [e["run"] for e in read_index(base_dir) if e["run"] not in exclude]
+        if not runs:
+            raise SystemExit(f"No other runs indexed in {_index_path(base_dir)}")
+        ref = runs[-1]
+
+    for candidate in (ref, os.path.join(ref, "results.json"), os.path.join(base_dir, ref, "results.json")):
+        if os.path.isfile(candidate):
+            return candidate
+    raise SystemExit(f"Cannot find results for run '{ref}'")
+
+
+def load_run(ref, base_dir=OUTPUT_BASE_DIR, exclude=()):
+    path = resolve_run(ref, base_dir, exclude)
+    with open(path) as f:
+        return os.path.basename(os.path.dirname(os.path.abspath(path))), json.load(f)
+
+
+def set_baseline(ref, base_dir=OUTPUT_BASE_DIR):
+    run_id, _ = load_run(ref, base_dir)
+    with open(os.path.join(base_dir, BASELINE_FILE), "w") as f:
+        json.dump({"run": run_id, "set_at": datetime.datetime.now().isoformat(timespec="seconds")}, f)
+    return run_id
+
+
+def _fmt_ci(row):
+    if row["ci"] is None:
+        return "n<2"
+    low, high = row["ci"]
+    return f"[{low:+.3f}, {high:+.3f}]"
+
+
+def _fmt_n(row):
+    if row.get("paired"):
+        return f"{row['n_base']} topics"
+    return f"{row['n_base']}/{row['n_new']}"
+
+
+def comparison_markdown(base_id, new_id, rows):
+    lines = [
+        f"## {new_id} vs {base_id}\n",
+        "| Model | Test | Metric | Base | New | Delta | 95% CI | n | |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in rows:
+        flag = "🔴 regression" if r["regression"] else ("🟢 improvement" if r["significant"] else "")
+        lines.append(
+            f"| {r['model']} | {r['key']} | {r['metric']} | {r['base_mean']:.3f} | {r['new_mean']:.3f} | "
+            f"{r['rel'] * 100:+.1f}% | {_fmt_ci(r)} | {_fmt_n(r)} | {flag} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def compare_main(refs, base_dir, min_change, output=None):
+    if len(refs) == 1:
+        refs = ["baseline"] + refs
+    runs = [load_run(ref, base_dir) for ref in refs[1:]]
+    # A run just appended to the index would otherwise be its own "latest" base
+    base_id, base = load_run(refs[0], base_dir, exclude={run_id for run_id, _ in runs})
+    regressions = []
+    report = ["# 📉 Benchmark Comparison\n"]
+    for new_id, new in runs:
+        rows = compare_runs(base, new, min_change)
+        report.append(comparison_markdown(base_id, new_id, rows))
+        regressions += [(new_id, r) for r in rows if r["regression"]]
+        if rows and all(r["ci"] is None for r in rows):
+            report.append("_Single samples only: re-run benchmark.py with --repeat 3 for confidence intervals._\n")
+
+    text = "\n".join(report)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+        print(f"📄 Comparison written to {output}")
+
+    if regressions:
+        print(f"❌ {len(regressions)} significant regression(s):")
+        for run_id, r in regressions:
+            print(f"   {run_id} {r['model']} {r['key']} {r['metric']}: {r['rel'] * 100:+.1f}%")
+        return 1
+    print("✅ No significant regressions")
+    return 0
+
+
+def trend_main(base_dir, metric, model=None, key=None):
+    index = read_index(base_dir)
+    if not index:
+        print(f"No runs indexed in {_index_path(base_dir)}")
+        return 0
+    series = sorted({(m, k) for e in index for m, keys in e["models"].items() for k in keys
+                     if (model is None or m == model) and (key is None or k == key)})
+    print(f"# 📈 Trend: {metric}\n")
+    print("| Run | Ollama | Commit | " + " | ".join(f"{m} {k}" for m, k in series) + " |")
+    print("|---|---|---|" + "---|" * len(series))
+    for e in index:
+        cells = []
+        for m, k in series:
+            value = e["models"].get(m, {}).get(k, {}).get(metric)
+            cells.append(f"{value:.3f}" if value is not None else "-")
+        print(f"| {e['run']} | {e.get('ollama_version') or '-'} | {e.get('git_commit') or '-'} | " + " | ".join(cells) + " |")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare benchmark.py runs and track them over time")
+    parser.add_argument("--dir", default=OUTPUT_BASE_DIR, help="Benchmark results directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    compare = sub.add_parser("compare", help="Compare runs; the first is the baseline")
+    compare.add_argument("runs", nargs="+", help="Runs to compare (one run: compared against the stored baseline)")
+    compare.add_argument("--min-change", type=float, default=0.05,
+                         help="Smallest relative change that counts as a regression")
+    compare.add_argument("--output", help="Also write the Markdown comparison here")
+
+    baseline = sub.add_parser("baseline", help="Store a run as the baseline")
+    baseline.add_argument("run")
+
+    trend = sub.add_parser("trend", help="One metric across every indexed run")
+    trend.add_argument("--metric", choices=list(METRICS), default="tokens_per_second")
+    trend.add_argument("--model")
+    trend.add_argument("--test", help="Key such as test:sanity or workload:expand")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare_main(args.runs, args.dir, args.min_change, args.output)
+    if args.command == "baseline":
+        print(f"📌 Baseline set to {set_baseline(args.run, args.dir)}")
+        return 0
+    return trend_main(args.dir, args.metric, args.model, args.test)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
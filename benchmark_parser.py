@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Compares JSON extraction on multi-megabyte LLM-style responses:
+  legacy     - the original character-by-character robust_json_parser
+  robust     - the current robust_json_parser (C decoder, regex scan fallback)
+  streaming  - StreamingJSONParser fed token-sized chunks, as during a stream;
+               its time includes decoding every item and the full document,
+               spread over the generation instead of paid after it
+
+Usage: python benchmark_parser.py [--sizes 1 4 16] [--chunk 16] [--repeat 3]
+"""
+import argparse
+import json
+import time
+
+from json_stream import StreamingJSONParser
+from utils import robust_json_parser
+
+
+def legacy_robust_json_parser(text):
+    # Verbatim copy of the pre-streaming implementation, kept as the baseline
+    start_obj = text.find('{')
+    start_arr = text.find('[')
+
+    if start_obj == -1 and start_arr == -1:
+        return text
+
+    start = -1
+    if start_obj != -1 and start_arr != -1:
+        start = min(start_obj, start_arr)
+    elif start_obj != -1:
+        start = start_obj
+    elif start_arr != -1:
+        start = start_arr
+
+    stack = []
+    in_string = False
+    escape = False
+
+    for i in range(start, len(text)):
+        char = text[i]
+
+        if escape:
+            escape = False
+            continue
+
+        if char == '\\':
+            escape = True
+            continue
+
+        if char == '"':
+            in_string = not in_string
+            continue
+
+        if not in_string:
+            if char == '{':
+                stack.append('{')
+            elif char == '[':
+                stack.append('[')
+            elif char == '}':
+                if stack and stack[-1] == '{':
+                    stack.pop()
+                    if not stack:
+                        return text[start:i+1]
+            elif char == ']':
+                if stack and stack[-1] == '[':
+                    stack.pop()
+                    if not stack:
+                        return text[start:i+1]
+
+    if start != -1:
+        try:
+            _, end = json.JSONDecoder().raw_decode(text, idx=start)
+            return text[start:end]
+        except json.JSONDecodeError:
+            pass
+
+    if start != -1:
+        end_obj = text.rfind('}') + 1
+        end_arr = text.rfind(']') + 1
+        end = max(end_obj, end_arr)
+
+        if end > start:
+            return text[start:end]
+
+    return text
+
+
+def make_response(size_mb, valid=True):
+    """
+    Chatty preamble, a fenced {"children": [...]} document, then a sign-off.
+    With valid=False the array gets a trailing comma, a common LLM slip that
+    forces the lenient scanning path.
+    """
+    child = {
+        "name": "Quantum Entanglement",
+        "desc": "Correlated states {not [classical]} with \"spooky\" action at a distance.",
+        "status": "concept",
+    }
+    encoded = json.dumps(child)
+    count = max(1, int(size_mb * 1024 * 1024 / (len(encoded) + 2)))
+    body = json.dumps({"children": [child] * count})
+    if not valid:
+        body = body[:-2] + ",]}"
+    return "Sure! Here are the sub-topics you asked for:\n```json\n" + body + "\n```\nHope that helps."
+
+
+def time_call(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_streaming(text, chunk):
+    parser = StreamingJSONParser()
+    items = 0
+    for i in range(0, len(text), chunk):
+        for event in parser.feed(text[i:i + chunk]):
+            if event[0] == "item":
+                items += 1
+    return items, parser.document
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON extraction from LLM responses")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="Input sizes in MB")
+    parser.add_argument("--chunk", type=int, default=16, help="Characters per streamed chunk")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    print("🚀 JSON PARSER BENCHMARK")
+    print(f"{'Input':>8} | {'Size':>8} | {'legacy':>10} | {'robust':>10} | {'streaming':>10} | {'speedup':>8}")
+    print("-" * 72)
+
+    for size, valid in [(size, valid) for size in args.sizes for valid in (True, False)]:
+        text = make_response(size, valid=valid)
+        mb = len(text) / (1024 * 1024)
+        label = "valid" if valid else "lenient"
+
+        legacy_time, legacy_out = time_call(lambda: legacy_robust_json_parser(text), args.repeat)
+        robust_time, robust_out = time_call(lambda: robust_json_parser(text), args.repeat)
+        stream_time, (items, document) = time_call(lambda: run_streaming(text, args.chunk), args.repeat)
+
+        assert legacy_out == robust_out, "robust_json_parser output differs from the legacy parser"
+        if document is not None:
+            assert items == len(document["children"]), "streaming parser missed items"
+
+        print(f"{label:>8} | {mb:>6.1f}MB | {legacy_time:>9.3f}s | {robust_time:>9.3f}s | {stream_time:>9.3f}s | "
+              f"{legacy_time / robust_time:>7.1f}x")
+
+    print(f"\nStreaming runs feed {args.chunk}-character chunks and decode every item as it closes.")
+
+
+if __name__ == "__main__":
+    main()
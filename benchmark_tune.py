@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Searches Ollama inference options per model and writes the tuned-options
+profile the server loads at startup (OLLAMA_OPTIONS_PROFILE).
+
+For each model and purpose ("expand": the /expand prompt, "lesson": the
+/analyze prompts) every candidate combination of num_ctx, num_batch,
+num_thread and num_predict runs a few production prompts from benchmark.py.
+A combination only qualifies if its responses pass the same checks the
+workload suite applies (valid JSON, 5 usable children, full quizzes...) at
+least as often as the server's current options do. Among those, expand
+picks the lowest latency, since learners wait on every click, and lessons
+the highest tokens/s.
+
+Changing num_ctx or num_batch makes Ollama reload the model, so each
+combination gets one unmeasured warm-up request first.
+
+Usage:
+  python benchmark_tune.py                              # random search, 12 combinations per purpose
+  python benchmark_tune.py --grid --models llama3:latest
+  python benchmark_tune.py --num-ctx 2048 4096 --num-batch 512 1024 --grid
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import datetime
+import itertools
+from typing import Any, Dict, List, Optional
+
+import benchmark
+from benchmark import build_workload, workload_payload, score_workload_item, stream_generate, get_models, ensure_dir
+from config import OLLAMA_OPTIONS_PROFILE
+from options_profile import TUNABLE_OPTIONS, OptionsProfile
+
+CPU_COUNT = os.cpu_count() or 4
+
+# None leaves the option to Ollama (or, for num_ctx, to the server's default)
+SEARCH_SPACE = {
+    "expand": {
+        "num_ctx": [2048, 4096, 8192],
+        "num_batch": [256, 512, 1024],
+        "num_thread": [None, max(1, CPU_COUNT // 2), CPU_COUNT],
+        "num_predict": [None, 384, 512],
+    },
+    "lesson": {
+        "num_ctx": [None, 4096, 8192],
+        "num_batch": [256, 512, 1024],
+        "num_thread": [None, max(1, CPU_COUNT // 2), CPU_COUNT],
+        # Markdown lessons have no completeness check, so never cap them
+        "num_predict": [None],
+    },
+}
+
+# What the server sends today, measured first as the quality bar
+BASELINE = {"expand": {"num_ctx": 4096}, "lesson": {}}
+
+# Candidates are measured from the untuned defaults, not over an earlier profile
+UNTUNED = OptionsProfile(None)
+
+OBJECTIVES = {
+    # (metric, higher is better)
+    "expand": ("duration", False),
+    "lesson": ("tokens_per_second", True),
+}
+
+
+def tuning_items(purpose: str, topics: int) -> List[Dict[str, Any]]:
+    corpus = benchmark.WORKLOAD_TOPICS[:topics]
+    if purpose == "expand":
+        return build_workload(corpus, [])
+    return [i for i in build_workload(corpus[:1], ["explain", "history", "quiz"]) if i["kind"] != "expand"]
+
+
+def candidates(space: Dict[str, List], grid: bool, samples: int, seed: int) -> List[Dict[str, Any]]:
+    keys = list(space)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    if not grid and samples < len(combos):
+        combos = random.Random(seed).sample(combos, samples)
+    return [{k: v for k, v in c.items() if v is not None} for c in combos]
+
+
+def measure(model: str, items: List[Dict[str, Any]], options: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    """Runs the items with these options; returns mean metrics and the quality pass rate."""
+    try:
+        # Unmeasured: options that change the context or batch size reload the model
+        stream_generate(workload_payload(model, items[0], options, UNTUNED))
+    except Exception as e:
+        return {"options": options, "error": str(e), "pass_rate": 0.0}
+
+    rows = []
+    for _ in range(repeat):
+        for item in items:
+            try:
+                stats = stream_generate(workload_payload(model, item, options, UNTUNED))
+            except Exception as e:
+                rows.append({"passed": False, "error": str(e)})
+                continue
+            text = stats.pop("response")
+            rows.append(dict(stats, **score_workload_item(item, text)))
+
+    ok = [r for r in rows if "error" not in r]
+    result = {
+        "options": options,
+        "requests": len(rows),
+        "errors": len(rows) - len(ok),
+        "pass_rate": sum(1 for r in rows if r["passed"]) / len(rows) if rows else 0.0,
+    }
+    for metric in ("duration", "ttft", "tokens_per_second", "prompt_tokens_per_second", "load_duration"):
+        result[metric] = sum(r[metric] for r in ok) / len(ok) if ok else None
+    return result
+
+
+def pick_best(purpose: str, baseline: Dict[str, Any], trials: List[Dict[str, Any]],
+              tolerance: float) -> Dict[str, Any]:
+    """Best trial that is at least as reliable as the baseline; the baseline if none is."""
+    metric, higher_is_better = OBJECTIVES[purpose]
+    bar = baseline["pass_rate"] - tolerance
+    qualified = [t for t in [baseline] + trials if t.get(metric) is not None and t["pass_rate"] >= bar]
+    if not qualified:
+        return baseline
+    return sorted(qualified, key=lambda t: (t[metric] if higher_is_better else -t[metric], -(t["ttft"] or 0)))[-1]
+
+
+def tune_model(model: str, purposes: List[str], args) -> Dict[str, Any]:
+    results = {}
+    for purpose in purposes:
+        items = tuning_items(purpose, args.topics)
+        space = dict(SEARCH_SPACE[purpose])
+        for option in TUNABLE_OPTIONS:
+            override = getattr(args, option)
+            if override:
+                space[option] = [None if v <= 0 else v for v in override]
+        combos = [c for c in candidates(space, args.grid, args.samples, args.seed) if c != BASELINE[purpose]]
+
+        print(f"\n🎛️ {model} / {purpose}: baseline + {len(combos)} combinations x {len(items) * args.repeat} prompts")
+        baseline = measure(model, items, BASELINE[purpose], args.repeat)
+        print(f"    baseline {describe(baseline)}")
+        trials = []
+        for options in combos:
+            trial = measure(model, items, options, args.repeat)
+            print(f"    {json.dumps(options)} {describe(trial)}")
+            trials.append(trial)
+
+        best = pick_best(purpose, baseline, trials, args.tolerance)
+        print(f"    ✅ best: {json.dumps(best['options'])}")
+        results[purpose] = {"best": best, "baseline": baseline, "trials": trials}
+    return results
+
+
+def describe(trial: Dict[str, Any]) -> str:
+    if trial.get("error"):
+        return f"error: {trial['error']}"
+    return (f"pass {trial['pass_rate'] * 100:.0f}%, {trial['duration']:.2f}s, TTFT {trial['ttft']:.2f}s, "
+            f"{trial['tokens_per_second']:.1f} t/s")
+
+
+def write_profile(path: str, tuned: Dict[str, Dict[str, Any]]):
+    """Merges this run's winners into the profile, keeping other models' entries."""
+    profile = {"models": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            profile = json.load(f)
+    for model, purposes in tuned.items():
+        entry = profile["models"].setdefault(model, {})
+        for purpose, result in purposes.items():
+            entry[purpose] = result["best"]["options"]
+    profile["generated_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    profile["ollama_base"] = benchmark.OLLAMA_BASE
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+
+def write_report(tuned: Dict[str, Dict[str, Any]], run_dir: str) -> str:
+    report_path = os.path.join(run_dir, "REPORT.md")
+    with open(report_path, "w") as f:
+        f.write("# 🎛️ Ollama Options Tuning Report\n\n")
+        f.write(f"**Date:** {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        for model, purposes in tuned.items():
+            for purpose, result in purposes.items():
+                metric, _ = OBJECTIVES[purpose]
+                f.write(f"## {model} / {purpose}\n\n")
+                f.write(f"Ranked on {metric}; qualifying trials pass the quality checks at least as often as "
+                        f"the baseline ({result['baseline']['pass_rate'] * 100:.0f}%).\n\n")
+                f.write("| Options | Pass | Latency | TTFT | Tokens/s | Prompt Tokens/s | |\n")
+                f.write("|---|---|---|---|---|---|---|\n")
+                for trial in [result["baseline"]] + result["trials"]:
+                    label = "baseline" if trial is result["baseline"] else ""
+                    if trial is result["best"]:
+                        label = (label + " 🏆").strip()
+                    if trial.get("error"):
+                        f.write(f"| `{json.dumps(trial['options'])}` | error | | | | | {label} |\n")
+                        continue
+                    f.write(f"| `{json.dumps(trial['options'])}` | {trial['pass_rate'] * 100:.0f}% | "
+                            f"{trial['duration']:.2f}s | {trial['ttft']:.2f}s | {trial['tokens_per_second']:.1f} | "
+                            f"{trial['prompt_tokens_per_second']:.1f} | {label} |\n")
+                f.write("\n")
+    return report_path
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Tune Ollama inference options per model for OmniWeb")
+    parser.add_argument("--models", nargs="+", help="Only these models (default: all installed)")
+    parser.add_argument("--purposes", nargs="+", choices=list(SEARCH_SPACE), default=list(SEARCH_SPACE))
+    parser.add_argument("--grid", action="store_true", help="Try every combination instead of a random sample")
+    parser.add_argument("--samples", type=int, default=12, help="Combinations per purpose in random search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each prompt per combination")
+    parser.add_argument("--topics", type=int, default=2, help="Workload topics used per combination")
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="Pass-rate drop versus the baseline still accepted")
+    for option in TUNABLE_OPTIONS:
+        parser.add_argument("--" + option.replace("_", "-"), type=int, nargs="+", dest=option,
+                            help=f"Values for {option} (0 = leave unset)")
+    parser.add_argument("--output", default=OLLAMA_OPTIONS_PROFILE or "tuned_options.json",
+                        help="Profile to write (the server reads OLLAMA_OPTIONS_PROFILE)")
+    args = parser.parse_args(argv or [])
+
+    print("🚀 STARTING OLLAMA OPTIONS TUNING")
+    models = get_models()
+    if args.models:
+        models = [m for m in models if m in args.models]
+    if not models:
+        return 1
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_dir = os.path.join(benchmark.OUTPUT_BASE_DIR, f"tune_{timestamp}")
+    ensure_dir(run_dir)
+
+    tuned = {model: tune_model(model, args.purposes, args) for model in models}
+
+    with open(os.path.join(run_dir, "trials.json"), "w") as f:
+        json.dump(tuned, f, indent=2)
+    write_profile(args.output, tuned)
+    report = write_report(tuned, run_dir)
+
+    print(f"\n💾 Trials saved to {run_dir}/trials.json")
+    print(f"📄 Report generated at: {report}")
+    print(f"🎛️ Tuned options written to {args.output}; restart the server to apply them.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
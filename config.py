@@ -1,3 +1,121 @@
 import os
 
 OLLAMA_BASE = os.getenv("OLLAMA_BASE", "http://localhost:11434")
+
+# Connection pool for the shared async Ollama client
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "200"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "50"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30"))
+
+# Per-phase timeouts (seconds). Read timeouts are set per call since a
+# tag listing and a 120s lesson stream have very different budgets.
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_WRITE_TIMEOUT = float(os.getenv("OLLAMA_WRITE_TIMEOUT", "10"))
+OLLAMA_POOL_TIMEOUT = float(os.getenv("OLLAMA_POOL_TIMEOUT", "10"))
+
+# /expand response cache. Set EXPAND_CACHE_DB to a file path to add a
+# persistent SQLite tier behind the in-memory LRU.
+EXPAND_CACHE_SIZE = int(os.getenv("EXPAND_CACHE_SIZE", "1024"))
+EXPAND_CACHE_TTL = float(os.getenv("EXPAND_CACHE_TTL", str(7 * 24 * 3600)))
+EXPAND_CACHE_DB = os.getenv("EXPAND_CACHE_DB", "")
+EXPAND_CACHE_DB_SIZE = int(os.getenv("EXPAND_CACHE_DB_SIZE", "50000"))
+
+# /analyze lesson replay cache. Quiz is excluded unless LESSON_CACHE_QUIZ=1
+# since learners expect fresh questions on each attempt.
+LESSON_CACHE_SIZE = int(os.getenv("LESSON_CACHE_SIZE", "512"))
+LESSON_CACHE_TTL = float(os.getenv("LESSON_CACHE_TTL", str(7 * 24 * 3600)))
+LESSON_CACHE_DB = os.getenv("LESSON_CACHE_DB", "")
+LESSON_CACHE_DB_SIZE = int(os.getenv("LESSON_CACHE_DB_SIZE", "20000"))
+LESSON_CACHE_QUIZ = os.getenv("LESSON_CACHE_QUIZ", "0") == "1"
+
+# Speculative prefetch of child expansions. Only runs while fewer than
+# PREFETCH_MAX_LIVE user requests are in flight.
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") == "1"
+PREFETCH_QUEUE_SIZE = int(os.getenv("PREFETCH_QUEUE_SIZE", "64"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "1"))
+PREFETCH_WIDTH = int(os.getenv("PREFETCH_WIDTH", "5"))
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "1"))
+PREFETCH_MAX_LIVE = int(os.getenv("PREFETCH_MAX_LIVE", "1"))
+# The temperature a click sends (LearningWorkspace), whatever the parent used
+PREFETCH_TEMPERATURE = float(os.getenv("PREFETCH_TEMPERATURE", "0.5"))
+
+# Scheduler in front of Ollama. SCHEDULER_NUM_PARALLEL should match the
+# OLLAMA_NUM_PARALLEL the Ollama server runs with; SCHEDULER_MODEL_LIMITS
+# overrides it per model, e.g. "llama3=4,gpt-oss:120b=1" (an untagged
+# name means :latest).
+SCHEDULER_NUM_PARALLEL = int(os.getenv("SCHEDULER_NUM_PARALLEL", os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+SCHEDULER_MODEL_LIMITS = {
+    name.strip(): int(limit)
+    for name, _, limit in (
+        item.rpartition("=") for item in os.getenv("SCHEDULER_MODEL_LIMITS", "").split(",") if "=" in item
+    )
+}
+SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", "64"))
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "30"))
+
+# /expand fallback. A fallback model is raced against the primary once
+# EXPAND_HEDGE_DELAY seconds pass without a valid result (0 = sequential).
+EXPAND_HEDGE_DELAY = float(os.getenv("EXPAND_HEDGE_DELAY", "15"))
+EXPAND_MAX_FALLBACKS = int(os.getenv("EXPAND_MAX_FALLBACKS", "2"))
+
+# Seconds between background refreshes of the model inventory
+MODEL_REGISTRY_REFRESH = float(os.getenv("MODEL_REGISTRY_REFRESH", "30"))
+
+# Send per-endpoint JSON schemas as Ollama's `format` parameter so expand,
+# history and quiz output is constrained to valid JSON. Off by default: it
+# needs Ollama >= 0.5, and a run without it gives /stats the free-form
+# baseline that retries_avoided is measured against.
+OLLAMA_STRUCTURED_OUTPUTS = os.getenv("OLLAMA_STRUCTURED_OUTPUTS", "0") == "1"
+
+# Knowledge graph of generated nodes and lessons (SQLite path, "" = off).
+# Several uvicorn workers can point at the same file.
+GRAPH_DB = os.getenv("GRAPH_DB", "")
+GRAPH_DB_TIMEOUT = float(os.getenv("GRAPH_DB_TIMEOUT", "30"))
+
+# Expand through /api/chat, replaying up to this many ancestor turns so
+# Ollama reuses the parent's KV cache instead of re-encoding the path
+# (0 = single /api/generate prompt per node)
+EXPAND_CHAT_HISTORY = int(os.getenv("EXPAND_CHAT_HISTORY", "0"))
+
+# Models loaded at startup and reloaded when Ollama evicts them, e.g.
+# "llama3,gpt-oss:120b". /ready answers 503 until the first pass is done.
+WARMUP_MODELS = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+WARMUP_CHECK_INTERVAL = float(os.getenv("WARMUP_CHECK_INTERVAL", "60"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "300"))
+
+def _keep_alive(value):
+    # Ollama reads bare numbers as seconds and strings as durations ("30m")
+    value = value.strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+# keep_alive sent with every request, per model ("llama3=30m,gpt-oss:120b=-1")
+# and for all other models; -1 keeps a model loaded until Ollama restarts.
+# Empty leaves it to the Ollama server's own OLLAMA_KEEP_ALIVE.
+MODEL_KEEP_ALIVE = {
+    name.strip(): _keep_alive(value)
+    for name, _, value in (
+        item.rpartition("=") for item in os.getenv("MODEL_KEEP_ALIVE", "").split(",") if "=" in item
+    )
+}
+DEFAULT_KEEP_ALIVE = _keep_alive(os.getenv("DEFAULT_KEEP_ALIVE")) if os.getenv("DEFAULT_KEEP_ALIVE", "").strip() else None
+
+# Modes /analyze/batch generates for modes="likely": the tabs users open
+# next most often. Background batches run at prefetch priority.
+LESSON_LIKELY_MODES = [
+    m.strip().lower() for m in os.getenv("LESSON_LIKELY_MODES", "explain,eli5,impact,history").split(",") if m.strip()
+]
+
+# Tuned num_ctx/num_batch/num_thread/num_predict per model, written by
+# benchmark_tune.py and loaded at startup ("" = off; a missing file is ignored)
+OLLAMA_OPTIONS_PROFILE = os.getenv("OLLAMA_OPTIONS_PROFILE", "tuned_options.json")
+
+# Per-request traces (queueing, each model attempt, Ollama load/prompt/eval
+# time, parsing) appended to a rotating JSONL file ("" = off); summarize
+# with `python tracing.py FILE`. TRACE_SERVER_TIMING=1 also returns the
+# phase totals in a Server-Timing header.
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "0") == "1"
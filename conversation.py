@@ -0,0 +1,64 @@
+from cache import MemoryCache, make_key
+from graph import normalize_path
+
+
+class Transcripts:
+    """
+    Remembers the chat turn (user prompt + raw model reply) that expanded
+    each node, so a child's /api/chat request can replay its ancestors'
+    turns verbatim.
+
+    Ollama keeps the KV cache of each slot's last prompt and only evaluates
+    tokens after the longest common prefix. A child whose messages begin with
+    exactly its parent's conversation therefore skips re-encoding the system
+    prompt and every level above it.
+
+    At most `max_turns` ancestors are replayed so deep paths stay inside
+    num_ctx. A sliding window would drop the oldest turn on every click and
+    change the prefix at every level, so past that depth the first half of
+    the window stays anchored at the root and the rest restarts in blocks:
+    a child's messages extend its parent's on all but one level per block.
+    """
+
+    def __init__(self, max_turns=6, max_entries=4096, ttl=None):
+        self.max_turns = max_turns
+        self._turns = MemoryCache(max_entries, ttl=ttl)
+
+    def _key(self, model, parts):
+        return make_key("turn", model, normalize_path(parts))
+
+    def record(self, model, parts, user, assistant):
+        self._turns.set(self._key(model, parts), (user, assistant))
+
+    def window(self, count):
+        """Indexes of the turns to replay out of `count` ancestors, oldest first."""
+        if count <= self.max_turns:
+            return list(range(count))
+        head = self.max_turns // 2
+        block = self.max_turns - head
+        tail = head + (count - head - 1) // block * block
+        return list(range(head)) + list(range(tail, count))
+
+    def history(self, model, parts):
+        """
+        Messages for the unbroken run of remembered ancestors directly above
+        the node at `parts`, oldest first, thinned by window().
+        """
+        if self.max_turns <= 0:
+            return []
+        turns = []
+        for depth in range(len(parts) - 1, 0, -1):
+            turn = self._turns.get(self._key(model, parts[:depth]))
+            if turn is None:
+                break
+            turns.append(turn)
+        turns.reverse()
+
+        messages = []
+        for i in self.window(len(turns)):
+            user, assistant = turns[i]
+            messages += [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+        return messages
+
+    def clear(self):
+        self._turns.clear()
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for the Ollama HTTP API, so the backend can be
+load-tested on a CPU-only box with no network.
+
+Serves /api/tags, /api/ps, /api/generate and /api/chat (streaming and
+non-streaming) with configurable behaviour:
+  ttft          seconds before the first token (prompt evaluation) for a
+                prompt with nothing cached; like Ollama, each model keeps
+                the last `slots` contexts (prompt + answer) and only the
+                part of a new prompt past the longest shared prefix is
+                evaluated, so replayed chat history gets cheaper
+  tps           generated tokens per second, per request
+  load_delay    seconds to load a model that is not resident
+  slots         generations served at once (OLLAMA_NUM_PARALLEL); others queue
+  error_rate    fraction of generations answered with HTTP 500
+  chatter_rate  fraction of JSON answers wrapped in prose (exercises the
+                lenient parser when no `format` schema is sent)
+
+Answers are templated from the prompt: expand, sibling batch, history and
+quiz prompts get valid JSON in the shape the server asks for, everything
+else a Markdown lesson. Identical requests get identical answers.
+
+In-process:  FakeOllama(...).app is an ASGI app; FakeOllamaThread serves it
+             on a real socket (streaming included) from a background thread.
+Subprocess:  python fake_ollama.py --port 11435 --ttft 0.2 --tps 40
+             or FakeOllamaProcess(port, ttft=0.2) from Python.
+Runtime:     POST /_fake/config, POST /_fake/evict, GET /_fake/stats
+"""
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import datetime
+import threading
+import subprocess
+from os.path import commonprefix
+from collections import deque
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from ollama_client import model_tag
+
+DEFAULT_MODELS = {
+    "llama3:latest": 4_661_224_676,
+    "mistral:latest": 4_113_301_824,
+}
+
+ASPECTS = [
+    "Foundations", "Origins", "Mechanisms", "Applications", "Theory", "Methods",
+    "Debates", "Frontiers", "Principles", "Systems", "Models", "Limits",
+]
+
+_TOKEN = re.compile(r"\s*\S{1,6}|\s+$")
+_DURATION = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+
+
+def parse_keep_alive(value, default):
+    """Seconds a model stays loaded; None means forever."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        m = _DURATION.match(str(value).strip())
+        if not m:
+            return default
+        seconds = float(m.group(1)) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}[m.group(2)]
+    return None if seconds < 0 else seconds
+
+
+def tokenize(text):
+    return _TOKEN.findall(text)
+
+
+def _quoted(prompt, label):
+    m = re.search(label + r":\s*(.+)", prompt)
+    return m.group(1).strip() if m else None
+
+
+class FakeOllama:
+    def __init__(self, models=None, ttft=0.05, tps=200.0, load_delay=0.0, slots=4,
+                 error_rate=0.0, chatter_rate=0.0, keep_alive=300, seed=0):
+        self.models = {model_tag(n): size for n, size in (models or DEFAULT_MODELS).items()}
+        self.ttft = ttft
+        self.tps = tps
+        self.load_delay = load_delay
+        self.slots = slots
+        self.error_rate = error_rate
+        self.chatter_rate = chatter_rate
+        self.keep_alive = keep_alive
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._semaphore = None
+        self._loaded = {}  # model -> expiry (monotonic) or None for forever
+        self._loading = {}
+        self._contexts = {}  # model -> recent contexts, the prompt cache
+        self.counters = {"requests": 0, "errors": 0, "loads": 0, "active": 0, "peak_active": 0, "queued": 0}
+        self.app = self._build_app()
+
+    # -- configuration -----------------------------------------------------
+
+    def configure(self, **changes):
+        for name, value in changes.items():
+            if name not in ("ttft", "tps", "load_delay", "slots", "error_rate", "chatter_rate", "keep_alive"):
+                raise ValueError(f"unknown setting: {name}")
+            setattr(self, name, value)
+        if "slots" in changes:
+            self._semaphore = None
+
+    def evict(self, model=None):
+        if model is None:
+            self._loaded.clear()
+            self._contexts.clear()
+        else:
+            model = model_tag(model)
+            self._loaded.pop(model, None)
+            self._contexts.pop(model, None)
+
+    def _slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.slots)
+        return self._semaphore
+
+    # -- model residency ---------------------------------------------------
+
+    def _resolve(self, model):
+        tagged = model_tag(model)
+        return tagged if tagged in self.models else None
+
+    def _expire(self):
+        now = time.monotonic()
+        for model, expiry in list(self._loaded.items()):
+            if expiry is not None and expiry <= now:
+                del self._loaded[model]
+
+    async def _ensure_loaded(self, model, keep_alive):
+        """Returns the seconds spent loading (0 when already resident)."""
+        self._expire()
+        waited = 0.0
+        if model not in self._loaded:
+            # A reload starts with an empty KV cache
+            self._contexts.pop(model, None)
+            start = time.perf_counter()
+            loading = self._loading.get(model)
+            if loading is None:
+                loading = self._loading[model] = asyncio.ensure_future(asyncio.sleep(self.load_delay))
+                self.counters["loads"] += 1
+                loading.add_done_callback(lambda _: self._loading.pop(model, None))
+            await asyncio.shield(loading)
+            waited = time.perf_counter() - start
+        seconds = parse_keep_alive(keep_alive, self.keep_alive)
+        self._loaded[model] = None if seconds is None else time.monotonic() + seconds
+        return waited
+
+    # -- prompt cache ------------------------------------------------------
+
+    def _cached_prefix(self, model, prompt):
+        """Characters of `prompt` covered by the best-matching cached context, which is taken for reuse."""
+        contexts = self._contexts.setdefault(model, deque(maxlen=max(1, self.slots)))
+        best, length = None, 0
+        for context in contexts:
+            shared = len(commonprefix([context, prompt]))
+            if shared > length:
+                best, length = context, shared
+        if best is not None:
+            contexts.remove(best)
+        return length
+
+    def _remember(self, model, context):
+        self._contexts.setdefault(model, deque(maxlen=max(1, self.slots))).append(context)
+
+    # -- answers -----------------------------------------------------------
+
+    def _children(self, subject, rng, count=5):
+        return [
+            {
+                "name": f"{subject} {aspect}",
+                "desc": f"The {aspect.lower()} of {subject}, in brief.",
+                "status": rng.choice(["concept", "entity", "process"]),
+            }
+            for aspect in rng.sample(ASPECTS, count)
+        ]
+
+    def answer(self, model, prompt, schema=None):
+        """The deterministic completion for a prompt."""
+        digest = hashlib.sha256(f"{self.seed}|{model}|{prompt}".encode()).digest()
+        rng = random.Random(digest)
+        topic = _quoted(prompt, "Topic") or "the topic"
+
+        if "Sibling Subjects:" in prompt:
+            names = re.findall(r'"([^"]+)"', _quoted(prompt, "Sibling Subjects") or "")
+            doc = {"siblings": {name: self._children(name, rng) for name in names}}
+        elif "Current Subject:" in prompt:
+            doc = {"children": self._children(_quoted(prompt, "Current Subject"), rng)}
+        elif "You are a Historian" in prompt:
+            start = rng.randint(1500, 1900)
+            doc = [
+                {"year": str(start + 25 * i), "title": f"{topic} milestone {i + 1}",
+                 "description": f"A turning point in the story of {topic}."}
+                for i in range(5)
+            ]
+        elif "multiple choice quiz" in prompt:
+            m = re.search(r"(\d+)-question", prompt)
+            doc = {"questions": [
+                {"question": f"Question {i + 1} about {topic}?",
+                 "options": [f"Option {c}" for c in "ABCD"],
+                 "correct_index": rng.randint(0, 3),
+                 "explanation": f"Because of how {topic} works."}
+                for i in range(int(m.group(1)) if m else 3)
+            ]}
+        else:
+            paragraphs = [
+                f"## {topic}: part {i + 1}\n\n" + " ".join(
+                    f"{topic} {rng.choice(ASPECTS).lower()} matters here." for _ in range(6)
+                )
+                for i in range(3)
+            ]
+            return f"# {topic}\n\n> Think of it like a map.\n\n" + "\n\n".join(paragraphs) + "\n"
+
+        text = json.dumps(doc)
+        if not schema and rng.random() < self.chatter_rate:
+            text = f"Sure! Here is the JSON you asked for:\n```json\n{text}\n```\nLet me know if you need more."
+        return text
+
+    # -- HTTP --------------------------------------------------------------
+
+    def _build_app(self):
+        app = FastAPI(title="Fake Ollama")
+
+        @app.get("/api/tags")
+        async def tags():
+            return {"models": [
+                {"name": name, "model": name, "size": size,
+                 "details": {"family": name.split(":")[0], "parameter_size": "8B", "quantization_level": "Q4_K_M"}}
+                for name, size in self.models.items()
+            ]}
+
+        @app.get("/api/ps")
+        async def ps():
+            self._expire()
+            now = time.monotonic()
+            models = []
+            for name, expiry in self._loaded.items():
+                remaining = 10 * 365 * 86400 if expiry is None else expiry - now
+                expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=remaining)
+                models.append({"name": name, "model": name, "size": self.models[name],
+                               "size_vram": self.models[name], "expires_at": expires_at.isoformat()})
+            return {"models": models}
+
+        @app.post("/api/generate")
+        async def generate(request: Request):
+            body = await request.json()
+            return await self._generate(body, body.get("prompt") or "", chat=False)
+
+        @app.post("/api/chat")
+        async def chat(request: Request):
+            body = await request.json()
+            messages = body.get("messages") or []
+            prompt = "\n".join(m.get("content", "") for m in messages)
+            return await self._generate(body, prompt, chat=True, last=messages[-1].get("content", "") if messages else "")
+
+        @app.post("/_fake/config")
+        async def config(request: Request):
+            try:
+                self.configure(**(await request.json()))
+            except ValueError as e:
+                return JSONResponse(status_code=400, content={"error": str(e)})
+            return self.stats()
+
+        @app.post("/_fake/evict")
+        async def evict(request: Request):
+            body = await request.json() if await request.body() else {}
+            self.evict(body.get("model"))
+            return {"loaded": list(self._loaded)}
+
+        @app.get("/_fake/stats")
+        async def stats():
+            return self.stats()
+
+        return app
+
+    def stats(self):
+        return {
+            **self.counters,
+            "loaded": sorted(self._loaded),
+            "settings": {
+                "ttft": self.ttft, "tps": self.tps, "load_delay": self.load_delay, "slots": self.slots,
+                "error_rate": self.error_rate, "chatter_rate": self.chatter_rate, "keep_alive": self.keep_alive,
+            },
+        }
+
+    async def _generate(self, body, prompt, chat, last=None):
+        self.counters["requests"] += 1
+        name = body.get("model", "")
+        model = self._resolve(name)
+        if model is None:
+            return JSONResponse(status_code=404, content={"error": f"model '{name}' not found, try pulling it first"})
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.counters["errors"] += 1
+            return JSONResponse(status_code=500, content={"error": "injected failure"})
+
+        stream = body.get("stream", True)
+        keep_alive = body.get("keep_alive")
+        schema = body.get("format") if isinstance(body.get("format"), dict) else None
+
+        if not chat and not prompt:
+            # Empty prompt: Ollama just loads the model, or unloads it with keep_alive 0
+            if parse_keep_alive(keep_alive, self.keep_alive) == 0:
+                # Nothing to load first, whether or not the model is resident
+                self.evict(model)
+                done = {"model": name, "created_at": _now(), "response": "", "done": True, "done_reason": "unload"}
+            else:
+                load = await self._ensure_loaded(model, keep_alive)
+                done = {"model": name, "created_at": _now(), "response": "", "done": True,
+                        "done_reason": "load", "load_duration": int(load * 1e9)}
+            return StreamingResponse(iter([json.dumps(done) + "\n"]), media_type="application/x-ndjson") \
+                if stream else done
+
+        # Subject detection only needs the newest turn of a chat
+        tokens = tokenize(self.answer(model, last if chat else prompt, schema))
+
+        def chunk(text, **extra):
+            record = {"model": name, "created_at": _now()}
+            if chat:
+                record["message"] = {"role": "assistant", "content": text}
+            else:
+                record["response"] = text
+            record.update(extra)
+            return record
+
+        async def run(emit):
+            self.counters["queued"] += 1
+            async with self._slot():
+                self.counters["queued"] -= 1
+                self.counters["active"] += 1
+                self.counters["peak_active"] = max(self.counters["peak_active"], self.counters["active"])
+                try:
+                    start = time.perf_counter()
+                    load = await self._ensure_loaded(model, keep_alive)
+                    # ~4 characters per token; at least one token is always evaluated
+                    prompt_tokens = max(1, len(prompt) // 4)
+                    evaluated = max(1, prompt_tokens - self._cached_prefix(model, prompt) // 4)
+                    prompt_eval = self.ttft * evaluated / prompt_tokens
+                    await asyncio.sleep(prompt_eval)
+                    eval_start = time.perf_counter()
+                    for i, token in enumerate(tokens):
+                        # Paced against the clock so sleep overhead does not accumulate
+                        delay = eval_start + (i + 1) / self.tps - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        await emit(token)
+                    end = time.perf_counter()
+                    # The answer stays in the context, as a chat's next turn replays it
+                    self._remember(model, prompt + ("\n" if chat else "") + "".join(tokens))
+                finally:
+                    self.counters["active"] -= 1
+            if parse_keep_alive(keep_alive, self.keep_alive) == 0:
+                self._loaded.pop(model, None)
+            return {
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": int((end - start) * 1e9),
+                "load_duration": int(load * 1e9),
+                "prompt_eval_count": evaluated,
+                "prompt_eval_duration": int(prompt_eval * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int((end - eval_start) * 1e9),
+            }
+
+        if not stream:
+            async def collect(token):
+                pass
+            final = await run(collect)
+            return chunk("".join(tokens), **final)
+
+        async def lines():
+            queue = asyncio.Queue()
+
+            async def emit(token):
+                await queue.put(json.dumps(chunk(token, done=False)) + "\n")
+
+            async def produce():
+                try:
+                    final = await run(emit)
+                    await queue.put(json.dumps(chunk("", **final)) + "\n")
+                finally:
+                    await queue.put(None)
+
+            task = asyncio.ensure_future(produce())
+            try:
+                while True:
+                    line = await queue.get()
+                    if line is None:
+                        break
+                    yield line
+            finally:
+                # Client went away: free the slot like Ollama does
+                task.cancel()
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class FakeOllamaThread:
+    """Serves a FakeOllama on a real socket from a background thread."""
+
+    def __init__(self, fake=None, host="127.0.0.1", port=0):
+        import uvicorn
+        self.fake = fake or FakeOllama()
+        self.server = uvicorn.Server(uvicorn.Config(self.fake.app, host=host, port=port, log_level="warning"))
+        self.host = host
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("fake Ollama did not start")
+            time.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        self.base_url = f"http://{self.host}:{port}"
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class FakeOllamaProcess:
+    """Runs fake_ollama.py as a subprocess, e.g. next to a uvicorn backend."""
+
+    def __init__(self, port=11435, host="127.0.0.1", **settings):
+        self.base_url = f"http://{host}:{port}"
+        self.args = [sys.executable, __file__, "--host", host, "--port", str(port)]
+        for name, value in settings.items():
+            self.args += [f"--{name.replace('_', '-')}", str(value)]
+        self.process = None
+
+    def __enter__(self):
+        import httpx
+        self.process = subprocess.Popen(self.args)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"fake Ollama exited with {self.process.returncode}")
+            try:
+                httpx.get(f"{self.base_url}/api/tags", timeout=0.5)
+                return self
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        self.process.kill()
+        raise RuntimeError("fake Ollama did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic fake Ollama server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", nargs="+", default=list(DEFAULT_MODELS), help="Model names to advertise")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds to first token")
+    parser.add_argument("--tps", type=float, default=200.0, help="Tokens per second per request")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="Seconds to load a cold model")
+    parser.add_argument("--slots", type=int, default=4, help="Concurrent generations (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of generations that fail")
+    parser.add_argument("--chatter-rate", type=float, default=0.0, help="Fraction of JSON answers wrapped in prose")
+    parser.add_argument("--keep-alive", type=float, default=300, help="Default seconds a model stays loaded")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    fake = FakeOllama(
+        models={name: DEFAULT_MODELS.get(model_tag(name), 4_000_000_000) for name in args.models},
+        ttft=args.ttft, tps=args.tps, load_delay=args.load_delay, slots=args.slots,
+        error_rate=args.error_rate, chatter_rate=args.chatter_rate, keep_alive=args.keep_alive, seed=args.seed,
+    )
+    print(f"🦙 Fake Ollama on http://{args.host}:{args.port} (ttft {args.ttft}s, {args.tps} tok/s, {args.slots} slots)")
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+
+
+def normalize_name(name):
+    """Case- and whitespace-insensitive form used for lookups."""
+    return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+
+def split_path(context):
+    """'A > B > C' -> ['A', 'B', 'C'], dropping empty segments."""
+    return [part.strip() for part in (context or "").split(">") if part.strip()]
+
+
+def node_context(node, context):
+    """
+    Context path ending in `node`. The frontend already sends it that way;
+    other callers may send only the ancestors.
+    """
+    parts = split_path(context)
+    if not parts or normalize_name(parts[-1]) != normalize_name(node):
+        parts.append(node.strip())
+    return " > ".join(parts)
+
+
+def normalize_path(parts):
+    return " > ".join(normalize_name(p) for p in parts)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    norm_name TEXT NOT NULL,
+    parent_id INTEGER REFERENCES nodes(id),
+    depth INTEGER NOT NULL,
+    desc TEXT,
+    status TEXT,
+    expanded_at REAL,
+    created_at REAL NOT NULL,
+    UNIQUE (path, model)
+);
+CREATE INDEX IF NOT EXISTS nodes_norm_name ON nodes(norm_name, model);
+CREATE INDEX IF NOT EXISTS nodes_model ON nodes(model);
+
+CREATE TABLE IF NOT EXISTS edges (
+    parent_id INTEGER NOT NULL REFERENCES nodes(id),
+    child_id INTEGER NOT NULL REFERENCES nodes(id),
+    position INTEGER NOT NULL,
+    meta TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (parent_id, child_id)
+);
+
+CREATE TABLE IF NOT EXISTS lessons (
+    node_id INTEGER NOT NULL REFERENCES nodes(id),
+    mode TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    num_questions INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (node_id, mode, difficulty, num_questions)
+);
+"""
+
+
+class GraphStore:
+    """
+    Persistent knowledge graph of everything /expand and /analyze produced.
+
+    A node is identified by (normalized context path, model); the path ends
+    in the node itself, as the frontend sends it. Each node points at its
+    parent, so resolving a path walks at most `depth` rows. Expansions are
+    stored as ordered parent->child edges, lessons per (node, mode, options).
+
+    Several uvicorn workers may share one file: WAL lets readers run beside a
+    writer, writes take the lock up front (BEGIN IMMEDIATE) and wait up to
+    `timeout` seconds for it instead of failing with "database is locked".
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.db_path = path
+        self._lock = threading.Lock()
+        # Autocommit mode; write transactions are opened explicitly
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=timeout, isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, fn, *args):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(*args)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _node_id(self, model, parts):
+        row = self._conn.execute(
+            "SELECT id FROM nodes WHERE path = ? AND model = ?", (normalize_path(parts), model)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _ensure_path(self, model, parts, now):
+        """Creates any missing nodes along the path; returns the last node's id."""
+        parent_id = None
+        for depth in range(1, len(parts) + 1):
+            path = normalize_path(parts[:depth])
+            name = parts[depth - 1]
+            self._conn.execute(
+                "INSERT INTO nodes (model, path, name, norm_name, parent_id, depth, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (path, model) DO NOTHING",
+                (model, path, name, normalize_name(name), parent_id, depth, now),
+            )
+            parent_id = self._conn.execute(
+                "SELECT id FROM nodes WHERE path = ? AND model = ?", (path, model)
+            ).fetchone()[0]
+        return parent_id
+
+    def record_expansion(self, model, context, children, meta=None):
+        """Stores `children` as the current expansion of the node at `context`."""
+        parts = split_path(context)
+        if not parts:
+            return
+        self._write(self._record_expansion, model, parts, children, meta)
+
+    def _record_expansion(self, model, parts, children, meta):
+        now = time.time()
+        parent_id = self._ensure_path(model, parts, now)
+        # A regenerated expansion replaces the previous one
+        self._conn.execute("DELETE FROM edges WHERE parent_id = ?", (parent_id,))
+        encoded = json.dumps(meta) if meta else None
+        for position, child in enumerate(children):
+            child_id = self._ensure_path(model, parts + [child["name"]], now)
+            self._conn.execute(
+                "UPDATE nodes SET desc = ?, status = ? WHERE id = ?",
+                (child.get("desc"), child.get("status"), child_id),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO edges (parent_id, child_id, position, meta, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (parent_id, child_id, position, encoded, now),
+            )
+        self._conn.execute("UPDATE nodes SET expanded_at = ? WHERE id = ?", (now, parent_id))
+
+    def _children(self, node_id):
+        rows = self._conn.execute(
+            "SELECT n.name, n.desc, n.status FROM edges e JOIN nodes n ON n.id = e.child_id "
+            "WHERE e.parent_id = ? ORDER BY e.position",
+            (node_id,),
+        ).fetchall()
+        return [{"name": name, "desc": desc or "", "status": status or "concept"} for name, desc, status in rows]
+
+    def children(self, model, context):
+        """The stored expansion of the node at `context`, or None."""
+        with self._lock:
+            node_id = self._node_id(model, split_path(context))
+            if node_id is None:
+                return None
+            return self._children(node_id) or None
+
+    def path(self, model, context):
+        """
+        Every node from the root down to `context` with its stored children
+        (None where a node was never expanded): enough to rebuild the
+        frontend's columns after a reload.
+        """
+        with self._lock:
+            node_id = self._node_id(model, split_path(context))
+            if node_id is None:
+                return []
+            rows = self._conn.execute(
+                "WITH RECURSIVE chain(id, parent_id, name, depth, expanded_at) AS ("
+                " SELECT id, parent_id, name, depth, expanded_at FROM nodes WHERE id = ?"
+                " UNION ALL"
+                " SELECT n.id, n.parent_id, n.name, n.depth, n.expanded_at FROM nodes n"
+                " JOIN chain c ON n.id = c.parent_id"
+                ") SELECT id, name, expanded_at FROM chain ORDER BY depth",
+                (node_id,),
+            ).fetchall()
+            return [
+                {"name": name, "children": self._children(nid) if expanded_at else None}
+                for nid, name, expanded_at in rows
+            ]
+
+    def find(self, name, model=None, limit=20):
+        """Nodes with this name anywhere in the graph, shallowest first."""
+        query = "SELECT name, path, model, depth FROM nodes WHERE norm_name = ?"
+        args = [normalize_name(name)]
+        if model:
+            query += " AND model = ?"
+            args.append(model)
+        query += " ORDER BY depth LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [{"name": n, "path": p, "model": m, "depth": d} for n, p, m, d in rows]
+
+    def record_lesson(self, model, context, mode, difficulty, num_questions, content):
+        parts = split_path(context)
+        if not parts:
+            return
+        self._write(self._record_lesson, model, parts, mode, difficulty or "", num_questions or 0, content)
+
+    def _record_lesson(self, model, parts, mode, difficulty, num_questions, content):
+        now = time.time()
+        node_id = self._ensure_path(model, parts, now)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO lessons (node_id, mode, difficulty, num_questions, content, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (node_id, mode, difficulty, num_questions, content, now),
+        )
+
+    def lesson(self, model, context, mode, difficulty, num_questions):
+        with self._lock:
+            node_id = self._node_id(model, split_path(context))
+            if node_id is None:
+                return None
+            row = self._conn.execute(
+                "SELECT content FROM lessons WHERE node_id = ? AND mode = ? AND difficulty = ? AND num_questions = ?",
+                (node_id, mode, difficulty or "", num_questions or 0),
+            ).fetchone()
+        return row[0] if row else None
+
+    def stats(self):
+        with self._lock:
+            counts = {
+                table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("nodes", "edges", "lessons")
+            }
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,186 @@
+import re
+import json
+
+# Characters that matter outside / inside a JSON string. Everything else is
+# skipped with a single regex search instead of a Python-level loop.
+# A backslash skips the next character even outside a string, as the
+# original robust_json_parser scanner did.
+_ROOT_START = re.compile(r'[{\[]')
+_STRUCTURAL = re.compile(r'[{}\[\]",\\]')
+_BRACKETS = re.compile(r'[{}\[\]"\\]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+_CLOSERS = {'}': '{', ']': '['}
+
+
+class _Capture:
+    """Collects a span of text that may cross chunk boundaries."""
+    __slots__ = ("pieces", "start")
+
+    def __init__(self, start):
+        self.pieces = []
+        self.start = start
+
+    def flush(self, chunk):
+        self.pieces.append(chunk[self.start:])
+        self.start = 0
+
+    def finish(self, chunk, end):
+        self.pieces.append(chunk[self.start:end])
+        return "".join(self.pieces)
+
+
+class StreamingJSONParser:
+    """
+    Push-based parser for LLM output that contains one JSON document.
+
+    Feed it chunks as they stream in. Each feed() returns the events that
+    became complete:
+      ("item", key, value)  an element of the root array (key is None) or of
+                            an array held directly by the root object
+                            (key is that property name), e.g. each child of
+                            {"children": [...]} or each event of a timeline.
+      ("document", value)   the root value once it closes.
+
+    Like robust_json_parser it skips prose and markdown fences before the
+    first brace/bracket and ignores anything after the root closes.
+    """
+
+    def __init__(self, emit_items=True, keep_document=True, decode_document=True):
+        self.emit_items = emit_items
+        self.keep_document = keep_document
+        self.decode_document = decode_document
+        self.started = False
+        self.done = False
+        self.document = None
+        self.document_text = None
+        self.errors = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._doc = None
+        self._item = None
+        self._key = None
+        self._last_key = None
+        self._array_key = None
+        # Commas only matter when splitting items
+        self._structural = _STRUCTURAL if emit_items else _BRACKETS
+
+    def _target_array(self):
+        # Arrays whose elements are reported as items
+        stack = self._stack
+        if len(stack) == 1:
+            return stack[0] == '['
+        return len(stack) == 2 and stack[0] == '{' and stack[1] == '['
+
+    def _emit_item(self, text, events):
+        text = text.strip()
+        if not text:
+            return
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return
+        events.append(("item", self._array_key, value))
+
+    def feed(self, chunk):
+        events = []
+        if self.done or not chunk:
+            return events
+
+        i = 0
+        n = len(chunk)
+        if not self.started:
+            m = _ROOT_START.search(chunk)
+            if not m:
+                return events
+            i = m.start()
+            self.started = True
+            if self.keep_document:
+                self._doc = _Capture(i)
+
+        stack = self._stack
+        while i < n:
+            if self._escape:
+                self._escape = False
+                i += 1
+                continue
+            if self._in_string:
+                m = _STRING_SPECIAL.search(chunk, i)
+                if not m:
+                    break
+                i = m.end()
+                if m.group() == '\\':
+                    self._escape = True
+                    continue
+                self._in_string = False
+                if self._key is not None:
+                    raw = self._key.finish(chunk, i)
+                    self._key = None
+                    try:
+                        self._last_key = json.loads(raw)
+                    except json.JSONDecodeError:
+                        self._last_key = None
+                continue
+
+            m = self._structural.search(chunk, i)
+            if not m:
+                break
+            c = m.group()
+            pos = m.start()
+            i = m.end()
+
+            if c == '\\':
+                self._escape = True
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if len(stack) == 1 and stack[0] == '{' and self.emit_items:
+                    # Remember root-level strings so an array knows its key
+                    self._key = _Capture(pos)
+                continue
+
+            if c == '{' or c == '[':
+                stack.append(c)
+                if c == '[' and self.emit_items and self._target_array():
+                    self._array_key = self._last_key if len(stack) == 2 else None
+                    self._item = _Capture(i)
+                continue
+
+            if c == ',':
+                if self._item is not None and self._target_array():
+                    self._emit_item(self._item.finish(chunk, pos), events)
+                    self._item = _Capture(i)
+                continue
+
+            # Closing brace/bracket; mismatched closers are ignored
+            if not stack or stack[-1] != _CLOSERS[c]:
+                continue
+            if self._item is not None and c == ']' and self._target_array():
+                self._emit_item(self._item.finish(chunk, pos), events)
+                self._item = None
+            stack.pop()
+            if not stack:
+                self.done = True
+                if self._doc is not None:
+                    self.document_text = self._doc.finish(chunk, i)
+                    self._doc = None
+                    if not self.decode_document:
+                        return events
+                    try:
+                        self.document = json.loads(self.document_text)
+                        events.append(("document", self.document))
+                    except json.JSONDecodeError:
+                        self.errors += 1
+                return events
+            if self._item is not None and self._target_array():
+                # An object/array element just closed: emit it right away
+                self._emit_item(self._item.finish(chunk, i), events)
+                self._item = _Capture(i)
+
+        for capture in (self._doc, self._item, self._key):
+            if capture is not None:
+                capture.flush(chunk)
+        return events
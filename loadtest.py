@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+End-to-end load generator for the OmniWeb backend.
+
+Virtual learners follow the click-paths in a scenario file: list models,
+pick a topic, drill down through /expand, open lesson tabs through /analyze
+or several at once through /analyze/batch (consuming the whole stream). Two ways to apply load:
+  closed  --users N concurrent learners, each starting a new journey as
+          soon as the previous one ends (measures capacity)
+  open    journeys arrive at --rate per second (Poisson) whatever the
+          backend's state (measures latency under a given demand)
+
+Reports throughput, p50/p95/p99 latency, time to first byte for streams and
+error rate per endpoint, as results.json plus REPORT.md in
+loadtest_results/run_<timestamp>/.
+
+Usage:
+  python loadtest.py scenarios/explorers.json --users 20 --duration 120
+  python loadtest.py scenarios/explorers.json --mode open --rate 2
+  python loadtest.py scenarios/explorers.json --spawn --fake-ollama   # self-contained, CPU only
+
+Scenario format (JSON):
+  {
+    "name": "explorers",
+    "model": "llama3",
+    "topics": ["Coffee", "Black Holes"],
+    "think_time": [1, 3],                      # seconds between steps
+    "users": [
+      {"name": "driller", "weight": 3, "steps": [
+        {"action": "models"},
+        {"action": "expand", "root": true},     # new topic from "topics"
+        {"action": "repeat", "times": 3, "steps": [
+          {"action": "expand"},                 # click a child of the last column
+          {"action": "analyze", "mode": "explain"},
+          {"action": "batch", "modes": "likely"}   # /analyze/batch, streamed
+        ]}
+      ]}
+    ]
+  }
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import datetime
+import subprocess
+
+import httpx
+
+OUTPUT_BASE_DIR = "loadtest_results"
+STREAM_ENDPOINTS = {"/analyze", "/expand/stream", "/analyze/batch"}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Metrics:
+    """Per-endpoint samples collected by every virtual user."""
+
+    def __init__(self):
+        self.samples = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self.journeys = 0
+
+    def record(self, endpoint, latency, ok, ttfb=None, error=None):
+        entry = self.samples.setdefault(endpoint, {"latency": [], "ttfb": [], "errors": 0, "count": 0, "messages": {}})
+        entry["count"] += 1
+        if ok:
+            entry["latency"].append(latency)
+            if ttfb is not None:
+                entry["ttfb"].append(ttfb)
+        else:
+            entry["errors"] += 1
+            if error:
+                entry["messages"][error] = entry["messages"].get(error, 0) + 1
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        endpoints = {}
+        for endpoint, entry in sorted(self.samples.items()):
+            lat, ttfb = entry["latency"], entry["ttfb"]
+            endpoints[endpoint] = {
+                "requests": entry["count"],
+                "errors": entry["errors"],
+                "error_rate": round(entry["errors"] / entry["count"], 4) if entry["count"] else 0,
+                "throughput_rps": round(len(lat) / elapsed, 3) if elapsed else 0,
+                "latency": {f"p{p}": _round(percentile(lat, p)) for p in (50, 95, 99)},
+                "latency_mean": _round(sum(lat) / len(lat)) if lat else None,
+                "ttfb": {f"p{p}": _round(percentile(ttfb, p)) for p in (50, 95, 99)} if ttfb else None,
+                "top_errors": sorted(entry["messages"].items(), key=lambda kv: -kv[1])[:5],
+            }
+        total = sum(e["count"] for e in self.samples.values())
+        errors = sum(e["errors"] for e in self.samples.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "journeys": self.journeys,
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0,
+            "throughput_rps": round((total - errors) / elapsed, 3) if elapsed else 0,
+            "endpoints": endpoints,
+        }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+class Learner:
+    """One virtual user walking a journey; keeps the Miller-column state the frontend would."""
+
+    def __init__(self, http, scenario, metrics, rng, think_scale=1.0):
+        self.http = http
+        self.scenario = scenario
+        self.metrics = metrics
+        self.rng = rng
+        self.think_scale = think_scale
+        self.model = scenario.get("model", "llama3")
+        self.columns = []  # [{"nodes": [...], "selected": name}]
+
+    async def think(self, seconds=None):
+        low, high = seconds or self.scenario.get("think_time", [0, 0])
+        delay = self.rng.uniform(low, high) * self.think_scale
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def request(self, endpoint, method="POST", body=None):
+        """Sends one request and records it; returns the decoded body or None."""
+        start = time.perf_counter()
+        ttfb = None
+        stream = endpoint in STREAM_ENDPOINTS
+        try:
+            async with self.http.stream(method, endpoint, json=body) as response:
+                chunks = []
+                async for chunk in response.aiter_text():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - start
+                    chunks.append(chunk)
+            text = "".join(chunks)
+            latency = time.perf_counter() - start
+            error = None
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+            elif stream and (text.startswith("Error:") or '"type": "error"' in text):
+                error = "stream error"
+            self.metrics.record(endpoint, latency, error is None, ttfb if stream else None, error)
+            if error:
+                return None
+            return text if stream else json.loads(text)
+        except Exception as e:
+            self.metrics.record(endpoint, time.perf_counter() - start, False, error=type(e).__name__)
+            return None
+
+    def context(self):
+        return " > ".join(c["selected"] for c in self.columns if c.get("selected"))
+
+    async def expand(self, step):
+        if step.get("root") or not self.columns:
+            topic = self.rng.choice(self.scenario.get("topics") or ["Coffee"])
+            self.columns = [{"nodes": [topic], "selected": topic}]
+        else:
+            last = self.columns[-1]
+            if not last["nodes"]:
+                return
+            choice = step.get("click", "random")
+            last["selected"] = last["nodes"][0] if choice == "first" else self.rng.choice(last["nodes"])
+
+        node = self.columns[-1]["selected"]
+        parent_nodes = self.columns[-2]["nodes"] if len(self.columns) > 1 else []
+        body = {
+            "node": node,
+            "context": self.context(),
+            "model": self.model,
+            "temperature": step.get("temperature", 0.7),
+            "recent_nodes": self.columns[-1]["nodes"] + parent_nodes,
+        }
+        endpoint = "/expand/stream" if step.get("stream") else "/expand"
+        data = await self.request(endpoint, body=body)
+        if data is None:
+            return
+        if endpoint == "/expand/stream":
+            done = [json.loads(line) for line in data.splitlines() if '"done"' in line]
+            children = done[-1].get("children", []) if done else []
+        else:
+            children = data.get("children", [])
+        self.columns.append({"nodes": [c["name"] for c in children if c.get("name")], "selected": None})
+
+    async def analyze(self, step):
+        if not self.columns:
+            return
+        node = self.columns[-1]["selected"] or self.columns[-1]["nodes"][0]
+        modes = step.get("mode", "explain")
+        mode = self.rng.choice(modes) if isinstance(modes, list) else modes
+        await self.request("/analyze", body={
+            "node": node,
+            "context": self.context(),
+            "model": self.model,
+            "mode": mode,
+            "difficulty": step.get("difficulty", "medium"),
+            "num_questions": step.get("num_questions", 3),
+        })
+
+    async def batch(self, step):
+        if not self.columns:
+            return
+        node = self.columns[-1]["selected"] or self.columns[-1]["nodes"][0]
+        await self.request("/analyze/batch", body={
+            "node": node,
+            "context": self.context(),
+            "model": self.model,
+            "modes": step.get("modes", "likely"),
+            "difficulty": step.get("difficulty", "medium"),
+            "num_questions": step.get("num_questions", 3),
+        })
+
+    async def run_steps(self, steps):
+        for step in steps:
+            action = step["action"]
+            if action == "repeat":
+                for _ in range(step.get("times", 1)):
+                    await self.run_steps(step["steps"])
+                continue
+            if action == "think":
+                await self.think(step.get("seconds"))
+                continue
+            if action == "models":
+                await self.request("/models", method="GET")
+            elif action == "expand":
+                await self.expand(step)
+            elif action == "analyze":
+                await self.analyze(step)
+            elif action == "batch":
+                await self.batch(step)
+            else:
+                raise ValueError(f"unknown scenario action: {action}")
+            await self.think()
+
+    async def journey(self, user):
+        self.columns = []
+        await self.run_steps(user["steps"])
+        self.metrics.journeys += 1
+
+
+def pick_user(scenario, rng):
+    users = scenario["users"]
+    return rng.choices(users, weights=[u.get("weight", 1) for u in users])[0]
+
+
+async def run_closed(http, scenario, metrics, users, duration, seed, think_scale):
+    deadline = time.perf_counter() + duration
+
+    async def learner_loop(i):
+        rng = random.Random(seed * 1000 + i)
+        learner = Learner(http, scenario, metrics, rng, think_scale)
+        while time.perf_counter() < deadline:
+            await learner.journey(pick_user(scenario, rng))
+
+    tasks = [asyncio.ensure_future(learner_loop(i)) for i in range(users)]
+    await _finish(tasks, deadline)
+
+
+async def run_open(http, scenario, metrics, rate, duration, seed, think_scale, max_in_flight):
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + duration
+    tasks = set()
+    dropped = 0
+    i = 0
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(rng.expovariate(rate))
+        if len(tasks) >= max_in_flight:
+            # The generator itself must not become the bottleneck
+            dropped += 1
+            continue
+        i += 1
+        learner = Learner(http, scenario, metrics, random.Random(seed * 1000 + i), think_scale)
+        task = asyncio.ensure_future(learner.journey(pick_user(scenario, rng)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await _finish(list(tasks), deadline)
+    return dropped
+
+
+async def _finish(tasks, deadline, grace=60):
+    # Let journeys in progress finish, within reason
+    remaining = max(0.0, deadline - time.perf_counter()) + grace
+    done, pending = await asyncio.wait(tasks, timeout=remaining) if tasks else (set(), set())
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def run_load(scenario, base_url, mode="closed", users=10, rate=1.0, duration=60.0, seed=0,
+                   think_scale=1.0, max_in_flight=1000, transport=None, timeout=300):
+    """Runs one load test and returns its summary dict."""
+    limits = httpx.Limits(max_connections=max(users, max_in_flight), max_keepalive_connections=max(users, 100))
+    metrics = Metrics()
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, transport=transport) as http:
+        if mode == "open":
+            dropped = await run_open(http, scenario, metrics, rate, duration, seed, think_scale, max_in_flight)
+        else:
+            dropped = 0
+            await run_closed(http, scenario, metrics, users, duration, seed, think_scale)
+    metrics.finished = time.perf_counter()
+    summary = metrics.summary()
+    summary.update({
+        "scenario": scenario.get("name", "scenario"),
+        "base_url": base_url,
+        "mode": mode,
+        "users": users if mode == "closed" else None,
+        "rate": rate if mode == "open" else None,
+        "duration": duration,
+        "dropped_arrivals": dropped,
+    })
+    return summary
+
+
+def _fmt(value, unit="s"):
+    return f"{value:.3f}{unit}" if value is not None else "-"
+
+
+def write_report(summary, run_dir):
+    report_path = os.path.join(run_dir, "REPORT.md")
+    load = f"{summary['users']} concurrent users" if summary["mode"] == "closed" else f"{summary['rate']} journeys/s"
+    with open(report_path, "w") as f:
+        f.write("# 🚦 OmniWeb Load Test Report\n\n")
+        f.write(f"**Date:** {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write(f"**Scenario:** {summary['scenario']} | **Target:** {summary['base_url']} | "
+                f"**Mode:** {summary['mode']}-loop, {load} for {summary['duration']}s\n\n")
+        f.write("## Totals\n\n")
+        f.write(f"- Journeys completed: {summary['journeys']}\n")
+        f.write(f"- Requests: {summary['requests']} ({summary['errors']} errors, "
+                f"{summary['error_rate'] * 100:.2f}%)\n")
+        f.write(f"- Throughput: {summary['throughput_rps']:.2f} successful req/s\n")
+        if summary["dropped_arrivals"]:
+            f.write(f"- Dropped arrivals (generator saturated): {summary['dropped_arrivals']}\n")
+        f.write("\n## Per Endpoint\n\n")
+        f.write("| Endpoint | Requests | Errors | Req/s | p50 | p95 | p99 | TTFB p50 | TTFB p95 |\n")
+        f.write("|---|---|---|---|---|---|---|---|---|\n")
+        for endpoint, e in summary["endpoints"].items():
+            ttfb = e["ttfb"] or {}
+            f.write(f"| {endpoint} | {e['requests']} | {e['errors']} ({e['error_rate'] * 100:.1f}%) | "
+                    f"{e['throughput_rps']:.2f} | {_fmt(e['latency']['p50'])} | {_fmt(e['latency']['p95'])} | "
+                    f"{_fmt(e['latency']['p99'])} | {_fmt(ttfb.get('p50'))} | {_fmt(ttfb.get('p95'))} |\n")
+        errors = [(endpoint, msg, n) for endpoint, e in summary["endpoints"].items() for msg, n in e["top_errors"]]
+        if errors:
+            f.write("\n## Errors\n\n")
+            for endpoint, msg, n in errors:
+                f.write(f"- `{endpoint}` {msg}: {n}\n")
+    return report_path
+
+
+def print_summary(summary):
+    print("\n" + "=" * 96)
+    print("🚦 LOAD TEST SUMMARY")
+    print("=" * 96)
+    print(f"{'Endpoint':<16} | {'Reqs':>6} | {'Err%':>6} | {'Req/s':>7} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'TTFB p50':>9}")
+    print("-" * 96)
+    for endpoint, e in summary["endpoints"].items():
+        ttfb = (e["ttfb"] or {}).get("p50")
+        print(f"{endpoint:<16} | {e['requests']:>6} | {e['error_rate'] * 100:>5.1f}% | {e['throughput_rps']:>7.2f} | "
+              f"{_fmt(e['latency']['p50']):>8} | {_fmt(e['latency']['p95']):>8} | {_fmt(e['latency']['p99']):>8} | "
+              f"{_fmt(ttfb):>9}")
+    print("=" * 96)
+    print(f"{summary['journeys']} journeys, {summary['requests']} requests, "
+          f"{summary['throughput_rps']:.2f} req/s, {summary['error_rate'] * 100:.2f}% errors")
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return True
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    return False
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_backend(port, ollama_base=None, workers=1):
+    env = dict(os.environ)
+    if ollama_base:
+        env["OLLAMA_BASE"] = ollama_base
+    args = [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(args, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if not wait_for(f"http://127.0.0.1:{port}/models"):
+        process.kill()
+        raise RuntimeError("backend did not start")
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the OmniWeb backend with scenario-driven learners")
+    parser.add_argument("scenario", help="Scenario JSON file")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent learners (closed loop)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Journey arrivals per second (open loop)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to apply load")
+    parser.add_argument("--think-scale", type=float, default=1.0, help="Multiplier on scenario think times")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Open-loop cap on concurrent journeys")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spawn", action="store_true", help="Start a backend (uvicorn server:app) for the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --spawn")
+    parser.add_argument("--fake-ollama", action="store_true", help="With --spawn: back it with fake_ollama.py")
+    parser.add_argument("--fake-ttft", type=float, default=0.2)
+    parser.add_argument("--fake-tps", type=float, default=40.0)
+    parser.add_argument("--fake-slots", type=int, default=4)
+    parser.add_argument("--fake-port", type=int, default=0, help="Port for the fake Ollama (0 = any free port)")
+    args = parser.parse_args()
+
+    with open(args.scenario) as f:
+        scenario = json.load(f)
+
+    fake = backend = None
+    base_url = args.base_url
+    try:
+        if args.spawn:
+            ollama_base = None
+            if args.fake_ollama:
+                from fake_ollama import FakeOllamaProcess
+                fake = FakeOllamaProcess(port=args.fake_port or free_port(), ttft=args.fake_ttft, tps=args.fake_tps,
+                                         slots=args.fake_slots)
+                fake.__enter__()
+                ollama_base = fake.base_url
+            port = int(base_url.rsplit(":", 1)[-1].strip("/"))
+            backend = spawn_backend(port, ollama_base, args.workers)
+
+        print(f"🚦 {args.mode}-loop load on {base_url} for {args.duration}s ({scenario.get('name', args.scenario)})")
+        summary = asyncio.run(run_load(
+            scenario, base_url, mode=args.mode, users=args.users, rate=args.rate, duration=args.duration,
+            seed=args.seed, think_scale=args.think_scale, max_in_flight=args.max_in_flight,
+        ))
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait(timeout=10)
+        if fake is not None:
+            fake.__exit__(None, None, None)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_dir = os.path.join(OUTPUT_BASE_DIR, f"run_{timestamp}")
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, "results.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    print_summary(summary)
+    report = write_report(summary, run_dir)
+    print(f"\n💾 Results saved to {run_dir}/results.json")
+    print(f"📄 Report generated at: {report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+In-process metrics in the Prometheus text exposition format, served at
+/metrics. Recording is a dict lookup plus an add (histograms: a bisect),
+so it can sit on the streaming path; formatting happens only on scrape.
+"""
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+TOKEN_COUNT_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = f'le="{_number(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """
+    Holds metrics recorded as things happen, plus collectors: callables run
+    at scrape time that return (name, kind, help, [(labels dict, value)])
+    tuples, for numbers other components already keep (cache hits, queues).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "omniweb_http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status"))
+HTTP_LATENCY = registry.histogram(
+    "omniweb_http_request_duration_seconds", "Time until the last byte of the response, streams included.",
+    ("route", "method"))
+HTTP_IN_FLIGHT = registry.gauge("omniweb_http_requests_in_flight", "Requests being handled.")
+HTTP_STREAMS = registry.gauge(
+    "omniweb_http_streams_in_flight", "Streaming responses still sending.", ("route",))
+
+OLLAMA_REQUESTS = registry.counter(
+    "omniweb_ollama_requests_total", "Ollama generations by model, API and outcome.", ("model", "api", "outcome"))
+OLLAMA_LATENCY = registry.histogram(
+    "omniweb_ollama_request_duration_seconds", "Upstream Ollama generation time.", ("model", "api"))
+OLLAMA_TTFT = registry.histogram(
+    "omniweb_ollama_ttft_seconds", "Time to the first generated token of streamed generations.", ("model",),
+    TTFT_BUCKETS)
+OLLAMA_LOAD = registry.histogram(
+    "omniweb_ollama_load_duration_seconds", "Model load time Ollama reported (load_duration).", ("model",),
+    TTFT_BUCKETS)
+OLLAMA_EVAL_COUNT = registry.histogram(
+    "omniweb_ollama_eval_count", "Generated tokens per request (eval_count).", ("model",), TOKEN_COUNT_BUCKETS)
+OLLAMA_PROMPT_TOKENS = registry.counter(
+    "omniweb_ollama_prompt_tokens_total", "Prompt tokens Ollama evaluated (prompt_eval_count).", ("model",))
+OLLAMA_TOKENS_PER_SECOND = registry.histogram(
+    "omniweb_ollama_tokens_per_second", "Generation speed, eval_count / eval_duration.", ("model",),
+    TOKENS_PER_SECOND_BUCKETS)
+OLLAMA_STREAMS = registry.gauge(
+    "omniweb_ollama_streams_in_flight", "Open streaming generations to Ollama.", ("model",))
+
+EXPAND_FALLBACKS = registry.counter(
+    "omniweb_expand_fallbacks_total",
+    "Fallback models started by /expand: after a failure, or hedged after EXPAND_HEDGE_DELAY.", ("reason",))
+JSON_PARSE_FAILURES = registry.counter(
+    "omniweb_json_parse_failures_total", "Model output robust_json_parser could not turn into JSON.", ("endpoint",))
+
+
+def record_generation(model, api, final, started, ttft=None):
+    """Observes one finished Ollama generation from its final (done) response."""
+    model = model or "unknown"
+    OLLAMA_REQUESTS.labels(model, api, "ok").inc()
+    OLLAMA_LATENCY.labels(model, api).observe(time.perf_counter() - started)
+    if ttft is not None:
+        OLLAMA_TTFT.labels(model).observe(ttft)
+    load = final.get("load_duration")
+    if load:
+        OLLAMA_LOAD.labels(model).observe(load / 1e9)
+    eval_count = final.get("eval_count")
+    if eval_count:
+        OLLAMA_EVAL_COUNT.labels(model).observe(eval_count)
+        eval_duration = final.get("eval_duration")
+        if eval_duration:
+            OLLAMA_TOKENS_PER_SECOND.labels(model).observe(eval_count / (eval_duration / 1e9))
+    prompt_tokens = final.get("prompt_eval_count")
+    if prompt_tokens:
+        OLLAMA_PROMPT_TOKENS.labels(model).inc(prompt_tokens)
+
+
+def record_generation_error(model, api, outcome="error"):
+    OLLAMA_REQUESTS.labels(model or "unknown", api, outcome).inc()
+
+
+def route_label(scope):
+    # The matched route template keeps label cardinality bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no response buffering) recording per-route counts
+    and latency. A response without Content-Length counts as a stream while
+    it is being sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "stream": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                if not any(name == b"content-length" for name, _ in message.get("headers", ())):
+                    state["stream"] = route_label(scope)
+                    HTTP_STREAMS.labels(state["stream"]).inc()
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            if state["stream"] is not None:
+                HTTP_STREAMS.labels(state["stream"]).dec()
+            route = route_label(scope)
+            HTTP_REQUESTS.labels(route, scope["method"], str(state["status"])).inc()
+            HTTP_LATENCY.labels(route, scope["method"]).observe(time.perf_counter() - start)
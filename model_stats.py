@@ -0,0 +1,127 @@
+import math
+
+
+class _ModelRecord:
+    __slots__ = ("attempts", "successes", "latency")
+
+    def __init__(self):
+        self.attempts = 0
+        self.successes = 0
+        self.latency = None
+
+
+class ModelStats:
+    """
+    Tracks how often each model returns usable JSON and how fast it does so.
+    Used to rank fallback candidates instead of relying on tag-list order.
+    """
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self._models = {}
+
+    def record(self, model, success, latency):
+        rec = self._models.get(model)
+        if rec is None:
+            rec = self._models[model] = _ModelRecord()
+        rec.attempts += 1
+        if success:
+            rec.successes += 1
+        # Exponentially weighted so recent behaviour dominates
+        if rec.latency is None:
+            rec.latency = latency
+        else:
+            rec.latency = self.alpha * latency + (1 - self.alpha) * rec.latency
+
+    def success_rate(self, model):
+        rec = self._models.get(model)
+        if rec is None:
+            return 0.5
+        # Laplace smoothing keeps one lucky call from dominating
+        return (rec.successes + 1) / (rec.attempts + 2)
+
+    def latency(self, model):
+        rec = self._models.get(model)
+        return rec.latency if rec and rec.latency is not None else math.inf
+
+    def rank(self, models):
+        return sorted(models, key=lambda m: (-self.success_rate(m), self.latency(m)))
+
+    def stats(self):
+        return {
+            model: {
+                "attempts": rec.attempts,
+                "successes": rec.successes,
+                "success_rate": round(self.success_rate(model), 4),
+                "latency_ewma": round(rec.latency, 3) if rec.latency is not None else None,
+            }
+            for model, rec in self._models.items()
+        }
+
+
+class ConstraintStats:
+    """
+    Counts, per endpoint, how often a generation produced usable JSON with
+    and without schema-constrained decoding. Each failed generation costs
+    a fallback generation (expand) or a failed lesson (history/quiz), so the
+    gap between the two failure rates is the retries constraint mode avoids.
+    """
+
+    def __init__(self):
+        # endpoint -> {"constrained" | "free": [requests, first_try_ok]}
+        self._counts = {}
+
+    def record(self, endpoint, constrained, first_try_ok):
+        modes = self._counts.setdefault(endpoint, {"constrained": [0, 0], "free": [0, 0]})
+        counts = modes["constrained" if constrained else "free"]
+        counts[0] += 1
+        if first_try_ok:
+            counts[1] += 1
+
+    def stats(self):
+        result = {}
+        for endpoint, modes in self._counts.items():
+            entry = {}
+            for mode, (requests, ok) in modes.items():
+                entry[mode] = {
+                    "requests": requests,
+                    "first_try_ok": ok,
+                    "retries": requests - ok,
+                    "failure_rate": round((requests - ok) / requests, 4) if requests else None,
+                }
+            con, free = entry["constrained"], entry["free"]
+            # Estimate needs a free-form baseline (e.g. from a run with constraints off)
+            entry["retries_avoided"] = None
+            if con["requests"] and free["requests"]:
+                expected = con["requests"] * free["failure_rate"]
+                entry["retries_avoided"] = round(expected - con["retries"], 1)
+            result[endpoint] = entry
+        return result
+
+
+class PromptEvalStats:
+    """
+    Prompt evaluation cost reported by Ollama (prompt_eval_count and
+    prompt_eval_duration) per prompt style and path depth, to show how much
+    prefix reuse saves as the tree gets deeper.
+    """
+
+    def __init__(self):
+        # (style, depth) -> [requests, prompt tokens, prompt eval ns]
+        self._totals = {}
+
+    def record(self, style, depth, response):
+        totals = self._totals.setdefault((style, depth), [0, 0, 0])
+        totals[0] += 1
+        totals[1] += response.get("prompt_eval_count") or 0
+        totals[2] += response.get("prompt_eval_duration") or 0
+
+    def stats(self):
+        result = {}
+        for (style, depth), (requests, tokens, duration) in sorted(self._totals.items()):
+            result.setdefault(style, {})[str(depth)] = {
+                "requests": requests,
+                "avg_prompt_tokens": round(tokens / requests, 1),
+                "avg_prompt_eval_ms": round(duration / requests / 1e6, 2),
+            }
+        return result
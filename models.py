@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 
 class ExpandRequest(BaseModel):
     node: str
@@ -7,6 +7,20 @@ class ExpandRequest(BaseModel):
     model: str
     temperature: float
     recent_nodes: List[str] = []
+    bypass_cache: bool = False
+    session_id: Optional[str] = None
+
+
+class ExpandSiblingsRequest(BaseModel):
+    # The parent node whose children form the column
+    node: str
+    context: str
+    model: str
+    temperature: float
+    # The column to expand, and the column the parent sits in, as the
+    # frontend sends them when one of the children is clicked
+    children: List[str]
+    parent_column: List[str] = []
 
 
 class AnalysisRequest(BaseModel):
@@ -16,6 +30,21 @@ class AnalysisRequest(BaseModel):
     mode: str
     difficulty: Optional[str] = "medium"
     num_questions: Optional[int] = 3
+    bypass_cache: bool = False
+    structured: bool = False
+
+
+class LessonBatchRequest(BaseModel):
+    node: str
+    context: str
+    model: str
+    # A list of modes, "all", or "likely" (LESSON_LIKELY_MODES)
+    modes: Union[List[str], str] = "likely"
+    difficulty: Optional[str] = "medium"
+    num_questions: Optional[int] = 3
+    bypass_cache: bool = False
+    # False: generate into the lesson cache in the background and return 202
+    stream: bool = True
 
 
 class RandomTopicRequest(BaseModel):
@@ -0,0 +1,192 @@
+import json
+import time
+import asyncio
+import httpx
+
+from config import (
+    OLLAMA_BASE,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE,
+    OLLAMA_KEEPALIVE_EXPIRY,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_WRITE_TIMEOUT,
+    OLLAMA_POOL_TIMEOUT,
+    MODEL_KEEP_ALIVE,
+    DEFAULT_KEEP_ALIVE,
+)
+import tracing
+from metrics import OLLAMA_STREAMS, record_generation, record_generation_error
+
+
+def model_tag(name):
+    # Ollama reports "llama3" as "llama3:latest"
+    return name if ":" in name else f"{name}:latest"
+
+
+def response_text(chunk):
+    """Generated text of a /api/generate or /api/chat response (or stream chunk)."""
+    if "message" in chunk:
+        return (chunk.get("message") or {}).get("content", "")
+    return chunk.get("response", "")
+
+
+def make_timeout(read):
+    return httpx.Timeout(
+        connect=OLLAMA_CONNECT_TIMEOUT,
+        read=read,
+        write=OLLAMA_WRITE_TIMEOUT,
+        pool=OLLAMA_POOL_TIMEOUT,
+    )
+
+
+class OllamaClient:
+    """
+    Async Ollama client shared by every endpoint.
+    Holds one keep-alive connection pool so requests do not pay a TCP
+    handshake each time, and never block a threadpool worker while waiting.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE, transport=None,
+                 max_connections=OLLAMA_MAX_CONNECTIONS,
+                 max_keepalive=OLLAMA_MAX_KEEPALIVE,
+                 keep_alive=MODEL_KEEP_ALIVE, default_keep_alive=DEFAULT_KEEP_ALIVE):
+        self.base_url = base_url
+        self.transport = transport
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        )
+        # How long Ollama keeps each model loaded after a request; None
+        # leaves it to the Ollama server's OLLAMA_KEEP_ALIVE
+        self.keep_alive = {model_tag(m): v for m, v in (keep_alive or {}).items()}
+        self.default_keep_alive = default_keep_alive
+        self._http = None
+
+    def keep_alive_for(self, model):
+        return self.keep_alive.get(model_tag(model or ""), self.default_keep_alive)
+
+    def _prepare(self, payload, stream):
+        payload = {**payload, "stream": stream}
+        if "keep_alive" not in payload:
+            keep_alive = self.keep_alive_for(payload.get("model"))
+            if keep_alive is not None:
+                payload["keep_alive"] = keep_alive
+        return payload
+
+    @property
+    def http(self):
+        # Created lazily so the pool is bound to the running event loop
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=make_timeout(60),
+                transport=self.transport,
+            )
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+    async def tags(self, timeout=5):
+        res = await self.http.get("/api/tags", timeout=make_timeout(timeout))
+        res.raise_for_status()
+        return res.json()
+
+    async def ps(self, timeout=5):
+        res = await self.http.get("/api/ps", timeout=make_timeout(timeout))
+        res.raise_for_status()
+        return res.json()
+
+    async def generate(self, payload, timeout=60):
+        return await self._post("/api/generate", "generate", payload, timeout)
+
+    async def chat(self, payload, timeout=60):
+        return await self._post("/api/chat", "chat", payload, timeout)
+
+    async def _post(self, path, api, payload, timeout):
+        payload = self._prepare(payload, stream=False)
+        started = time.perf_counter()
+        try:
+            res = await self.http.post(path, json=payload, timeout=make_timeout(timeout))
+            res.raise_for_status()
+            data = res.json()
+        except asyncio.CancelledError:
+            record_generation_error(payload.get("model"), api, "cancelled")
+            _trace(payload.get("model"), api, started, "cancelled")
+            raise
+        except Exception as e:
+            record_generation_error(payload.get("model"), api)
+            _trace(payload.get("model"), api, started, type(e).__name__)
+            raise
+        record_generation(payload.get("model"), api, data, started)
+        _trace(payload.get("model"), api, started, "ok", data)
+        return data
+
+    def stream_generate(self, payload, timeout=120):
+        """
+        Yields each decoded JSON chunk of a streaming /api/generate call.
+        Undecodable lines are skipped.
+        """
+        return self._stream("/api/generate", "generate", payload, timeout)
+
+    def stream_chat(self, payload, timeout=120):
+        return self._stream("/api/chat", "chat", payload, timeout)
+
+    async def _stream(self, path, api, payload, timeout):
+        payload = self._prepare(payload, stream=True)
+        model = payload.get("model") or "unknown"
+        started = time.perf_counter()
+        ttft = None
+        final = None
+        streams = OLLAMA_STREAMS.labels(model)
+        streams.inc()
+        try:
+            async with self.http.stream("POST", path, json=payload, timeout=make_timeout(timeout)) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    # Kept to two dict lookups per chunk; the rest happens once at the end
+                    if ttft is None and response_text(chunk):
+                        ttft = time.perf_counter() - started
+                    if chunk.get("done"):
+                        final = chunk
+                    yield chunk
+        except GeneratorExit:
+            # The consumer stopped early (e.g. the JSON document closed)
+            record_generation(model, api, final or {}, started, ttft)
+            _trace(model, api, started, "ok" if final else "closed", final, ttft)
+            raise
+        except asyncio.CancelledError:
+            record_generation_error(model, api, "cancelled")
+            _trace(model, api, started, "cancelled", final, ttft)
+            raise
+        except BaseException as e:
+            record_generation_error(model, api)
+            _trace(model, api, started, type(e).__name__, final, ttft)
+            raise
+        else:
+            record_generation(model, api, final or {}, started, ttft)
+            _trace(model, api, started, "ok", final, ttft)
+        finally:
+            streams.dec()
+
+
+def _trace(model, api, started, outcome, final=None, ttft=None):
+    # Recorded after the fact: a span opened inside the stream generator
+    # would leak into the consumer's context between chunks
+    attrs = tracing.ollama_attrs(final) if final else {}
+    if ttft is not None:
+        attrs["ttft_ms"] = round(ttft * 1000, 2)
+    tracing.record("ollama." + api, time.perf_counter() - started, model=model, outcome=outcome, **attrs)
+
+
+ollama = OllamaClient()
@@ -40,6 +40,8 @@ const LearningWorkspace = ({ model, initialTopic, onExit, addToast }) => {
   const scrollRef = useRef(null);
   const endRef = useRef(null);
   const abortControllerRef = useRef(null);
+  // Lets the backend tie clicks together for speculative prefetching
+  const sessionIdRef = useRef(Math.random().toString(36).slice(2));
   const lessonDataRef = useRef(lessonData);
 
   useEffect(() => {
@@ -97,7 +99,8 @@ const LearningWorkspace = ({ model, initialTopic, onExit, addToast }) => {
         context: contextPath,
         model: model,
         temperature: 0.5,
-        recent_nodes: recentNodes
+        recent_nodes: recentNodes,
+        session_id: sessionIdRef.current
       });
 
       if (res.data.children && res.data.children.length > 0) {
@@ -145,7 +148,9 @@ const LearningWorkspace = ({ model, initialTopic, onExit, addToast }) => {
             context: contextPath,
             model: model,
             temperature: 0.7,
-            recent_nodes: avoidList
+            recent_nodes: avoidList,
+            bypass_cache: true,
+            session_id: sessionIdRef.current
         });
 
         if (res.data.children && res.data.children.length > 0) {
@@ -0,0 +1,70 @@
+import os
+import json
+import time
+
+from ollama_client import model_tag
+
+# Options benchmark_tune.py sweeps. Sampling options such as temperature
+# stay under the endpoints' control.
+TUNABLE_OPTIONS = ("num_ctx", "num_batch", "num_thread", "num_predict")
+PURPOSES = ("expand", "lesson")
+
+# What the endpoints send before tuning; /expand takes its temperature from the request
+EXPAND_NUM_CTX = 4096
+LESSON_TEMPERATURE = 0.6
+
+
+class OptionsProfile:
+    """
+    Tuned Ollama options per model and purpose ("expand" or "lesson"), as
+    written by benchmark_tune.py:
+
+        {"models": {"llama3:latest": {"expand": {"num_ctx": 2048, "num_batch": 512}, ...}}}
+
+    apply() lays a model's tuned options over an endpoint's defaults; models
+    without an entry keep the defaults.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.models = {}
+        self.loaded_at = None
+        self.error = None
+
+    def load(self):
+        """Reads the profile; a missing file means no tuning, a broken one is reported and ignored."""
+        self.models = {}
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.models = {
+                model_tag(model): {
+                    purpose: {k: int(v) for k, v in options.items() if k in TUNABLE_OPTIONS and v is not None}
+                    for purpose, options in purposes.items() if purpose in PURPOSES
+                }
+                for model, purposes in data.get("models", {}).items()
+            }
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.error = str(e)
+            self.models = {}
+            print(f"❌ Could not load tuned options from {self.path}: {e}")
+            return False
+        self.error = None
+        self.loaded_at = time.time()
+        print(f"🎛️ Loaded tuned options for {len(self.models)} model(s) from {self.path}")
+        return True
+
+    def apply(self, model, purpose, options):
+        tuned = self.models.get(model_tag(model), {}).get(purpose)
+        return {**options, **tuned} if tuned else options
+
+    def expand_options(self, model, temperature):
+        return self.apply(model, "expand", {"temperature": temperature, "num_ctx": EXPAND_NUM_CTX})
+
+    def lesson_options(self, model):
+        return self.apply(model, "lesson", {"temperature": LESSON_TEMPERATURE})
+
+    def stats(self):
+        return {"path": self.path, "loaded_at": self.loaded_at, "error": self.error, "models": self.models}
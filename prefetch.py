@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def predict_child_request(req, child_name, children, parent_column, temperature=None):
+    """
+    Builds the /expand request the frontend will send when the user clicks
+    `child_name`. LearningWorkspace sends the clicked column's nodes followed
+    by the previous column's nodes as recent_nodes, and the selected path
+    (ending in the clicked node) as context. A click always sends the same
+    temperature, so a regenerated parent (sent hotter) must not pass its own on.
+    """
+    return req.model_copy(update={
+        "node": child_name,
+        "context": f"{req.context} > {child_name}" if req.context else child_name,
+        "recent_nodes": list(children) + list(parent_column),
+        "temperature": req.temperature if temperature is None else temperature,
+        "bypass_cache": False,
+    })
+
+
+class _Session:
+    def __init__(self):
+        self.epoch = 0
+        # node name (lowercased) -> names of the column it was shown in
+        self.columns = OrderedDict()
+        self.running = {}
+
+    def remember_column(self, names, limit=256):
+        for name in names:
+            self.columns[name.lower()] = names
+            self.columns.move_to_end(name.lower())
+        while len(self.columns) > limit:
+            self.columns.popitem(last=False)
+
+
+class _Job:
+    def __init__(self, session_id, epoch, req, key, depth):
+        self.session_id = session_id
+        self.epoch = epoch
+        self.req = req
+        self.key = key
+        self.depth = depth
+
+
+class Prefetcher:
+    """
+    Expands the children of a just-returned /expand response in the
+    background so the user's next click is a cache hit.
+
+    Jobs sit in a bounded priority queue (shallower first) and only start
+    while fewer than `max_live` user requests are in flight. A new live
+    expansion in the same session invalidates that session's queued and
+    running jobs, except the one matching the live request.
+    """
+
+    def __init__(self, expand, key_fn, queue_size=64, workers=1, width=5, depth=1,
+                 max_live=1, max_sessions=1000, idle_poll=0.05, temperature=None):
+        self.expand = expand
+        self.key_fn = key_fn
+        self.queue_size = queue_size
+        self.workers = workers
+        self.width = width
+        self.depth = depth
+        self.max_live = max_live
+        self.max_sessions = max_sessions
+        self.idle_poll = idle_poll
+        self.temperature = temperature
+        self.live = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self._queue = None
+        self._sessions = OrderedDict()
+        self._tasks = []
+        self._seq = itertools.count()
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for session in self._sessions.values():
+            for task in session.running.values():
+                task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    @contextmanager
+    def live_request(self):
+        self.live += 1
+        try:
+            yield
+        finally:
+            self.live -= 1
+
+    def is_idle(self):
+        return self.live < self.max_live
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                for task in evicted.running.values():
+                    task.cancel()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def navigate(self, session_id, keep=None):
+        session = self._session(session_id)
+        session.epoch += 1
+        for key, task in list(session.running.items()):
+            if key != keep:
+                task.cancel()
+                self.cancelled += 1
+
+    def schedule(self, req, data, depth=1):
+        if self._queue is None or depth > self.depth or not req.session_id:
+            return
+        names = [c.get("name") for c in (data or {}).get("children", []) if c.get("name")]
+        if not names:
+            return
+
+        session = self._session(req.session_id)
+        parent_column = session.columns.get(req.node.lower(), [req.node])
+        session.remember_column(names)
+
+        for name in names[:self.width]:
+            child_req = predict_child_request(req, name, names, parent_column, self.temperature)
+            job = _Job(req.session_id, session.epoch, child_req, self.key_fn(child_req), depth)
+            try:
+                self._queue.put_nowait((depth, next(self._seq), job))
+            except asyncio.QueueFull:
+                self.dropped += 1
+                break
+
+    def _is_stale(self, job):
+        session = self._sessions.get(job.session_id)
+        return session is None or session.epoch != job.epoch
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                print(f"Prefetch of [{job.req.node}] failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        while not self.is_idle():
+            await asyncio.sleep(self.idle_poll)
+        if self._is_stale(job):
+            self.cancelled += 1
+            return
+
+        print(f"🔮 Prefetching [{job.req.node}]")
+        session = self._sessions[job.session_id]
+        task = asyncio.ensure_future(self.expand(job.req))
+        session.running[job.key] = task
+        try:
+            await asyncio.wait({task})
+        finally:
+            if session.running.get(job.key) is task:
+                del session.running[job.key]
+
+        if task.cancelled():
+            return
+        data = task.result()
+        self.completed += 1
+        if not self._is_stale(job):
+            self.schedule(job.req, data, depth=job.depth + 1)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "live": self.live,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "dropped": self.dropped,
+        }
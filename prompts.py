@@ -0,0 +1,229 @@
+"""
+Prompt builders for /expand and /analyze, shared with the benchmark suite.
+"""
+
+LESSON_MODES = (
+    "explain", "history", "impact", "eli5", "future", "code",
+    "proscons", "debate", "glossary", "sources", "quiz",
+)
+
+
+def lesson_tasks(req):
+    return {
+        "explain": f"Teach '{req.node}' to a beginner. Use a clear analogy (formatted as a > blockquote) to explain the core concept. Then detail how it works.",
+        "history": f"Provide a historical timeline of '{req.node}'. Return a JSON array where each element has 'year', 'title', and 'description'. Do not use Markdown or code blocks.",
+        "impact": f"Analyze the significance of '{req.node}'. Why does it matter to humanity or the universe? What are the ethical or practical implications?",
+        "eli5": f"Explain '{req.node}' to a 5-year-old. Use simple words and fun examples.",
+        "future": f"Speculate on the future of '{req.node}'. What advances or changes can we expect in the next 50 years?",
+        "code": f"Provide a code example or technical demonstration related to '{req.node}'. If it is a programming concept, show code. If it is a scientific concept, show a formula or a simulation algorithm. Use proper markdown code blocks.",
+        "proscons": f"Analyze the Pros and Cons of '{req.node}'. Present them in a clear Markdown table or list.",
+        "debate": f"Simulate a short debate between two experts holding opposing views on '{req.node}'. Label them as 'Proponent' and 'Skeptic'.",
+        "glossary": f"Create a comprehensive Glossary of Key Terms related to '{req.node}'. Format as a Markdown list where the term is bolded (e.g., - **Term**: Definition). Include at least 10 terms.",
+        "sources": f"List 5-10 essential books, research papers, or primary sources to learn more about '{req.node}'. Format as a Markdown list with brief annotations explaining why each source is important.",
+        "quiz": f"Create a {req.num_questions}-question multiple choice quiz about '{req.node}'. Difficulty: {req.difficulty}. Return ONLY valid JSON. The JSON should be an object with a key 'questions' which is a list of objects. Each question object must have: 'question' (string), 'options' (list of 4 strings), 'correct_index' (integer 0-3), and 'explanation' (string). Do not use markdown formatting."
+    }
+
+
+def normalize_mode(mode):
+    mode = mode.lower() if mode else "explain"
+    if mode not in LESSON_MODES:
+        print(f"⚠️ Invalid mode '{mode}' requested. Defaulting to 'explain'.")
+        mode = "explain"
+    return mode
+
+
+def build_lesson_prompt(req):
+    if req.mode == "history":
+        return f"""
+        You are a Historian.
+
+        Context: {req.context}
+        Topic: {req.node}
+
+        Task: Create a historical timeline of key events for "{req.node}", considering the context "{req.context}".
+
+        Requirements:
+        1. Return ONLY a valid JSON Array.
+        2. Do NOT use markdown code blocks (```json ... ```).
+        3. Do NOT include any text before or after the JSON.
+        4. Each element in the array must be an object with "year" (string), "title" (string), and "description" (string).
+
+        Example:
+        [
+            {{ "year": "1905", "title": "Special Relativity", "description": "Einstein publishes his paper..." }}
+        ]
+        """
+    elif req.mode == "quiz":
+        difficulty_guidance = {
+            "easy": "Focus on basic facts and definitions.",
+            "medium": "Focus on conceptual understanding and connections.",
+            "hard": "Focus on complex analysis, edge cases, and synthesis of ideas."
+        }.get(req.difficulty, "Focus on conceptual understanding.")
+
+        return f"""
+        You are a Professor creating an exam.
+
+        Context: {req.context}
+        Topic: {req.node}
+        Difficulty: {req.difficulty}
+
+        Task: Create a {req.num_questions}-question multiple choice quiz.
+
+        Requirements:
+        1. Return ONLY valid JSON.
+        2. Do NOT use markdown code blocks.
+        3. The root object must have a key "questions" containing a list of question objects.
+        4. Each question object must have:
+           - "question": The question text.
+           - "options": An array of exactly 4 strings.
+           - "correct_index": Integer (0-3).
+           - "explanation": Brief explanation of the answer.
+
+        Difficulty Guidance: {difficulty_guidance}
+        """
+    return f"""
+        You are an Expert Tutor.
+
+        Context: {req.context}
+        Topic: {req.node}
+        Task: {lesson_tasks(req)[req.mode]}
+
+        Guidelines:
+        - All explanations must be strictly framed within the provided Context.
+        - Style: Engaging, clear, and educational.
+        - Use Markdown for structure: headers (#, ##), bold (**), lists (-).
+        - Do NOT simply dump information; teach the concept.
+
+        VISUAL AIDS:
+        If a specific diagram or image would help (e.g., anatomy, maps, blueprints), insert a tag on its own line:
+        [Image of <specific search query>]
+
+        Use this sparingly and only when necessary.
+        """
+
+
+EXPAND_PROMPT_TEMPLATE = """
+    You are an Expert Curriculum Designer.
+
+    Current Subject: {node}
+    Context Path: {context}
+
+    Your goal is to identify 5 distinct sub-topics or learning paths that drill down into "{node}".
+    These sub-topics must be strictly hierarchical children of "{node}", assuming the user has already studied the parent topics in the context path.
+
+    RULES:
+    1. Output MUST be valid, parseable JSON.
+    2. Do not include any introductory text, markdown formatting, or code blocks. Just the raw JSON string.
+    3. The JSON root must be an object with a single key "children" containing a list of objects.
+    4. Each child object must have:
+        - "name": Concise academic title (max 4 words).
+        - "desc": Brief definition (max 20 words).
+        - "status": One of ["concept", "entity", "process"].
+    {exclusion}
+
+    Example Output:
+    {{
+        "children": [
+            {{ "name": "Subtopic Name", "desc": "Brief description.", "status": "concept" }},
+            ...
+        ]
+    }}
+    """
+
+
+def build_expand_prompt(req):
+    # Use full context to ensure deep relevance
+    full_context = req.context
+
+    exclusion_text = ""
+    if req.recent_nodes:
+        exclusion_text = f"5. AVOID using these words/topics: {', '.join(req.recent_nodes)}"
+
+    return EXPAND_PROMPT_TEMPLATE.format(
+        node=req.node,
+        context=full_context,
+        exclusion=exclusion_text
+    )
+
+
+SIBLINGS_PROMPT_TEMPLATE = """
+    You are an Expert Curriculum Designer.
+
+    Context Path: {context}
+    Sibling Subjects: {subjects}
+
+    For EACH sibling subject, identify 5 distinct sub-topics or learning paths that drill down into it.
+    These sub-topics must be strictly hierarchical children of their subject, assuming the user has already studied the parent topics in the context path.
+
+    RULES:
+    1. Output MUST be valid, parseable JSON.
+    2. Do not include any introductory text, markdown formatting, or code blocks. Just the raw JSON string.
+    3. The JSON root must be an object with a single key "siblings" that maps every sibling subject, spelled exactly as given, to a list of child objects.
+    4. Each child object must have:
+        - "name": Concise academic title (max 4 words).
+        - "desc": Brief definition (max 20 words).
+        - "status": One of ["concept", "entity", "process"].
+    {exclusion}
+
+    Example Output:
+    {{
+        "siblings": {{
+            "First Subject": [
+                {{ "name": "Subtopic Name", "desc": "Brief description.", "status": "concept" }},
+                ...
+            ],
+            ...
+        }}
+    }}
+    """
+
+
+def build_siblings_prompt(req, names):
+    exclusion_text = ""
+    recent = list(req.children) + list(req.parent_column)
+    if recent:
+        exclusion_text = f"5. AVOID using these words/topics: {', '.join(recent)}"
+    return SIBLINGS_PROMPT_TEMPLATE.format(
+        context=req.context,
+        subjects=", ".join(f'"{n}"' for n in names),
+        exclusion=exclusion_text,
+    )
+
+
+# Chat form of the same prompt. Everything that does not depend on the node
+# lives in the system message so it is a byte-identical prefix for every
+# request; each level of the path is one user/assistant turn after it.
+EXPAND_SYSTEM_PROMPT = """
+    You are an Expert Curriculum Designer.
+
+    For each subject the user names, identify 5 distinct sub-topics or learning paths that drill down into it.
+    These sub-topics must be strictly hierarchical children of the subject, assuming the user has already studied the parent topics in the context path.
+
+    RULES:
+    1. Output MUST be valid, parseable JSON.
+    2. Do not include any introductory text, markdown formatting, or code blocks. Just the raw JSON string.
+    3. The JSON root must be an object with a single key "children" containing a list of objects.
+    4. Each child object must have:
+        - "name": Concise academic title (max 4 words).
+        - "desc": Brief definition (max 20 words).
+        - "status": One of ["concept", "entity", "process"].
+
+    Example Output:
+    {
+        "children": [
+            { "name": "Subtopic Name", "desc": "Brief description.", "status": "concept" },
+            ...
+        ]
+    }
+    """
+
+EXPAND_TURN_TEMPLATE = """Current Subject: {node}
+Context Path: {context}
+{exclusion}"""
+
+
+def build_expand_turn(req):
+    exclusion_text = ""
+    if req.recent_nodes:
+        exclusion_text = f"AVOID using these words/topics: {', '.join(req.recent_nodes)}"
+    return EXPAND_TURN_TEMPLATE.format(node=req.node, context=req.context, exclusion=exclusion_text).strip()
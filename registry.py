@@ -0,0 +1,122 @@
+import time
+import asyncio
+from starlette.concurrency import run_in_threadpool
+
+from utils import get_gpu_vram
+
+
+class ModelRegistry:
+    """
+    Cached view of the models Ollama has installed (/api/tags) and loaded
+    (/api/ps), plus the detected VRAM.
+
+    Reads never wait on Ollama once a snapshot exists: a stale snapshot is
+    served while a refresh runs in the background (stale-while-revalidate).
+    A failed refresh keeps the last good snapshot.
+    """
+
+    def __init__(self, client, refresh_interval=30.0):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.vram = None
+        self.updated_at = None
+        self.last_error = None
+        self.ps_error = None
+        self._models = None
+        self._vram_loaded = False
+        self._refreshing = None
+        self._loop_task = None
+
+    async def start(self):
+        self._loop_task = asyncio.ensure_future(self._refresh_loop())
+
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+    def clear(self):
+        self._models = None
+        self.updated_at = None
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    def refresh(self):
+        # Concurrent callers share one in-flight refresh
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        return asyncio.shield(self._refreshing)
+
+    async def _refresh(self):
+        if not self._vram_loaded:
+            # nvidia-smi / sysctl are blocking subprocess calls
+            self.vram = await run_in_threadpool(get_gpu_vram)
+            self._vram_loaded = True
+
+        tags, ps = await asyncio.gather(
+            self.client.tags(timeout=5), self.client.ps(timeout=5), return_exceptions=True
+        )
+        if isinstance(tags, Exception):
+            self.last_error = str(tags)
+            print(f"Model registry refresh failed: {tags}")
+            return self._models
+
+        loaded = {}
+        if isinstance(ps, Exception):
+            self.ps_error = str(ps)
+        else:
+            self.ps_error = None
+            loaded = {m.get("name"): m for m in ps.get("models", []) if m.get("name")}
+
+        models = []
+        for m in tags.get("models", []):
+            name = m.get("name")
+            if not name:
+                continue
+
+            size_bytes = m.get("size", 0)
+            fits_vram = True
+            if self.vram is not None:
+                required = size_bytes * 1.2
+                fits_vram = required < self.vram
+
+            details = m.get("details") or {}
+            running = loaded.get(name)
+            models.append({
+                "name": name,
+                "size_bytes": size_bytes,
+                "size_gb": round(size_bytes / (1024**3), 1),
+                "fits": fits_vram,
+                "parameter_size": details.get("parameter_size"),
+                "quantization": details.get("quantization_level"),
+                "family": details.get("family"),
+                "loaded": running is not None,
+                "size_vram": running.get("size_vram") if running else None,
+                "expires_at": running.get("expires_at") if running else None,
+            })
+
+        models.sort(key=lambda x: x["name"])
+        self._models = models
+        self.updated_at = time.time()
+        self.last_error = None
+        return models
+
+    def is_stale(self):
+        return self.updated_at is None or time.time() - self.updated_at > self.refresh_interval
+
+    async def models(self):
+        if self._models is None:
+            await self.refresh()
+        elif self.is_stale():
+            self.refresh()
+        return self._models or []
+
+    async def names(self):
+        return [m["name"] for m in await self.models()]
+
+    def is_loaded(self, name):
+        return any(m["name"] == name and m["loaded"] for m in self._models or [])
@@ -0,0 +1,188 @@
+import time
+import asyncio
+import itertools
+from enum import IntEnum
+from collections import deque
+from contextlib import asynccontextmanager
+
+import tracing
+from ollama_client import model_tag
+
+
+class Priority(IntEnum):
+    """Lower value is served first."""
+    EXPAND = 0
+    LESSON = 1
+    RANDOM = 2
+    PREFETCH = 3
+
+
+class SchedulerError(Exception):
+    status_code = 503
+
+
+class QueueFull(SchedulerError):
+    status_code = 429
+
+
+class QueueTimeout(SchedulerError):
+    status_code = 503
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "key", "future")
+
+    def __init__(self, priority, seq, key, future):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.future = future
+
+
+class _ModelQueue:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiters = []
+
+
+class _WaitStats:
+    def __init__(self, samples=1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=samples)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self.recent)
+
+        def pct(p):
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "max": round(self.max, 4),
+        }
+
+
+class Scheduler:
+    """
+    Admission control in front of Ollama.
+
+    Each model gets `limit` concurrent generations (match OLLAMA_NUM_PARALLEL).
+    Extra requests wait in a bounded per-model queue and are released in
+    priority order, FIFO within a priority. A full queue raises QueueFull
+    (HTTP 429) and a wait longer than `max_wait` raises QueueTimeout (503).
+    """
+
+    def __init__(self, default_limit=4, limits=None, max_queue=64, max_wait=30.0):
+        self.default_limit = default_limit
+        self.limits = {model_tag(m): limit for m, limit in (limits or {}).items()}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.rejected = 0
+        self.timeouts = 0
+        self._queues = {}
+        self._seq = itertools.count()
+        self._waits = {p: _WaitStats() for p in Priority}
+
+    def _queue(self, model):
+        # "llama3" and "llama3:latest" are the same Ollama model: one queue, one limit
+        model = model_tag(model)
+        q = self._queues.get(model)
+        if q is None:
+            q = self._queues[model] = _ModelQueue(self.limits.get(model, self.default_limit))
+        return q
+
+    def admit(self, model):
+        """Fails fast when a new request for `model` could not even be queued."""
+        q = self._queue(model)
+        if q.active >= q.limit and len(q.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"Too many queued requests for {model}")
+
+    def is_idle(self, model):
+        q = self._queue(model)
+        return q.active < q.limit and not q.waiters
+
+    def promote(self, key, priority):
+        """Raises the priority of queued work, e.g. when a user joins a prefetch."""
+        for q in self._queues.values():
+            for waiter in q.waiters:
+                if waiter.key == key and priority < waiter.priority:
+                    waiter.priority = priority
+
+    @asynccontextmanager
+    async def slot(self, model, priority, key=None):
+        q = self._queue(model)
+        start = time.monotonic()
+
+        if q.active < q.limit and not q.waiters:
+            q.active += 1
+        else:
+            if len(q.waiters) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"Too many queued requests for {model}")
+
+            waiter = _Waiter(priority, next(self._seq), key, asyncio.get_running_loop().create_future())
+            q.waiters.append(waiter)
+            try:
+                await asyncio.wait({waiter.future}, timeout=self.max_wait)
+            except asyncio.CancelledError:
+                self._abandon(q, waiter)
+                raise
+            if not waiter.future.done():
+                self._abandon(q, waiter)
+                self.timeouts += 1
+                raise QueueTimeout(f"Timed out waiting for {model}")
+
+        waited = time.monotonic() - start
+        self._waits[Priority(priority)].add(waited)
+        tracing.record("queue", waited, model=model, priority=Priority(priority).name.lower())
+        try:
+            yield
+        finally:
+            self._release(q)
+
+    def _abandon(self, q, waiter):
+        if waiter in q.waiters:
+            q.waiters.remove(waiter)
+        elif waiter.future.done():
+            # The slot was handed over but we are no longer using it
+            self._release(q)
+
+    def _release(self, q):
+        if q.waiters:
+            best = min(q.waiters, key=lambda w: (w.priority, w.seq))
+            q.waiters.remove(best)
+            # Hand the slot straight to the next waiter; active stays the same
+            best.future.set_result(None)
+        else:
+            q.active -= 1
+
+    def stats(self):
+        return {
+            "models": {
+                model: {
+                    "limit": q.limit,
+                    "active": q.active,
+                    "queued": len(q.waiters),
+                }
+                for model, q in self._queues.items()
+            },
+            "queue_depth": sum(len(q.waiters) for q in self._queues.values()),
+            "wait_seconds": {p.name.lower(): self._waits[p].summary() for p in Priority},
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
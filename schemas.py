@@ -0,0 +1,89 @@
+"""
+JSON schemas for the endpoints that expect structured output. Sent as
+Ollama's `format` parameter (Ollama >= 0.5) so decoding is constrained to
+valid JSON of the right shape instead of relying on prompt wording alone.
+"""
+
+CHILD_STATUSES = ["concept", "entity", "process"]
+
+CHILD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "desc": {"type": "string"},
+        "status": {"type": "string", "enum": CHILD_STATUSES},
+    },
+    "required": ["name", "desc", "status"],
+}
+
+TIMELINE_EVENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "year": {"type": "string"},
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+    },
+    "required": ["year", "title", "description"],
+}
+
+QUIZ_QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "options": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+        "correct_index": {"type": "integer", "minimum": 0, "maximum": 3},
+        "explanation": {"type": "string"},
+    },
+    "required": ["question", "options", "correct_index", "explanation"],
+}
+
+
+def expand_schema(count=5):
+    """{"children": [...]} with exactly `count` children, as the prompt asks."""
+    return {
+        "type": "object",
+        "properties": {
+            "children": {"type": "array", "items": CHILD_SCHEMA, "minItems": count, "maxItems": count},
+        },
+        "required": ["children"],
+    }
+
+
+def siblings_schema(names, count=5):
+    """{"siblings": {name: [...], ...}} with `count` children for every name."""
+    children = {"type": "array", "items": CHILD_SCHEMA, "minItems": count, "maxItems": count}
+    return {
+        "type": "object",
+        "properties": {
+            "siblings": {
+                "type": "object",
+                "properties": {name: children for name in names},
+                "required": list(names),
+            },
+        },
+        "required": ["siblings"],
+    }
+
+
+def history_schema():
+    return {"type": "array", "items": TIMELINE_EVENT_SCHEMA, "minItems": 1}
+
+
+def quiz_schema(num_questions=3):
+    questions = {"type": "array", "items": QUIZ_QUESTION_SCHEMA, "minItems": 1}
+    if num_questions:
+        questions["minItems"] = questions["maxItems"] = num_questions
+    return {
+        "type": "object",
+        "properties": {"questions": questions},
+        "required": ["questions"],
+    }
+
+
+def lesson_schema(mode, num_questions=3):
+    """Schema for an /analyze mode, or None for free-form Markdown modes."""
+    if mode == "history":
+        return history_schema()
+    if mode == "quiz":
+        return quiz_schema(num_questions)
+    return None
@@ -1,14 +1,141 @@
 import json
-import requests
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+
+from cache import build_cache, make_key
+from config import (
+    EXPAND_CACHE_SIZE, EXPAND_CACHE_TTL, EXPAND_CACHE_DB, EXPAND_CACHE_DB_SIZE,
+    LESSON_CACHE_SIZE, LESSON_CACHE_TTL, LESSON_CACHE_DB, LESSON_CACHE_DB_SIZE, LESSON_CACHE_QUIZ,
+    PREFETCH_ENABLED, PREFETCH_QUEUE_SIZE, PREFETCH_WORKERS, PREFETCH_WIDTH, PREFETCH_DEPTH, PREFETCH_MAX_LIVE,
+    PREFETCH_TEMPERATURE,
+    SCHEDULER_NUM_PARALLEL, SCHEDULER_MODEL_LIMITS, SCHEDULER_MAX_QUEUE, SCHEDULER_MAX_WAIT,
+    EXPAND_HEDGE_DELAY, EXPAND_MAX_FALLBACKS, MODEL_REGISTRY_REFRESH, OLLAMA_STRUCTURED_OUTPUTS,
+    GRAPH_DB, GRAPH_DB_TIMEOUT, EXPAND_CHAT_HISTORY,
+    WARMUP_MODELS, WARMUP_CHECK_INTERVAL, WARMUP_TIMEOUT, LESSON_LIKELY_MODES, OLLAMA_OPTIONS_PROFILE,
+    TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUPS, TRACE_SERVER_TIMING, TRACE_SAMPLE_RATE,
+)
+from conversation import Transcripts
+from graph import GraphStore, node_context, split_path, normalize_name
+from model_stats import ModelStats, ConstraintStats, PromptEvalStats
+from models import ExpandRequest, ExpandSiblingsRequest, AnalysisRequest, LessonBatchRequest, RandomTopicRequest
+from ollama_client import ollama, response_text
+from options_profile import OptionsProfile
+from prefetch import Prefetcher, predict_child_request
+from scheduler import Scheduler, SchedulerError, Priority
+from json_stream import StreamingJSONParser
+from metrics import (
+    registry as metrics_registry, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    EXPAND_FALLBACKS, JSON_PARSE_FAILURES,
+)
+import tracing
+from tracing import TracingMiddleware, TraceWriter
+from singleflight import SingleFlight, StreamFlight
+from registry import ModelRegistry
+from schemas import expand_schema, siblings_schema, lesson_schema
+from prompts import (
+    LESSON_MODES, EXPAND_SYSTEM_PROMPT, normalize_mode, build_lesson_prompt, build_expand_prompt,
+    build_expand_turn, build_siblings_prompt,
+)
+from warmup import ModelWarmer
+from utils import (
+    robust_json_parser, filter_children_response, validate_timeline_event, validate_quiz_question,
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    options_profile.load()
+    await model_registry.start()
+    warmer.start()
+    if PREFETCH_ENABLED:
+        prefetcher.start()
+    yield
+    await prefetcher.stop()
+    for task in list(lesson_batch_tasks):
+        task.cancel()
+    await asyncio.gather(*lesson_batch_tasks, return_exceptions=True)
+    await warmer.stop()
+    await model_registry.stop()
+    await ollama.aclose()
+    if graph is not None:
+        graph.close()
+    if trace_writer is not None:
+        trace_writer.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+expand_cache = build_cache(
+    EXPAND_CACHE_SIZE,
+    ttl=EXPAND_CACHE_TTL,
+    db_path=EXPAND_CACHE_DB or None,
+    table="expand_cache",
+    db_max_entries=EXPAND_CACHE_DB_SIZE,
+)
+
+# Completed /analyze streams, replayed verbatim for identical lesson requests
+lesson_cache = build_cache(
+    LESSON_CACHE_SIZE,
+    ttl=LESSON_CACHE_TTL,
+    db_path=LESSON_CACHE_DB or None,
+    table="lesson_cache",
+    db_max_entries=LESSON_CACHE_DB_SIZE,
+)
+
+# Every expansion and lesson ever generated, keyed by context path
+graph = GraphStore(GRAPH_DB, timeout=GRAPH_DB_TIMEOUT) if GRAPH_DB else None
+
+# Identical in-flight generations share one upstream call
+expand_flight = SingleFlight()
+expand_stream_flight = StreamFlight()
+lesson_flight = StreamFlight()
+
+# Expand cache key -> (future of that sibling's children, batch key) while a
+# /expand/siblings generation is producing it
+sibling_batches = {}
+
+# Background /analyze/batch generations, cancelled on shutdown
+lesson_batch_tasks = set()
+
+# Installed/loaded models and VRAM, refreshed in the background
+model_registry = ModelRegistry(ollama, refresh_interval=MODEL_REGISTRY_REFRESH)
+
+# Preloads WARMUP_MODELS and reloads them when Ollama evicts them
+warmer = ModelWarmer(
+    ollama,
+    model_registry,
+    WARMUP_MODELS,
+    check_interval=WARMUP_CHECK_INTERVAL,
+    timeout=WARMUP_TIMEOUT,
+)
+
+# Measured JSON success rate and latency, used to rank fallback models
+model_stats = ModelStats()
+
+# First-try JSON success with and without schema-constrained decoding
+constraint_stats = ConstraintStats()
+
+# Ollama's prompt evaluation cost by prompt style and tree depth
+prompt_stats = PromptEvalStats()
 
-from config import OLLAMA_BASE
-from models import ExpandRequest, AnalysisRequest, RandomTopicRequest
-from utils import robust_json_parser, get_gpu_vram, get_available_models_list, filter_children_response
+# Ancestor chat turns replayed so child expansions reuse the parent's KV cache
+transcripts = Transcripts(max_turns=EXPAND_CHAT_HISTORY)
 
-app = FastAPI()
+# Per-model num_ctx/num_batch/... from benchmark_tune.py, read at startup
+options_profile = OptionsProfile(OLLAMA_OPTIONS_PROFILE)
+
+# Every generation takes a per-model slot, interactive work first
+scheduler = Scheduler(
+    default_limit=SCHEDULER_NUM_PARALLEL,
+    limits=SCHEDULER_MODEL_LIMITS,
+    max_queue=SCHEDULER_MAX_QUEUE,
+    max_wait=SCHEDULER_MAX_WAIT,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,44 +143,89 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+trace_writer = TraceWriter(TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUPS) if TRACE_FILE else None
+# Outermost, so the trace spans everything the other middleware does
+app.add_middleware(TracingMiddleware, writer=trace_writer, server_timing=TRACE_SERVER_TIMING,
+                   sample_rate=TRACE_SAMPLE_RATE)
+
+
+@metrics_registry.collector
+def collect_component_metrics():
+    """Numbers the caches and scheduler already keep, read at scrape time."""
+    caches = {"expand": expand_cache.stats(), "lesson": lesson_cache.stats()}
+    queues = scheduler.stats()["models"]
+    return [
+        ("omniweb_cache_hits_total", "counter", "Cache lookups that found an entry.",
+         [({"cache": name}, c["hits"]) for name, c in caches.items()]),
+        ("omniweb_cache_misses_total", "counter", "Cache lookups that missed.",
+         [({"cache": name}, c["misses"]) for name, c in caches.items()]),
+        ("omniweb_cache_hit_ratio", "gauge", "Hits / lookups since startup.",
+         [({"cache": name}, c["hit_ratio"]) for name, c in caches.items()]),
+        ("omniweb_scheduler_active", "gauge", "Generations holding a scheduler slot.",
+         [({"model": m}, q["active"]) for m, q in queues.items()]),
+        ("omniweb_scheduler_queued", "gauge", "Generations waiting for a scheduler slot.",
+         [({"model": m}, q["queued"]) for m, q in queues.items()]),
+    ]
+
+
+@app.exception_handler(SchedulerError)
+async def scheduler_error_handler(request, exc):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "5"},
+    )
 
-@app.get("/models")
-def get_models():
-    vram = get_gpu_vram()
-    try:
-        res = requests.get(f"{OLLAMA_BASE}/api/tags", timeout=5)
-        if res.status_code == 200:
-            data = res.json()
-            models_list = []
-            for m in data.get('models', []):
-                name = m.get('name')
-                if not name:
-                    continue
 
-                size_bytes = m.get('size', 0)
-                fits_vram = True
+@app.get("/ready")
+async def readiness():
+    """503 until the configured models finished their first warm-up."""
+    stats = warmer.stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
+
+@app.get("/scheduler")
+async def scheduler_stats():
+    return {**scheduler.stats(), "prefetch": prefetcher.stats()}
+
+@app.get("/stats")
+async def generation_stats():
+    return {
+        "structured_outputs": OLLAMA_STRUCTURED_OUTPUTS,
+        "models": model_stats.stats(),
+        "constraints": constraint_stats.stats(),
+        "prompt_eval": prompt_stats.stats(),
+        "options_profile": options_profile.stats(),
+    }
 
-                if vram is not None:
-                    required = size_bytes * 1.2
-                    fits_vram = required < vram
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
-                models_list.append({
-                    "name": name,
-                    "size_bytes": size_bytes,
-                    "size_gb": round(size_bytes / (1024**3), 1),
-                    "fits": fits_vram
-                })
+@app.get("/graph/path")
+async def graph_path(context: str, model: str):
+    """Stored nodes and expansions along a context path, to restore a session."""
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Graph store is disabled (set GRAPH_DB)")
+    return {"path": await run_in_threadpool(graph.path, model, context)}
 
-            models_list.sort(key=lambda x: x['name'])
+@app.get("/graph/search")
+async def graph_search(name: str, model: str = None):
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Graph store is disabled (set GRAPH_DB)")
+    return {"nodes": await run_in_threadpool(graph.find, name, model)}
 
-            return {"models": models_list, "vram_detected": vram is not None}
-        return {"models": []}
-    except Exception:
+@app.get("/models")
+async def get_models():
+    models_list = await model_registry.models()
+    if not models_list:
         return {"models": []}
+    return {"models": models_list, "vram_detected": model_registry.vram is not None}
 
 
 @app.post("/random")
-def random_topic(req: RandomTopicRequest):
+async def random_topic(req: RandomTopicRequest):
     print("\n🎲 Generating Random Topic...")
     prompt = "Generate ONE specific, engaging educational topic for a curious learner. It could be from history, science, philosophy, or technology. Avoid generic broad topics like 'Science' or 'History'. Aim for something specific like 'The Library of Alexandria', 'CRISPR Gene Editing', 'Stoicism', or 'The Antikythera Mechanism'. Return ONLY the topic name. No quotes, no extra text."
 
@@ -65,215 +237,755 @@ def random_topic(req: RandomTopicRequest):
     }
 
     try:
-        res = requests.post(f"{OLLAMA_BASE}/api/generate", json=payload, timeout=30)
-        if res.status_code == 200:
-            topic = res.json().get("response", "").strip().replace('"', '')
-            return {"topic": topic}
+        async with scheduler.slot(req.model, Priority.RANDOM):
+            data = await ollama.generate(payload, timeout=30)
+        topic = data.get("response", "").strip().replace('"', '')
+        return {"topic": topic}
+    except SchedulerError:
+        raise
     except Exception as e:
         print(f"Error generating random topic: {e}")
 
     return {"topic": "The Universe"}
 
 
-@app.post("/expand")
-def expand_node(req: ExpandRequest):
-    print(f"\n⚡ Expanding Topic: [{req.node}]")
+def expand_options(req, model=None):
+    """Options for one expansion; `model` differs from req.model for fallbacks."""
+    return options_profile.expand_options(model or req.model, req.temperature)
 
-    # Use full context to ensure deep relevance
-    full_context = req.context
-
-    exclusion_text = ""
-    if req.recent_nodes:
-        exclusion_text = f"5. AVOID using these words/topics: {', '.join(req.recent_nodes)}"
-
-    system_prompt_template = """
-    You are an Expert Curriculum Designer.
-
-    Current Subject: {node}
-    Context Path: {context}
-
-    Your goal is to identify 5 distinct sub-topics or learning paths that drill down into "{node}".
-    These sub-topics must be strictly hierarchical children of "{node}", assuming the user has already studied the parent topics in the context path.
-
-    RULES:
-    1. Output MUST be valid, parseable JSON.
-    2. Do not include any introductory text, markdown formatting, or code blocks. Just the raw JSON string.
-    3. The JSON root must be an object with a single key "children" containing a list of objects.
-    4. Each child object must have:
-        - "name": Concise academic title (max 4 words).
-        - "desc": Brief definition (max 20 words).
-        - "status": One of ["concept", "entity", "process"].
-    {exclusion}
-
-    Example Output:
-    {{
-        "children": [
-            {{ "name": "Subtopic Name", "desc": "Brief description.", "status": "concept" }},
-            ...
-        ]
-    }}
+
+def expand_payload(model, prompt, options):
+    payload = {"model": model, "prompt": prompt, "stream": False, "options": options}
+    if OLLAMA_STRUCTURED_OUTPUTS:
+        payload["format"] = expand_schema()
+    return payload
+
+
+def expand_request(req, model, options):
+    """
+    Payload for one expansion attempt, plus the user turn to remember when
+    it goes through /api/chat (None for a single /api/generate prompt).
     """
+    if EXPAND_CHAT_HISTORY <= 0:
+        return expand_payload(model, build_expand_prompt(req), options), None
+
+    turn = build_expand_turn(req)
+    messages = [{"role": "system", "content": EXPAND_SYSTEM_PROMPT}]
+    messages += transcripts.history(model, split_path(node_context(req.node, req.context)))
+    messages.append({"role": "user", "content": turn})
+    payload = {"model": model, "messages": messages, "stream": False, "options": options}
+    if OLLAMA_STRUCTURED_OUTPUTS:
+        payload["format"] = expand_schema()
+    return payload, turn
+
+
+def remember_turn(req, model, turn, text):
+    # The raw reply, not the filtered children, so the replayed prefix
+    # matches the tokens already in Ollama's cache
+    if turn is not None and text:
+        transcripts.record(model, split_path(node_context(req.node, req.context)), turn, text)
+
+
+async def stored_expansion(req, cache_key):
+    """Expansion cache first, then the graph store; None means generate."""
+    if req.bypass_cache:
+        return None
+    cached = await expand_cache.aget(cache_key)
+    if cached is not None:
+        print(f"💾 Served [{req.node}] from expansion cache")
+        tracing.tag(cache="hit")
+        return cached
+    if graph is None:
+        return None
+    # sqlite calls may wait on another worker's write lock; keep them off the loop
+    children = await run_in_threadpool(graph.children, req.model, node_context(req.node, req.context))
+    data = filter_children_response({"children": children}, req.recent_nodes) if children else None
+    if data is None:
+        return None
+    print(f"🗂️ Served [{req.node}] from graph store")
+    tracing.tag(cache="graph")
+    await expand_cache.aset(cache_key, data)
+    return data
+
+
+async def remember_expansion(req, data, priority=Priority.EXPAND):
+    if graph is None:
+        return
+    meta = {"temperature": req.temperature, "prefetched": priority == Priority.PREFETCH}
+    try:
+        await run_in_threadpool(graph.record_expansion, req.model, node_context(req.node, req.context),
+                                data["children"], meta)
+    except Exception as e:
+        print(f"Graph store write failed: {e}")
 
-    system_prompt = system_prompt_template.format(
-        node=req.node,
-        context=full_context,
-        exclusion=exclusion_text
-    )
 
-    def call_llm(model, prompt):
+def expand_cache_key(req):
+    # The rendered prompt already encodes node, context and recent_nodes
+    return make_key("expand", build_expand_prompt(req), req.model, expand_options(req))
+
+
+async def expand_children(req, priority=Priority.EXPAND):
+    """
+    Cache lookup, then a coalesced generation with model fallback.
+    Shared by the /expand endpoint and the background prefetcher.
+    """
+    cache_key = expand_cache_key(req)
+
+    stored = await stored_expansion(req, cache_key)
+    if stored is not None:
+        return stored
+
+    pending = None if req.bypass_cache else sibling_batches.get(cache_key)
+    if pending is not None:
+        # A column batch is already generating this node's children
+        future, batch_key = pending
+        scheduler.promote(batch_key, priority)
+        with tracing.span("sibling_batch"):
+            data = await asyncio.shield(future)
+        if data:
+            print(f"🧺 Served [{req.node}] from sibling batch")
+            tracing.tag(cache="sibling_batch")
+            return data
+
+    depth = len(split_path(node_context(req.node, req.context)))
+
+    async def call_llm(model):
+        payload, turn = expand_request(req, model, expand_options(req, model))
+        send = ollama.chat if turn is not None else ollama.generate
+        try:
+            async with scheduler.slot(model, priority, key=cache_key):
+                response = await send(payload, timeout=60)
+            prompt_stats.record("chat" if turn is not None else "generate", depth, response)
+            text = response_text(response)
+            return parse_llm_json(text, "expand"), turn, text
+        except SchedulerError:
+            raise
+        except Exception as e:
+            print(f"Error calling {model}: {e}")
+            return None, None, None
+
+    async def attempt(model, reason="primary"):
+        start = time.perf_counter()
+        with tracing.span("expand.attempt", model=model, reason=reason) as span:
+            data, turn, text = await call_llm(model)
+            data = filter_children_response(data, req.recent_nodes)
+            span["outcome"] = "ok" if data else "failed"
+        # Per generation, so a hedge that wins against a merely slow primary
+        # is not counted as a parse failure
+        constraint_stats.record("expand", OLLAMA_STRUCTURED_OUTPUTS, data is not None)
+        model_stats.record(model, data is not None, time.perf_counter() - start)
+        if data:
+            remember_turn(req, model, turn, text)
+        return data
+
+    async def produce():
+        # Hedged fallback: a fallback model starts when the primary fails, or
+        # races it once EXPAND_HEDGE_DELAY passes without a valid result.
+        attempts = {asyncio.ensure_future(attempt(req.model)): req.model}
+        fallbacks = None
+        primary_error = None
+        try:
+            while attempts:
+                hedge = EXPAND_HEDGE_DELAY if EXPAND_HEDGE_DELAY > 0 and fallbacks != [] else None
+                done, _ = await asyncio.wait(attempts, timeout=hedge, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model = attempts.pop(task)
+                    try:
+                        data = task.result()
+                    except SchedulerError as e:
+                        # A full fallback queue is just a failed attempt; the
+                        # primary's is the answer only once nothing else runs
+                        if model == req.model and not attempts:
+                            raise
+                        print(f"⚠️ {model} unavailable: {e}")
+                        if model == req.model:
+                            primary_error = e
+                        data = None
+                    if data:
+                        await expand_cache.aset(cache_key, data)
+                        await remember_expansion(req, data, priority)
+                        return data
+
+                if done and attempts:
+                    # Another model is still running; give it until the next hedge
+                    continue
+
+                if fallbacks is None:
+                    if done:
+                        print("⚠️ Primary model failed or returned repeat topics. Attempting fallback...")
+                    available_models = await model_registry.names()
+                    # Try to find a fallback that is NOT the current model,
+                    # best measured JSON success rate and latency first
+                    fallbacks = model_stats.rank([m for m in available_models if m != req.model])
+                    fallbacks = fallbacks[:EXPAND_MAX_FALLBACKS]
+
+                if fallbacks:
+                    fallback_model = fallbacks.pop(0)
+                    if done:
+                        print(f"🔄 Switching to fallback model: {fallback_model}")
+                    else:
+                        print(f"⏱️ No valid result after {hedge}s. Hedging with: {fallback_model}")
+                    reason = "failure" if done else "hedge"
+                    EXPAND_FALLBACKS.labels(reason).inc()
+                    attempts[asyncio.ensure_future(attempt(fallback_model, reason))] = fallback_model
+
+            if primary_error is not None:
+                raise primary_error
+            return {"children": []}
+        finally:
+            # Cancel whichever attempts lost the race
+            for task in attempts:
+                task.cancel()
+
+    # A user joining a queued prefetch should not wait at prefetch priority
+    scheduler.promote(cache_key, priority)
+    return await expand_flight.do(cache_key, produce)
+
+
+async def prefetch_children(req):
+    return await expand_children(req, priority=Priority.PREFETCH)
+
+
+prefetcher = Prefetcher(
+    prefetch_children,
+    expand_cache_key,
+    queue_size=PREFETCH_QUEUE_SIZE,
+    workers=PREFETCH_WORKERS,
+    width=PREFETCH_WIDTH,
+    depth=PREFETCH_DEPTH,
+    max_live=PREFETCH_MAX_LIVE,
+    temperature=PREFETCH_TEMPERATURE,
+)
+
+
+def split_siblings(data, sibling_reqs):
+    """
+    Per-sibling children from a batched response, validated with the same
+    rules as a single expansion. Missing or invalid siblings map to None.
+    """
+    if isinstance(data, dict) and isinstance(data.get("siblings"), dict):
+        data = data["siblings"]
+    if not isinstance(data, dict):
+        return {r.node: None for r in sibling_reqs}
+    by_name = {normalize_name(str(k)): v for k, v in data.items()}
+    return {
+        r.node: filter_children_response(by_name.get(normalize_name(r.node)), r.recent_nodes)
+        for r in sibling_reqs
+    }
+
+
+@app.post("/expand/siblings")
+async def expand_siblings(req: ExpandSiblingsRequest):
+    """
+    Expands every node of a column in one generation and files each
+    sibling's children in the expansion cache under the exact key its
+    /expand click will use. Siblings the model skipped or got wrong are
+    reported as failed and will be expanded on click as usual.
+    """
+    parent = ExpandRequest(node=req.node, context=req.context, model=req.model, temperature=req.temperature)
+    sibling_reqs = [predict_child_request(parent, name, req.children, req.parent_column) for name in req.children]
+
+    expanded, cached = {}, []
+    todo = []
+    for sib in sibling_reqs:
+        stored = await stored_expansion(sib, expand_cache_key(sib))
+        if stored is not None:
+            expanded[sib.node] = stored["children"]
+            cached.append(sib.node)
+        elif expand_cache_key(sib) not in sibling_batches:
+            todo.append(sib)
+
+    if todo:
+        print(f"\n🧺 Expanding {len(todo)} siblings of [{req.node}] in one generation")
+        names = [sib.node for sib in todo]
+        options = expand_options(parent)
+        # Five expansions in one answer: more context, and no per-expansion output cap
+        options.pop("num_predict", None)
+        options["num_ctx"] = max(options["num_ctx"], 8192)
         payload = {
-            "model": model,
-            "prompt": prompt,
+            "model": req.model,
+            "prompt": build_siblings_prompt(req, names),
             "stream": False,
-            "options": {"temperature": req.temperature, "num_ctx": 4096}
+            "options": options,
         }
+        if OLLAMA_STRUCTURED_OUTPUTS:
+            payload["format"] = siblings_schema(names)
+        batch_key = make_key("siblings", payload)
+
+        async def generate():
+            start = time.perf_counter()
+            try:
+                async with scheduler.slot(req.model, Priority.PREFETCH, key=batch_key):
+                    response = await ollama.generate(payload, timeout=180)
+                prompt_stats.record("siblings", len(split_path(node_context(req.node, req.context))) + 1, response)
+                data = parse_llm_json(response_text(response), "siblings")
+            except SchedulerError:
+                raise
+            except Exception as e:
+                print(f"Error calling {req.model}: {e}")
+                data = None
+            results = split_siblings(data, todo)
+            model_stats.record(req.model, any(results.values()), time.perf_counter() - start)
+            return results
+
+        # Clicks on these siblings wait for the batch instead of generating
+        loop = asyncio.get_running_loop()
+        futures = {expand_cache_key(sib): loop.create_future() for sib in todo}
+        for key, future in futures.items():
+            sibling_batches[key] = (future, batch_key)
+
+        results = {}
         try:
-            response = requests.post(f"{OLLAMA_BASE}/api/generate", json=payload, timeout=60)
-            response.raise_for_status()
-            json_text = robust_json_parser(response.json().get("response", ""))
-            return json.loads(json_text)
-        except Exception as e:
-            print(f"Error calling {model}: {e}")
-            return None
+            results = await generate()
+            for sib in todo:
+                data = results.get(sib.node)
+                if data:
+                    await expand_cache.aset(expand_cache_key(sib), data)
+                    await remember_expansion(sib, data, Priority.PREFETCH)
+                    expanded[sib.node] = data["children"]
+        finally:
+            # Waiters on a failed or cancelled batch fall back to their own expansion
+            for sib in todo:
+                key = expand_cache_key(sib)
+                sibling_batches.pop(key, None)
+                if not futures[key].done():
+                    futures[key].set_result(results.get(sib.node))
+
+    return {
+        "expanded": expanded,
+        "cached": cached,
+        "failed": [sib.node for sib in todo if sib.node not in expanded],
+    }
 
-    data = call_llm(req.model, system_prompt)
 
-    data = filter_children_response(data, req.recent_nodes)
-    if data:
-        return data
+@app.post("/expand")
+async def expand_node(req: ExpandRequest):
+    print(f"\n⚡ Expanding Topic: [{req.node}]")
 
-    print("⚠️ Primary model failed or returned repeat topics. Attempting fallback...")
+    if req.session_id:
+        # The user moved on: drop speculative work that no longer applies
+        prefetcher.navigate(req.session_id, keep=expand_cache_key(req))
 
-    available_models = get_available_models_list()
-    # Try to find a fallback that is NOT the current model
-    fallback_candidates = [m for m in available_models if m != req.model]
+    tracing.tag(node=req.node, model=req.model)
+    with prefetcher.live_request():
+        data = await expand_children(req)
 
-    # Limit to max 2 fallback attempts to avoid long waits
-    for fallback_model in fallback_candidates[:2]:
-        print(f"🔄 Switching to fallback model: {fallback_model}")
-        data = call_llm(fallback_model, system_prompt)
-        data = filter_children_response(data, req.recent_nodes)
-        if data:
-            return data
+    if req.session_id and PREFETCH_ENABLED:
+        prefetcher.schedule(req, data)
+    return data
 
-    return {"children": []}
 
+def ndjson(record):
+    return json.dumps(record) + "\n"
 
-@app.post("/analyze")
-def analyze_node(req: AnalysisRequest):
-    # Normalize mode
-    req.mode = req.mode.lower() if req.mode else "explain"
-
-    prompts = {
-        "explain": f"Teach '{req.node}' to a beginner. Use a clear analogy (formatted as a > blockquote) to explain the core concept. Then detail how it works.",
-        "history": f"Provide a historical timeline of '{req.node}'. Return a JSON array where each element has 'year', 'title', and 'description'. Do not use Markdown or code blocks.",
-        "impact": f"Analyze the significance of '{req.node}'. Why does it matter to humanity or the universe? What are the ethical or practical implications?",
-        "eli5": f"Explain '{req.node}' to a 5-year-old. Use simple words and fun examples.",
-        "future": f"Speculate on the future of '{req.node}'. What advances or changes can we expect in the next 50 years?",
-        "code": f"Provide a code example or technical demonstration related to '{req.node}'. If it is a programming concept, show code. If it is a scientific concept, show a formula or a simulation algorithm. Use proper markdown code blocks.",
-        "proscons": f"Analyze the Pros and Cons of '{req.node}'. Present them in a clear Markdown table or list.",
-        "debate": f"Simulate a short debate between two experts holding opposing views on '{req.node}'. Label them as 'Proponent' and 'Skeptic'.",
-        "glossary": f"Create a comprehensive Glossary of Key Terms related to '{req.node}'. Format as a Markdown list where the term is bolded (e.g., - **Term**: Definition). Include at least 10 terms.",
-        "sources": f"List 5-10 essential books, research papers, or primary sources to learn more about '{req.node}'. Format as a Markdown list with brief annotations explaining why each source is important.",
-        "quiz": f"Create a {req.num_questions}-question multiple choice quiz about '{req.node}'. Difficulty: {req.difficulty}. Return ONLY valid JSON. The JSON should be an object with a key 'questions' which is a list of objects. Each question object must have: 'question' (string), 'options' (list of 4 strings), 'correct_index' (integer 0-3), and 'explanation' (string). Do not use markdown formatting."
-    }
 
-    if req.mode not in prompts:
-        print(f"⚠️ Invalid mode '{req.mode}' requested. Defaulting to 'explain'.")
-        req.mode = "explain"
+@app.post("/expand/stream")
+async def expand_node_stream(req: ExpandRequest):
+    """
+    Streaming /expand. Emits one NDJSON record per validated child as soon as
+    the model closes it ({"type": "child", "child": {...}}), then a final
+    {"type": "done", "children": [...]}. Fallback models are tried in turn
+    when the primary produces no usable child; there is no hedging since
+    records may already have reached the client.
+    """
+    print(f"\n⚡ Streaming Expansion: [{req.node}]")
+    tracing.tag(node=req.node, model=req.model)
+
+    cache_key = expand_cache_key(req)
+
+    if req.session_id:
+        prefetcher.navigate(req.session_id, keep=cache_key)
+
+    cached = await stored_expansion(req, cache_key)
+    if cached is not None:
+        records = [ndjson({"type": "child", "child": c}) for c in cached["children"]]
+        records.append(ndjson({"type": "done", "children": cached["children"]}))
+        return StreamingResponse(iter(records), media_type="application/x-ndjson")
+
+    scheduler.admit(req.model)
+
+    async def stream_model(model, accepted):
+        """Yields accepted children from one model; returns via parser.done."""
+        payload, turn = expand_request(req, model, expand_options(req, model))
+        parser = StreamingJSONParser()
+        text = []
+        async with scheduler.slot(model, Priority.EXPAND, key=cache_key):
+            if turn is not None:
+                chunks = ollama.stream_chat(payload, timeout=60)
+            else:
+                chunks = ollama.stream_generate(payload, timeout=60)
+            try:
+                async for json_obj in chunks:
+                    text.append(response_text(json_obj))
+                    for event in parser.feed(text[-1]):
+                        if event[0] != "item" or event[1] not in ("children", None):
+                            continue
+                        # Same dedupe/forbidden rules as the batch path, one child at a time
+                        seen = [c["name"] for c in accepted]
+                        valid = filter_children_response([event[2]], req.recent_nodes + seen)
+                        if valid:
+                            accepted.append(valid["children"][0])
+                            yield valid["children"][0]
+                    if parser.done:
+                        # Anything after the JSON is chatter; stop generating
+                        break
+            finally:
+                await chunks.aclose()
+        if not parser.done:
+            raise ValueError("stream ended before the JSON document closed")
+        if accepted:
+            remember_turn(req, model, turn, "".join(text))
+
+    async def upstream():
+        pending = None if req.bypass_cache else sibling_batches.get(cache_key)
+        if pending is not None:
+            future, batch_key = pending
+            scheduler.promote(batch_key, Priority.EXPAND)
+            data = await asyncio.shield(future)
+            if data:
+                for child in data["children"]:
+                    yield {"type": "child", "child": child}
+                yield {"type": "done", "children": data["children"]}
+                return
+
+        accepted = []
+        complete = False
+        candidates = [req.model]
+        fallbacks = None
+        while candidates:
+            model = candidates.pop(0)
+            start = time.perf_counter()
+            complete = False
+            try:
+                async for child in stream_model(model, accepted):
+                    yield {"type": "child", "child": child}
+                complete = True
+            except SchedulerError:
+                raise
+            except Exception as e:
+                print(f"Error calling {model}: {e}")
+            # Recorded afterwards: a span held open across the yields above
+            # would leak into the consumer's context
+            tracing.record("expand.attempt", time.perf_counter() - start, model=model,
+                           reason="primary" if fallbacks is None else "failure",
+                           outcome="ok" if accepted else "failed")
+            model_stats.record(model, bool(accepted), time.perf_counter() - start)
+            constraint_stats.record("expand", OLLAMA_STRUCTURED_OUTPUTS, bool(accepted))
+            if accepted:
+                break
+            if fallbacks is None:
+                print("⚠️ Primary model failed or returned repeat topics. Attempting fallback...")
+                available_models = await model_registry.names()
+                fallbacks = model_stats.rank([m for m in available_models if m != req.model])
+                candidates = fallbacks[:EXPAND_MAX_FALLBACKS]
+            if candidates:
+                print(f"🔄 Switching to fallback model: {candidates[0]}")
+                EXPAND_FALLBACKS.labels("failure").inc()
+
+        # Partial lists from a broken stream are sent but never cached
+        if complete and accepted:
+            await expand_cache.aset(cache_key, {"children": accepted})
+            await remember_expansion(req, {"children": accepted})
+        yield {"type": "done", "children": accepted}
+
+    async def generate():
+        records = expand_stream_flight.subscribe(cache_key, upstream)
+        children = None
+        with prefetcher.live_request():
+            try:
+                async for record in records:
+                    if record["type"] == "done":
+                        children = record["children"]
+                    yield ndjson(record)
+            except Exception as e:
+                yield ndjson({"type": "error", "error": str(e)})
+            finally:
+                await records.aclose()
+
+        if children and req.session_id and PREFETCH_ENABLED:
+            prefetcher.schedule(req, {"children": children})
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+def parse_llm_json(text, endpoint):
+    """json.loads(robust_json_parser(text)), counting failures per endpoint for /metrics."""
+    with tracing.span("parse", endpoint=endpoint) as span:
+        try:
+            return json.loads(robust_json_parser(text))
+        except (json.JSONDecodeError, TypeError):
+            JSON_PARSE_FAILURES.labels(endpoint).inc()
+            span["outcome"] = "failed"
+            raise
 
-    print(f"\n📚 Teaching [{req.node}] Mode: {req.mode}")
 
-    if req.mode == "history":
-        system_prompt = f"""
-        You are a Historian.
-
-        Context: {req.context}
-        Topic: {req.node}
-
-        Task: Create a historical timeline of key events for "{req.node}", considering the context "{req.context}".
-
-        Requirements:
-        1. Return ONLY a valid JSON Array.
-        2. Do NOT use markdown code blocks (```json ... ```).
-        3. Do NOT include any text before or after the JSON.
-        4. Each element in the array must be an object with "year" (string), "title" (string), and "description" (string).
-
-        Example:
-        [
-            {{ "year": "1905", "title": "Special Relativity", "description": "Einstein publishes his paper..." }}
-        ]
-        """
-    elif req.mode == "quiz":
-        difficulty_guidance = {
-            "easy": "Focus on basic facts and definitions.",
-            "medium": "Focus on conceptual understanding and connections.",
-            "hard": "Focus on complex analysis, edge cases, and synthesis of ideas."
-        }.get(req.difficulty, "Focus on conceptual understanding.")
-
-        system_prompt = f"""
-        You are a Professor creating an exam.
-
-        Context: {req.context}
-        Topic: {req.node}
-        Difficulty: {req.difficulty}
-
-        Task: Create a {req.num_questions}-question multiple choice quiz.
-
-        Requirements:
-        1. Return ONLY valid JSON.
-        2. Do NOT use markdown code blocks.
-        3. The root object must have a key "questions" containing a list of question objects.
-        4. Each question object must have:
-           - "question": The question text.
-           - "options": An array of exactly 4 strings.
-           - "correct_index": Integer (0-3).
-           - "explanation": Brief explanation of the answer.
-
-        Difficulty Guidance: {difficulty_guidance}
-        """
-    else:
-        system_prompt = f"""
-        You are an Expert Tutor.
+def parses_as_json(text, endpoint):
+    # The lenient parser stays the safety net for unconstrained output
+    try:
+        return bool(parse_llm_json(text, endpoint))
+    except (json.JSONDecodeError, TypeError):
+        return False
 
-        Context: {req.context}
-        Topic: {req.node}
-        Task: {prompts.get(req.mode)}
 
-        Guidelines:
-        - All explanations must be strictly framed within the provided Context.
-        - Style: Engaging, clear, and educational.
-        - Use Markdown for structure: headers (#, ##), bold (**), lists (-).
-        - Do NOT simply dump information; teach the concept.
+# mode -> (record type, item validator)
+STRUCTURED_MODES = {
+    "history": ("event", validate_timeline_event),
+    "quiz": ("question", validate_quiz_question),
+}
 
-        VISUAL AIDS:
-        If a specific diagram or image would help (e.g., anatomy, maps, blueprints), insert a tag on its own line:
-        [Image of <specific search query>]
 
-        Use this sparingly and only when necessary.
-        """
+async def structured_lesson(mode, texts):
+    """
+    Parses a history/quiz lesson stream incrementally and emits each
+    validated timeline event or quiz question as its own NDJSON record,
+    followed by {"type": "done", "count": n, "complete": bool}.
+    """
+    kind, validate = STRUCTURED_MODES[mode]
+    parser = StreamingJSONParser()
+    count = 0
+    with prefetcher.live_request():
+        try:
+            # Keep draining after the document closes so the shared
+            # stream completes and can be cached
+            async for text in texts:
+                for event in parser.feed(text):
+                    if event[0] != "item":
+                        continue
+                    item = validate(event[2])
+                    if item is None:
+                        print(f"Dropped invalid {kind}: {event[2]}")
+                        continue
+                    count += 1
+                    yield ndjson({"type": kind, kind: item})
+            yield ndjson({"type": "done", "count": count, "complete": parser.done})
+        except Exception as e:
+            yield ndjson({"type": "error", "error": str(e)})
 
+
+
+def lesson_payload(req):
     payload = {
         "model": req.model,
-        "prompt": system_prompt,
+        "prompt": build_lesson_prompt(req),
         "stream": True,
-        "options": {"temperature": 0.6}
+        "options": options_profile.lesson_options(req.model)
     }
+    schema = lesson_schema(req.mode, req.num_questions)
+    if schema is not None and OLLAMA_STRUCTURED_OUTPUTS:
+        payload["format"] = schema
+    return payload
 
-    def generate():
-        try:
-            with requests.post(f"{OLLAMA_BASE}/api/generate", json=payload, stream=True, timeout=120) as response:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            json_obj = json.loads(line.decode('utf-8'))
-                            chunk = json_obj.get("response", "")
-                            if chunk:
-                                yield chunk
-                        except json.JSONDecodeError:
-                            continue
-        except Exception as e:
-            yield f"Error: {str(e)}"
 
+def lesson_cacheable(mode):
+    return mode != "quiz" or LESSON_CACHE_QUIZ
+
+
+def lesson_cache_key(req):
+    return make_key("lesson", req.node, req.context, req.mode, req.model, req.difficulty, req.num_questions)
+
+
+async def cached_lesson(req):
+    """Completed lesson text from the lesson cache or graph store, else None."""
+    if not lesson_cacheable(req.mode) or req.bypass_cache:
+        return None
+    cache_key = lesson_cache_key(req)
+    cached = await lesson_cache.aget(cache_key)
+    if cached is None and graph is not None:
+        cached = await run_in_threadpool(graph.lesson, req.model, node_context(req.node, req.context),
+                                         req.mode, req.difficulty, req.num_questions)
+        if cached is not None:
+            await lesson_cache.aset(cache_key, cached)
+    return cached
+
+
+async def lesson_text(req, priority=Priority.LESSON):
+    """
+    Streams a freshly generated lesson. Identical concurrent requests share
+    one upstream generation, and completed streams go to the lesson cache.
+    """
+    payload = lesson_payload(req)
+    schema = payload.get("format")
+    cacheable = lesson_cacheable(req.mode)
+    cache_key = lesson_cache_key(req)
+    flight_key = make_key("analyze", payload)
+
+    async def upstream():
+        # Runs once per flight, however many clients are attached
+        recorded = []
+        completed = False
+        async with scheduler.slot(req.model, priority, key=flight_key):
+            async for json_obj in ollama.stream_generate(payload, timeout=120):
+                chunk = json_obj.get("response", "")
+                if chunk:
+                    recorded.append(chunk)
+                    yield chunk
+                if json_obj.get("done"):
+                    completed = True
+
+        if schema is not None and completed:
+            constraint_stats.record(req.mode, OLLAMA_STRUCTURED_OUTPUTS, parses_as_json("".join(recorded), req.mode))
+
+        # Only streams that Ollama marked as done are worth replaying
+        if cacheable and completed and recorded:
+            await lesson_cache.aset(cache_key, "".join(recorded))
+            if graph is not None:
+                try:
+                    await run_in_threadpool(graph.record_lesson, req.model, node_context(req.node, req.context),
+                                            req.mode, req.difficulty, req.num_questions, "".join(recorded))
+                except Exception as e:
+                    print(f"Graph store write failed: {e}")
+
+    # A user joining a background batch generation should not wait behind it
+    scheduler.promote(flight_key, priority)
+    chunks = lesson_flight.subscribe(flight_key, upstream)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        # Detach promptly so an abandoned flight can cancel its upstream
+        await chunks.aclose()
+
+
+@app.post("/analyze")
+async def analyze_node(req: AnalysisRequest):
+    req.mode = normalize_mode(req.mode)
+
+    print(f"\n📚 Teaching [{req.node}] Mode: {req.mode}")
+    tracing.tag(node=req.node, model=req.model, mode=req.mode)
+
+    structured = req.structured and req.mode in STRUCTURED_MODES
+
+    cached = await cached_lesson(req)
+    if cached is not None:
+        print("💾 Replaying lesson from cache")
+        tracing.tag(cache="hit")
+        if not structured:
+            return StreamingResponse(iter([cached]), media_type="text/plain")
+    else:
+        # Reject up front while a clean 429 can still be sent
+        scheduler.admit(req.model)
+
+    async def texts():
+        if cached is not None:
+            yield cached
+            return
+        async for chunk in lesson_text(req):
+            yield chunk
+
+    async def generate():
+        with prefetcher.live_request():
+            try:
+                async for chunk in texts():
+                    yield chunk
+            except Exception as e:
+                yield f"Error: {str(e)}"
+
+    if structured:
+        return StreamingResponse(structured_lesson(req.mode, texts()), media_type="application/x-ndjson")
     return StreamingResponse(generate(), media_type="text/plain")
+
+
+def resolve_modes(modes):
+    """'all', 'likely' or a list of modes -> valid, de-duplicated mode names."""
+    if modes == "all":
+        return list(LESSON_MODES)
+    if modes == "likely":
+        modes = LESSON_LIKELY_MODES
+    elif isinstance(modes, str):
+        modes = [modes]
+    resolved = []
+    for mode in modes:
+        mode = mode.lower()
+        if mode not in LESSON_MODES:
+            print(f"⚠️ Skipping unknown mode '{mode}' in batch")
+        elif mode not in resolved:
+            resolved.append(mode)
+    return resolved
+
+
+async def warm_lesson(lesson):
+    try:
+        async for _ in lesson_text(lesson, priority=Priority.PREFETCH):
+            pass
+        print(f"📦 Cached {lesson.mode} lesson for [{lesson.node}]")
+    except Exception as e:
+        print(f"Background {lesson.mode} lesson for [{lesson.node}] failed: {e}")
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(req: LessonBatchRequest):
+    """
+    Several lesson modes for one node at once, each taking its own scheduler
+    slot so they run as concurrently as the model's limit allows.
+
+    stream=True multiplexes them into one NDJSON stream:
+      {"mode": m, "type": "chunk", "text": "..."}   in arrival order
+      {"mode": m, "type": "done", "cached": bool}   or {"mode": m, "type": "error", ...}
+      {"type": "end", "modes": [...]}               once every mode finished
+    stream=False starts the uncached modes in the background at prefetch
+    priority so later tab switches replay from the lesson cache, and
+    returns 202 immediately.
+    """
+    modes = resolve_modes(req.modes)
+    print(f"\n📚 Batch lessons for [{req.node}]: {', '.join(modes)}")
+    lessons = [
+        AnalysisRequest(
+            node=req.node, context=req.context, model=req.model, mode=mode,
+            difficulty=req.difficulty, num_questions=req.num_questions, bypass_cache=req.bypass_cache,
+        )
+        for mode in modes
+    ]
+    cached = {lesson.mode: await cached_lesson(lesson) for lesson in lessons}
+
+    if not req.stream:
+        queued, skipped = [], []
+        for lesson in lessons:
+            if cached[lesson.mode] is not None:
+                continue
+            if not lesson_cacheable(lesson.mode):
+                # Nothing to replay later (quiz without LESSON_CACHE_QUIZ)
+                skipped.append(lesson.mode)
+                continue
+            task = asyncio.ensure_future(warm_lesson(lesson))
+            lesson_batch_tasks.add(task)
+            task.add_done_callback(lesson_batch_tasks.discard)
+            queued.append(lesson.mode)
+        return JSONResponse(status_code=202, content={
+            "queued": queued,
+            "cached": [m for m in modes if cached[m] is not None],
+            "skipped": skipped,
+        })
+
+    if any(text is None for text in cached.values()):
+        scheduler.admit(req.model)
+
+    async def run(lesson, queue):
+        mode = lesson.mode
+        try:
+            if cached[mode] is not None:
+                await queue.put({"mode": mode, "type": "chunk", "text": cached[mode]})
+            else:
+                async for chunk in lesson_text(lesson):
+                    await queue.put({"mode": mode, "type": "chunk", "text": chunk})
+            await queue.put({"mode": mode, "type": "done", "cached": cached[mode] is not None})
+        except Exception as e:
+            await queue.put({"mode": mode, "type": "error", "error": str(e)})
+
+    async def generate():
+        queue = asyncio.Queue()
+        with prefetcher.live_request():
+            tasks = [asyncio.ensure_future(run(lesson, queue)) for lesson in lessons]
+            try:
+                remaining = len(tasks)
+                while remaining:
+                    record = await queue.get()
+                    if record["type"] != "chunk":
+                        remaining -= 1
+                    yield ndjson(record)
+                yield ndjson({"type": "end", "modes": modes})
+            finally:
+                # Client gone: release slots and shared flights
+                for task in tasks:
+                    task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,139 @@
+import asyncio
+import tracing
+
+
+class StreamCancelled(Exception):
+    """The shared upstream was cancelled before it finished."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one upstream call.
+    Every caller awaits the same task; a caller that is cancelled does not
+    cancel the work for the others. The work itself is only cancelled once
+    every waiter has gone. Its trace spans are copied to every caller.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._waiters = {}
+
+    def in_flight(self):
+        return len(self._calls)
+
+    async def do(self, key, fn):
+        call = self._calls.get(key)
+        if call is None:
+            shared = tracing.Shared()
+            call = self._calls[key] = (asyncio.ensure_future(shared.run(fn())), shared)
+            call[0].add_done_callback(lambda t: self._forget(key, t))
+        task, shared = call
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters.get(task) == 1 and not task.done():
+                task.cancel()
+                self._forget(key, task)
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+            # What the work recorded so far, even for a caller that gave up
+            shared.adopt()
+
+    def _forget(self, key, task):
+        call = self._calls.get(key)
+        if call is not None and call[0] is task:
+            del self._calls[key]
+
+
+class SharedStream:
+    """
+    Fans one upstream async iterator out to any number of subscribers.
+    Chunks are recorded as they arrive, so a late subscriber is first
+    replayed what was already produced and then follows the live stream.
+    The upstream is cancelled once its last subscriber goes away. If it is
+    cancelled while subscribers remain, they get StreamCancelled instead of
+    a cut-off stream that looks finished. Its trace spans are copied to each
+    subscriber when it stops reading.
+    """
+
+    def __init__(self, source, on_finish=None):
+        self.chunks = []
+        self.finished = False
+        self.abandoned = False
+        self.error = None
+        self.subscribers = 0
+        self._on_finish = on_finish
+        self._changed = asyncio.Event()
+        self.shared = tracing.Shared()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source):
+        self.shared.enter()
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = StreamCancelled("upstream generation was cancelled")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+            if self._on_finish:
+                self._on_finish(self)
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _notify(self):
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    async def subscribe(self):
+        self.subscribers += 1
+        i = 0
+        try:
+            while True:
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                    i += 1
+                    yield chunk
+                    continue
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.shared.adopt()
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished:
+                self.abandoned = True
+                self.task.cancel()
+
+
+class StreamFlight:
+    """Single-flight registry for streamed generations."""
+
+    def __init__(self):
+        self._streams = {}
+
+    def in_flight(self):
+        return len(self._streams)
+
+    def subscribe(self, key, source_factory):
+        stream = self._streams.get(key)
+        if stream is None or stream.abandoned:
+            stream = SharedStream(source_factory(), on_finish=lambda s: self._forget(key, s))
+            self._streams[key] = stream
+        return stream.subscribe()
+
+    def _forget(self, key, stream):
+        if self._streams.get(key) is stream:
+            del self._streams[key]
@@ -3,11 +3,13 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 import shutil
+import json
 
 # Add root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import benchmark
+from options_profile import OptionsProfile
 
 class TestBenchmark(unittest.TestCase):
     def setUp(self):
@@ -42,7 +44,17 @@ class TestBenchmark(unittest.TestCase):
             resp.status_code = 200
 
             content = "ok"
-            if "hello" in prompt.lower():
+            if "Curriculum Designer" in prompt:
+                names = ["Lenses", "Mirrors", "Lasers", "Fiber Optics", "Diffraction"]
+                content = json.dumps({"children": [{"name": n, "desc": "d", "status": "concept"} for n in names]})
+            elif "Historian" in prompt:
+                content = '[{"year": "1905", "title": "Relativity", "description": "Einstein."}]'
+            elif "Professor" in prompt:
+                question = {"question": "Q?", "options": ["a", "b", "c", "d"], "correct_index": 0, "explanation": "e"}
+                content = json.dumps({"questions": [question] * 3})
+            elif "Expert Tutor" in prompt:
+                content = "# Lesson\nSome text."
+            elif "hello" in prompt.lower():
                 content = "Hello there!"
             elif "json" in prompt.lower():
                 content = '{"title": "Test", "author": "Me", "year": 2023, "genres": ["Fiction"]}'
@@ -53,11 +65,18 @@ class TestBenchmark(unittest.TestCase):
             elif "summarize" in prompt.lower():
                 content = "The internet is a big network."
 
-            resp.json.return_value = {
-                "response": content,
+            # Streamed NDJSON: content chunks, then the final stats
+            final = {
+                "response": "",
+                "done": True,
+                "load_duration": 2000000000 if payload.get('keep_alive') == 0 else 1000000,
+                "prompt_eval_count": 40,
+                "prompt_eval_duration": 20000000, # 0.02s
                 "eval_count": 10,
                 "eval_duration": 100000000 # 0.1s
             }
+            chunks = [{"response": content[:3], "done": False}, {"response": content[3:], "done": False}, final]
+            resp.iter_lines.return_value = [json.dumps(c).encode() for c in chunks]
             return resp
 
         mock_post.side_effect = side_effect
@@ -77,6 +96,174 @@ class TestBenchmark(unittest.TestCase):
         self.assertTrue(os.path.exists(os.path.join(run_dir, "results.json")))
         self.assertTrue(os.path.exists(os.path.join(run_dir, "REPORT.md")))
         self.assertTrue(os.path.exists(os.path.join(run_dir, "recommendation.txt")))
+        self.assertTrue(os.path.exists(os.path.join("benchmark_results_test", "index.jsonl")))
+
+        with open(os.path.join(run_dir, "results.json")) as f:
+            results = json.load(f)
+        tests = results["tests"]["mock-model"]
+        self.assertTrue(all(t["passed"] for t in tests))
+        self.assertEqual(tests[0]["prompt_tokens_per_second"], 2000)
+        self.assertIn("ttft", tests[0])
+        self.assertEqual(results["cold_start"]["mock-model"]["run"], "cold")
+        sweep = results["concurrency"]["mock-model"]
+        self.assertEqual([l["concurrency"] for l in sweep], [1, 2, 4, 8])
+        self.assertTrue(all(l["errors"] == 0 for l in sweep))
+
+        workload = results["workload_summary"]["mock-model"]
+        self.assertEqual(workload["expand"]["json_rate"], 1)
+        self.assertEqual(workload["quiz"]["pass_rate"], 1)
+        self.assertEqual(workload["markdown_pass_rate"], 1)
+        with open(os.path.join(run_dir, "recommendation.txt")) as f:
+            self.assertEqual(f.read(), "mock-model")
+
+        # Every generation streams; the only other call is the unload before the cold run
+        unloads = [c for c in mock_post.call_args_list if c.kwargs["json"].get("keep_alive") == 0]
+        self.assertEqual(len(unloads), 1)
+        streamed = [c for c in mock_post.call_args_list if c not in unloads]
+        self.assertTrue(all(c.kwargs.get("stream") for c in streamed))
+
+    def test_workload_scores_duplicates_and_forbidden_children(self):
+        item = {"kind": "expand", "node": "Optics", "context": "Physics > Optics", "depth": 2,
+                "recent_nodes": ["Mechanics"]}
+        children = [{"name": n, "desc": "d", "status": "concept"} for n in ["Lenses", "lenses", "Mechanics", "Lasers"]]
+        score = benchmark.score_workload_item(item, "Sure!\n" + json.dumps({"children": children}))
+        self.assertEqual((score["json_valid"], score["child_count"], score["kept"], score["dropped"]), (True, 4, 2, 2))
+        self.assertFalse(score["passed"])
+
+        self.assertFalse(benchmark.score_workload_item(item, "no json here")["json_valid"])
+
+    def test_workload_score_requires_parseable_expansions(self):
+        rows = [{"kind": "expand", "status": "success", "passed": i < 3, "json_valid": i < 3,
+                 "child_count": 5, "kept": 5, "dropped": 0, "duration": 1.0, "ttft": 0.2, "tokens_per_second": 20}
+                for i in range(4)]
+        summary = benchmark.summarize_workload(rows)
+        self.assertEqual(summary["expand"]["json_rate"], 0.75)
+        self.assertIsNone(benchmark.workload_score(summary))
+
+        rows[3].update(passed=True, json_valid=True)
+        self.assertIsNotNone(benchmark.workload_score(benchmark.summarize_workload(rows)))
+
+    def test_workload_payload_matches_server(self):
+        import server
+        item = benchmark.build_workload(benchmark.WORKLOAD_TOPICS[1:2], ["quiz"])
+        expand = benchmark.workload_payload("llama3", item[0])
+        req = server.ExpandRequest(node="Optics", context="Physics > Optics", model="llama3",
+                                   temperature=benchmark.EXPAND_TEMPERATURE,
+                                   recent_nodes=benchmark.WORKLOAD_TOPICS[1]["recent_nodes"])
+        self.assertEqual(expand["prompt"], server.build_expand_prompt(req))
+        self.assertEqual(expand["options"], server.expand_options(req))
+        quiz = benchmark.workload_payload("llama3", item[1])
+        self.assertEqual(quiz["prompt"], server.lesson_payload(server.AnalysisRequest(
+            node="Optics", context="Physics > Optics", model="llama3", mode="quiz")).get("prompt"))
+
+    def test_workload_payload_uses_tuned_options(self):
+        import server
+        profile = OptionsProfile(None)
+        profile.models = {"llama3:latest": {"expand": {"num_ctx": 2048}, "lesson": {"num_batch": 1024}}}
+        expand, quiz = benchmark.build_workload(benchmark.WORKLOAD_TOPICS[1:2], ["quiz"])
+        req = server.ExpandRequest(node="Optics", context="Physics > Optics", model="llama3", temperature=0.5)
+        with patch.object(benchmark, "options_profile", profile), patch.object(server, "options_profile", profile):
+            self.assertEqual(benchmark.workload_payload("llama3", expand)["options"], server.expand_options(req))
+            self.assertEqual(benchmark.workload_payload("llama3", quiz)["options"],
+                             {"temperature": 0.6, "num_batch": 1024})
+            # Tuning trials start from the defaults, not from the current profile
+            trial = benchmark.workload_payload("llama3", expand, {"num_batch": 256}, OptionsProfile(None))
+        self.assertEqual(trial["options"], {"temperature": 0.5, "num_ctx": 4096, "num_batch": 256})
+
+    def stream_response(self, chunks, clock, step=1.0):
+        """A streamed /api/generate response whose lines each arrive `step` seconds apart."""
+        def lines():
+            for chunk in chunks:
+                clock[0] += step
+                yield json.dumps(chunk).encode() if chunk is not None else b""
+        resp = MagicMock()
+        resp.status_code = 200
+        resp.iter_lines.side_effect = lines
+        return resp
+
+    def test_ttft_is_taken_from_the_first_non_empty_chunk(self):
+        clock = [0.0]
+        final = {"response": "", "done": True, "eval_count": 4, "eval_duration": 2_000_000_000,
+                 "prompt_eval_count": 10, "prompt_eval_duration": 500_000_000}
+        chunks = [None, {"response": "", "done": False}, {"response": "Hi", "done": False},
+                  {"response": " there", "done": False}, final]
+        with patch('benchmark.time.perf_counter', lambda: clock[0]), \
+                patch('benchmark.requests.post', return_value=self.stream_response(chunks, clock)):
+            stats = benchmark.stream_generate({"model": "m", "prompt": "p"})
+        # The blank line and the empty keep-alive chunk come before any text
+        self.assertEqual(stats["ttft"], 3.0)
+        self.assertEqual(stats["duration"], 5.0)
+        self.assertEqual(stats["response"], "Hi there")
+        self.assertEqual((stats["tokens_per_second"], stats["prompt_tokens_per_second"]), (2, 20))
+
+        clock[0] = 0.0
+        with patch('benchmark.time.perf_counter', lambda: clock[0]), \
+                patch('benchmark.requests.post', return_value=self.stream_response([final], clock)):
+            stats = benchmark.stream_generate({"model": "m", "prompt": "p"})
+        self.assertEqual(stats["ttft"], stats["duration"])
+
+    @patch('benchmark.requests.post')
+    def test_cold_start_is_measured_apart_from_warm_runs(self, mock_post):
+        state = {"loaded": True}
+        calls = []
+
+        def side_effect(*args, **kwargs):
+            payload = kwargs["json"]
+            if payload.get("keep_alive") == 0:
+                calls.append("unload")
+                state["loaded"] = False
+                return MagicMock(status_code=200)
+            calls.append("generate")
+            load = 0 if state["loaded"] else 3_000_000_000
+            state["loaded"] = True
+            return self.stream_response([
+                {"response": "Hello there!", "done": False},
+                {"response": "", "done": True, "load_duration": load, "eval_count": 3, "eval_duration": 100_000_000},
+            ], [0.0], step=0)
+
+        mock_post.side_effect = side_effect
+        cold = benchmark.run_cold_start("m")
+        warm = benchmark.run_test("m", benchmark.TEST_SUITE[0])
+
+        self.assertEqual(calls, ["unload", "generate", "generate"])
+        self.assertEqual((cold["run"], cold["status"], cold["load_duration"]), ("cold", "success", 3.0))
+        self.assertNotIn("response", cold)
+        self.assertEqual((warm["run"], warm["load_duration"]), ("warm", 0))
+        self.assertTrue(warm["passed"])
+
+    def test_saturation_point_is_where_throughput_stops_growing(self):
+        def sweep(*rates):
+            return [{"concurrency": 2 ** i, "aggregate_tokens_per_second": r} for i, r in enumerate(rates)]
+
+        self.assertEqual(benchmark.saturation_point(sweep(20, 38, 41, 42)), 2)
+        self.assertEqual(benchmark.saturation_point(sweep(20, 21, 40)), 1)
+        self.assertIsNone(benchmark.saturation_point(sweep(20, 38, 70, 130)))
+        self.assertEqual(benchmark.saturation_point(sweep(20, 38, 70, 130), gain=0.9), 2)
+        self.assertIsNone(benchmark.saturation_point(sweep(20)))
+
+    def test_concurrency_sweep_counts_errors_and_ttft_per_level(self):
+        def fake_stream(payload):
+            if payload["prompt"] == "fail":
+                raise RuntimeError("HTTP 500")
+            return {"eval_count": 10, "tokens_per_second": 20.0, "ttft": 0.5}
+
+        calls = []
+
+        def stream(payload):
+            calls.append(payload)
+            # Every third request fails
+            return fake_stream(dict(payload, prompt="fail") if len(calls) % 3 == 0 else payload)
+
+        with patch('benchmark.stream_generate', side_effect=stream):
+            levels = benchmark.run_concurrency_sweep("m", [1, 2, 4])
+
+        self.assertEqual([l["concurrency"] for l in levels], [1, 2, 4])
+        self.assertEqual(len(calls), 7)
+        self.assertEqual(sum(l["errors"] for l in levels), 2)
+        for level in levels:
+            self.assertEqual(level["requests"], level["concurrency"])
+            self.assertEqual((level["avg_ttft"], level["max_ttft"], level["avg_tokens_per_second"]), (0.5, 0.5, 20.0))
+            self.assertGreater(level["aggregate_tokens_per_second"], 0)
 
 if __name__ == '__main__':
     unittest.main()
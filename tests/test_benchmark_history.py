@@ -0,0 +1,120 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import benchmark_history as history
+
+
+def make_results(model="m", durations=(1.0, 1.1, 0.9), tps=(30.0, 31.0, 29.0), ttft=(0.2, 0.21, 0.19)):
+    tests = [
+        {"test_id": "sanity", "status": "success", "passed": True, "duration": d, "tokens_per_second": t, "ttft": f}
+        for d, t, f in zip(durations, tps, ttft)
+    ]
+    workload = [
+        {"kind": "expand", "status": "success", "passed": True, "duration": d, "tokens_per_second": t, "ttft": f}
+        for d, t, f in zip(durations, tps, ttft)
+    ]
+    return {"tests": {model: tests}, "workload": {model: workload}}
+
+
+class TestBenchmarkHistory(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save_run(self, run_id, results):
+        run_dir = os.path.join(self.dir, run_id)
+        os.makedirs(run_dir)
+        with open(os.path.join(run_dir, "results.json"), "w") as f:
+            json.dump(results, f)
+        history.append_index(run_dir, results, self.dir, ollama_version="0.5.7")
+        return run_dir
+
+    def test_samples_cover_tests_workload_and_old_format(self):
+        samples = history.run_samples(make_results())
+        self.assertEqual(set(samples["m"]), {"test:sanity", "workload:expand"})
+        self.assertEqual(samples["m"]["test:sanity"]["duration"], [1.0, 1.1, 0.9])
+        # Runs from before the cold-start split stored {model: [tests]}
+        old = history.run_samples({"m": [{"test_id": "sanity", "status": "success", "duration": 2.0}]})
+        self.assertEqual(old, {"m": {"test:sanity": {"duration": [2.0]}}})
+
+    def test_significant_regression_needs_interval_and_size(self):
+        slower = history.compare_samples([1.0, 1.1, 0.9], [1.5, 1.6, 1.4], "duration")
+        self.assertTrue(slower["regression"])
+        self.assertLess(slower["ci"][0], 0.5)
+        self.assertGreater(slower["ci"][1], 0.5)
+
+        faster_tps = history.compare_samples([30, 31, 29], [40, 41, 39], "tokens_per_second")
+        self.assertTrue(faster_tps["significant"])
+        self.assertFalse(faster_tps["regression"])
+
+        noisy = history.compare_samples([1.0, 2.0, 0.5], [1.5, 0.8, 2.2], "duration")
+        self.assertFalse(noisy["significant"])
+
+        single = history.compare_samples([1.0], [5.0], "duration")
+        self.assertIsNone(single["ci"])
+        self.assertFalse(single["regression"])
+
+        tiny = history.compare_samples([1.0, 1.0, 1.0], [1.01, 1.01, 1.01], "duration", min_change=0.05)
+        self.assertFalse(tiny["significant"])
+
+    def test_compare_against_baseline_exits_nonzero_on_regression(self):
+        self.save_run("run_a", make_results())
+        self.save_run("run_b", make_results(durations=(1.0, 1.05, 0.95)))
+        self.save_run("run_c", make_results(tps=(20.0, 21.0, 19.0)))
+
+        self.assertEqual(history.set_baseline("run_a", self.dir), "run_a")
+        self.assertEqual(history.main(["--dir", self.dir, "compare", "run_b"]), 0)
+        output = os.path.join(self.dir, "COMPARE.md")
+        self.assertEqual(history.main(["--dir", self.dir, "compare", "latest", "--output", output]), 1)
+        with open(output) as f:
+            self.assertIn("regression", f.read())
+        # Several runs: each later one against the first
+        self.assertEqual(history.main(["--dir", self.dir, "compare", "run_a", "run_b", "run_c"]), 1)
+
+    def test_index_is_append_only(self):
+        self.save_run("run_a", make_results())
+        self.save_run("run_b", make_results(tps=(40.0, 41.0, 39.0)))
+        index = history.read_index(self.dir)
+        self.assertEqual([e["run"] for e in index], ["run_a", "run_b"])
+        self.assertEqual(index[1]["models"]["m"]["test:sanity"]["tokens_per_second"], 40.0)
+        self.assertEqual(index[1]["models"]["m"]["test:sanity"]["n"], 3)
+        self.assertEqual(index[0]["ollama_version"], "0.5.7")
+        self.assertEqual(history.main(["--dir", self.dir, "trend", "--model", "m"]), 0)
+
+    def test_latest_base_skips_the_run_being_compared(self):
+        self.save_run("run_a", make_results())
+        run_b = self.save_run("run_b", make_results(tps=(20.0, 21.0, 19.0)))
+        output = os.path.join(self.dir, "COMPARE.md")
+        # What benchmark.py --compare latest does right after indexing run_b
+        self.assertEqual(history.compare_main(["latest", run_b], self.dir, 0.05, output), 1)
+        with open(output) as f:
+            self.assertIn("run_b vs run_a", f.read())
+
+    def test_workload_is_compared_per_topic(self):
+        def workload(slowdown):
+            # Topics differ far more from each other than the runs do
+            return {"tests": {}, "workload": {"m": [
+                {"kind": "expand", "node": node, "status": "success", "duration": base + slowdown + jitter}
+                for node, base in (("Optics", 1.0), ("Biology", 4.0), ("History", 9.0))
+                for jitter in (0.0, 0.02)
+            ]}}
+
+        rows = history.compare_runs(workload(0.0), workload(0.5))
+        row, = rows
+        self.assertTrue(row["paired"])
+        self.assertEqual(row["n_base"], 3)
+        self.assertAlmostEqual(row["delta"], 0.5)
+        self.assertTrue(row["regression"])
+        # Pooled across topics, the same slowdown is lost in the spread
+        pooled = history.compare_samples(*(history.run_samples(w)["m"]["workload:expand"]["duration"]
+                                           for w in (workload(0.0), workload(0.5))), "duration")
+        self.assertFalse(pooled["significant"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import time
+import asyncio
+import threading
+import tempfile
+import unittest
+from unittest.mock import patch
+from cache import MemoryCache, SQLiteCache, ResponseCache, make_key
+
+
+class TestCache(unittest.TestCase):
+    def test_make_key_is_stable(self):
+        self.assertEqual(make_key("a", {"x": 1, "y": 2}), make_key("a", {"y": 2, "x": 1}))
+        self.assertNotEqual(make_key("a", 1), make_key("a", 2))
+
+    def test_memory_lru_eviction(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now least recently used
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_memory_ttl(self):
+        cache = MemoryCache(ttl=10)
+        cache.set("a", 1)
+        with patch("cache.time.monotonic", return_value=time.monotonic() + 11):
+            self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_tier_promotes_to_memory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            disk = SQLiteCache(os.path.join(tmp, "cache.db"), max_entries=2)
+            memory = MemoryCache()
+            disk.set("k", {"children": [1]})
+            cache = ResponseCache([memory, disk])
+            self.assertEqual(cache.get("k"), {"children": [1]})
+            self.assertEqual(memory.get("k"), {"children": [1]})
+            self.assertEqual(cache.stats()["hits"], 1)
+
+            disk.set("a", 1)
+            disk.set("b", 2)
+            self.assertEqual(len(disk), 2)
+            disk.close()
+
+    def test_async_access_reads_and_writes_sqlite_off_the_loop(self):
+        threads = []
+
+        class RecordingDisk(SQLiteCache):
+            def get(self, key):
+                threads.append(threading.get_ident())
+                return super().get(key)
+
+            def set(self, key, value):
+                threads.append(threading.get_ident())
+                super().set(key, value)
+
+        async def run(cache, memory):
+            await cache.aset("k", {"children": [1]})
+            memory.clear()
+            value = await cache.aget("k")
+            return threading.get_ident(), value, await cache.aget("missing")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            disk = RecordingDisk(os.path.join(tmp, "cache.db"))
+            memory = MemoryCache()
+            cache = ResponseCache([memory, disk])
+            loop_thread, value, missing = asyncio.run(run(cache, memory))
+            disk.close()
+        self.assertEqual(value, {"children": [1]})
+        self.assertIsNone(missing)
+        self.assertEqual(memory.get("k"), {"children": [1]})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from conversation import Transcripts
+
+
+class TestTranscripts(unittest.TestCase):
+    def test_history_replays_unbroken_ancestors(self):
+        t = Transcripts(max_turns=5)
+        t.record("m", ["A"], "u-a", "r-a")
+        t.record("m", ["A", "B"], "u-b", "r-b")
+        history = t.history("m", ["a", "b", "C"])
+        self.assertEqual([m["content"] for m in history], ["u-a", "r-a", "u-b", "r-b"])
+        self.assertEqual(t.history("other", ["A", "B", "C"]), [])
+
+    def test_gap_and_turn_limit(self):
+        t = Transcripts(max_turns=1)
+        t.record("m", ["A"], "u-a", "r-a")
+        t.record("m", ["A", "B"], "u-b", "r-b")
+        self.assertEqual([m["content"] for m in t.history("m", ["A", "B", "C"])], ["u-b", "r-b"])
+        # Nothing remembered for the parent: no history at all
+        self.assertEqual(t.history("m", ["A", "X", "C"]), [])
+
+    def test_deep_paths_keep_a_root_anchored_prefix(self):
+        t = Transcripts(max_turns=4)
+        path = [f"N{i}" for i in range(12)]
+        for depth in range(1, len(path)):
+            t.record("m", path[:depth], f"u{depth}", f"r{depth}")
+
+        extended = 0
+        for depth in range(2, len(path)):
+            parent = t.history("m", path[:depth]) + [
+                {"role": "user", "content": f"u{depth}"}, {"role": "assistant", "content": f"r{depth}"}]
+            child = t.history("m", path[:depth + 1])
+            self.assertLessEqual(len(child), 8)
+            # The root's turns are never dropped
+            self.assertEqual([m["content"] for m in child[:4]], ["u1", "r1", "u2", "r2"][:len(child)])
+            extended += child[:len(parent)] == parent
+        # Every level up to max_turns extends its parent; past it, the prefix
+        # restarts once per two-turn block (depths 5, 7, 9, 11)
+        self.assertEqual(extended, len(range(2, 12)) - 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
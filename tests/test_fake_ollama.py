@@ -0,0 +1,171 @@
+import json
+import time
+import asyncio
+import unittest
+from unittest.mock import patch
+import httpx
+import server
+from fake_ollama import FakeOllama, FakeOllamaThread, tokenize
+from fastapi.testclient import TestClient
+from ollama_client import OllamaClient, ollama
+
+
+def fake_client(fake):
+    return httpx.AsyncClient(base_url="http://fake", transport=httpx.ASGITransport(app=fake.app))
+
+
+class TestFakeOllama(unittest.TestCase):
+    def test_tokenize_round_trips(self):
+        text = "Hello,  wonderful world!\n\n"
+        self.assertEqual("".join(tokenize(text)), text)
+
+    def test_expand_answers_are_valid_and_deterministic(self):
+        fake = FakeOllama(ttft=0, tps=10000)
+        prompt = server.build_expand_prompt(server.ExpandRequest(
+            node="Optics", context="Physics > Optics", model="llama3", temperature=0.5))
+
+        async def main():
+            async with fake_client(fake) as http:
+                payload = {"model": "llama3", "prompt": prompt, "stream": False}
+                first = (await http.post("/api/generate", json=payload)).json()
+                second = (await http.post("/api/generate", json=payload)).json()
+                chat = (await http.post("/api/chat", json={
+                    "model": "llama3", "stream": False,
+                    "messages": [{"role": "user", "content": "Current Subject: Waves"}],
+                })).json()
+                return first, second, chat
+
+        first, second, chat = asyncio.run(main())
+        children = json.loads(first["response"])["children"]
+        self.assertEqual(len(children), 5)
+        self.assertTrue(all(c["name"].startswith("Optics ") for c in children))
+        self.assertEqual(first["response"], second["response"])
+        self.assertEqual(first["eval_count"], len(tokenize(first["response"])))
+        self.assertIn("Waves", chat["message"]["content"])
+
+    def test_errors_and_unknown_models(self):
+        fake = FakeOllama(error_rate=1.0)
+
+        async def main():
+            async with fake_client(fake) as http:
+                failed = await http.post("/api/generate", json={"model": "llama3", "prompt": "hi"})
+                missing = await http.post("/api/generate", json={"model": "nope", "prompt": "hi"})
+                return failed.status_code, missing.status_code
+
+        self.assertEqual(asyncio.run(main()), (500, 404))
+
+    def test_keep_alive_and_eviction_show_in_ps(self):
+        fake = FakeOllama(ttft=0, tps=10000)
+
+        async def main():
+            async with fake_client(fake) as http:
+                await http.post("/api/generate", json={"model": "llama3", "prompt": "", "stream": False})
+                await http.post("/api/generate", json={"model": "mistral", "prompt": "hi", "stream": False,
+                                                       "keep_alive": 0})
+                loaded = [m["name"] for m in (await http.get("/api/ps")).json()["models"]]
+                await http.post("/_fake/evict", json={"model": "llama3:latest"})
+                after = (await http.get("/api/ps")).json()["models"]
+                return loaded, after
+
+        loaded, after = asyncio.run(main())
+        self.assertEqual(loaded, ["llama3:latest"])
+        self.assertEqual(after, [])
+
+    def test_unloading_never_loads(self):
+        fake = FakeOllama(ttft=0, tps=10000, load_delay=0.5)
+
+        async def main():
+            async with fake_client(fake) as http:
+                start = time.perf_counter()
+                cold = (await http.post("/api/generate", json={"model": "llama3", "keep_alive": 0, "stream": False})).json()
+                elapsed = time.perf_counter() - start
+                await http.post("/api/generate", json={"model": "mistral", "stream": False})
+                await http.post("/api/generate", json={"model": "mistral", "keep_alive": 0, "stream": False})
+                return cold, elapsed, (await http.get("/api/ps")).json()["models"]
+
+        cold, elapsed, loaded = asyncio.run(main())
+        self.assertEqual(cold["done_reason"], "unload")
+        self.assertNotIn("load_duration", cold)
+        self.assertLess(elapsed, 0.25)
+        self.assertEqual(loaded, [])
+        # Only mistral's explicit load counts
+        self.assertEqual(fake.counters["loads"], 1)
+
+    def test_replayed_chat_history_only_evaluates_the_new_turn(self):
+        fake = FakeOllama(ttft=0.2, tps=10000)
+        system = {"role": "system", "content": "You are a patient tutor. " * 20}
+        question = {"role": "user", "content": "Current Subject: Waves"}
+
+        async def main():
+            async with fake_client(fake) as http:
+                first = (await http.post("/api/chat", json={
+                    "model": "llama3", "stream": False, "messages": [system, question]})).json()
+                follow_up = (await http.post("/api/chat", json={
+                    "model": "llama3", "stream": False, "messages": [
+                        system, question, first["message"], {"role": "user", "content": "Go deeper"}]})).json()
+                await http.post("/_fake/evict", json={"model": "llama3"})
+                reloaded = (await http.post("/api/chat", json={
+                    "model": "llama3", "stream": False, "messages": [system, question]})).json()
+                return first, follow_up, reloaded
+
+        first, follow_up, reloaded = asyncio.run(main())
+        self.assertEqual(first["prompt_eval_duration"], int(0.2 * 1e9))
+        self.assertLess(follow_up["prompt_eval_count"], 5)
+        self.assertLess(follow_up["prompt_eval_duration"], first["prompt_eval_duration"] / 10)
+        # Eviction drops the cached context along with the model
+        self.assertEqual(reloaded["prompt_eval_count"], first["prompt_eval_count"])
+
+    def test_streams_over_a_socket_with_limited_slots(self):
+        fake = FakeOllama(ttft=0.05, tps=200, slots=1)
+        prompt = "Topic: Light\nExplain it."
+
+        async def main(base_url):
+            client = OllamaClient(base_url=base_url)
+
+            async def one():
+                start = time.perf_counter()
+                first = None
+                chunks = 0
+                async for chunk in client.stream_generate({"model": "llama3", "prompt": prompt}):
+                    if first is None:
+                        first = time.perf_counter() - start
+                    chunks += 1
+                return first, chunks
+
+            results = await asyncio.gather(one(), one())
+            await client.aclose()
+            return results
+
+        with FakeOllamaThread(fake) as running:
+            results = asyncio.run(main(running.base_url))
+        (ttft_a, chunks), (ttft_b, _) = sorted(results)
+        self.assertGreater(chunks, 10)
+        self.assertGreaterEqual(ttft_a, 0.05)
+        # One slot: the second request waits for the whole first generation
+        self.assertGreater(ttft_b, ttft_a + chunks / 200 * 0.5)
+        self.assertEqual(fake.counters["peak_active"], 1)
+
+    def test_backend_runs_against_fake(self):
+        fake = FakeOllama(ttft=0, tps=10000, chatter_rate=1.0)
+        server.expand_cache.clear()
+        server.model_registry.clear()
+        with patch.object(ollama, "_http", fake_client(fake)), \
+                patch.object(server, "OLLAMA_STRUCTURED_OUTPUTS", False):
+            client = TestClient(server.app)
+            models = client.get("/models").json()["models"]
+            expand = client.post("/expand", json={
+                "node": "Optics", "context": "Physics > Optics", "model": "llama3", "temperature": 0.5
+            }).json()
+            quiz = client.post("/analyze", json={
+                "node": "Optics", "context": "Physics > Optics", "model": "llama3", "mode": "quiz",
+                "structured": True,
+            })
+        self.assertEqual([m["name"] for m in models], ["llama3:latest", "mistral:latest"])
+        # Prose-wrapped answers still parse through the lenient parser
+        self.assertEqual(len(expand["children"]), 5)
+        records = [json.loads(line) for line in quiz.text.splitlines()]
+        self.assertEqual(records[-1], {"type": "done", "count": 3, "complete": True})
+
+
+if __name__ == '__main__':
+    unittest.main()
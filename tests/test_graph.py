@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+import unittest
+from graph import GraphStore, node_context
+
+CHILDREN = [
+    {"name": "Optics", "desc": "Light.", "status": "concept"},
+    {"name": "Waves", "desc": "Oscillation.", "status": "process"},
+]
+
+
+class TestGraphStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "graph.db")
+        self.graph = GraphStore(self.db)
+
+    def tearDown(self):
+        self.graph.close()
+        self.tmp.cleanup()
+
+    def test_lookup_is_normalized_and_per_model(self):
+        self.graph.record_expansion("m", "Physics > Light", CHILDREN)
+        self.assertEqual(self.graph.children("m", "physics >  LIGHT"), CHILDREN)
+        self.assertIsNone(self.graph.children("other", "Physics > Light"))
+        self.assertEqual(self.graph.find("optics")[0]["path"], "physics > light > optics")
+
+    def test_path_returns_ancestors_with_expansions(self):
+        self.graph.record_expansion("m", "Physics", [{"name": "Light", "desc": "", "status": "concept"}])
+        self.graph.record_expansion("m", "Physics > Light", CHILDREN)
+        path = self.graph.path("m", "Physics > Light > Optics")
+        self.assertEqual([n["name"] for n in path], ["Physics", "Light", "Optics"])
+        self.assertEqual(path[1]["children"], CHILDREN)
+        self.assertIsNone(path[2]["children"])
+
+    def test_regenerated_expansion_replaces_edges(self):
+        self.graph.record_expansion("m", "Physics", CHILDREN)
+        self.graph.record_expansion("m", "Physics", CHILDREN[1:])
+        self.assertEqual(self.graph.children("m", "Physics"), CHILDREN[1:])
+
+    def test_lessons(self):
+        self.graph.record_lesson("m", "Physics > Light", "explain", "medium", 3, "# Light")
+        self.assertEqual(self.graph.lesson("m", "physics > light", "explain", "medium", 3), "# Light")
+        self.assertIsNone(self.graph.lesson("m", "Physics > Light", "eli5", "medium", 3))
+
+    def test_concurrent_writers_share_the_file(self):
+        stores = [GraphStore(self.db) for _ in range(4)]
+        errors = []
+
+        def write(store, i):
+            try:
+                for j in range(20):
+                    store.record_expansion("m", f"Root > Topic {i} > Sub {j}", CHILDREN)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(s, i)) for i, s in enumerate(stores)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for store in stores:
+            store.close()
+        self.assertEqual(errors, [])
+        # Root, 4 topics, 80 subs, 160 children
+        self.assertEqual(self.graph.stats()["nodes"], 1 + 4 + 80 + 160)
+
+    def test_node_context_appends_missing_node(self):
+        self.assertEqual(node_context("Light", "Physics > Light"), "Physics > Light")
+        self.assertEqual(node_context("Light", "Physics"), "Physics > Light")
+        self.assertEqual(node_context("Light", ""), "Light")
+
+
+if __name__ == '__main__':
+    unittest.main()
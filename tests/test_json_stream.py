@@ -0,0 +1,54 @@
+import json
+import unittest
+from json_stream import StreamingJSONParser
+
+
+def feed_in_chunks(parser, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+class TestStreamingJSONParser(unittest.TestCase):
+    def test_children_emitted_as_they_close(self):
+        parser = StreamingJSONParser()
+        events = parser.feed('Sure!\n```json\n{"children": [{"name": "A"}, ')
+        self.assertEqual(events, [("item", "children", {"name": "A"})])
+        events = parser.feed('{"name": "B, {tricky}"}]}\n```\nHope that helps.')
+        self.assertEqual(events[0], ("item", "children", {"name": "B, {tricky}"}))
+        self.assertEqual(events[1][0], "document")
+        self.assertEqual(len(parser.document["children"]), 2)
+        self.assertTrue(parser.done)
+
+    def test_root_array_elements(self):
+        text = '[{"year": "1905", "title": "SR"}, {"year": "1915", "title": "GR"}, 3, "x"]'
+        events = feed_in_chunks(StreamingJSONParser(), text, 1)
+        items = [e[2] for e in events if e[0] == "item"]
+        self.assertEqual(items, [{"year": "1905", "title": "SR"}, {"year": "1915", "title": "GR"}, 3, "x"])
+
+    def test_escapes_split_across_chunks(self):
+        doc = {"questions": [{"question": 'He said \\"hi\\" [ok]', "options": ["a", "b"]}]}
+        text = json.dumps(doc)
+        for size in (1, 2, 3, 7):
+            parser = StreamingJSONParser()
+            events = feed_in_chunks(parser, text, size)
+            self.assertEqual(parser.document, doc)
+            self.assertEqual(events[0], ("item", "questions", doc["questions"][0]))
+
+    def test_incomplete_document(self):
+        parser = StreamingJSONParser()
+        events = parser.feed('{"children": [{"name": "A"}, {"name": "B"')
+        self.assertEqual(len(events), 1)
+        self.assertFalse(parser.done)
+        self.assertIsNone(parser.document)
+
+    def test_ignores_text_after_root(self):
+        parser = StreamingJSONParser()
+        parser.feed('{"a": 1} {"b": 2}')
+        self.assertEqual(parser.document, {"a": 1})
+        self.assertEqual(parser.document_text, '{"a": 1}')
+
+
+if __name__ == '__main__':
+    unittest.main()
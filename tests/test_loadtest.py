@@ -0,0 +1,89 @@
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+import httpx
+import server
+import loadtest
+from fake_ollama import FakeOllama
+from ollama_client import ollama
+
+
+SCENARIO = {
+    "name": "tiny",
+    "model": "llama3",
+    "topics": ["Optics"],
+    "think_time": [0, 0],
+    "users": [{"name": "driller", "steps": [
+        {"action": "models"},
+        {"action": "expand", "root": True},
+        {"action": "repeat", "times": 2, "steps": [
+            {"action": "expand"},
+            {"action": "analyze", "mode": "explain"},
+        ]},
+        {"action": "batch", "modes": ["eli5", "impact"]},
+    ]}],
+}
+
+
+class TestLoadTest(unittest.TestCase):
+    def setUp(self):
+        server.expand_cache.clear()
+        server.lesson_cache.clear()
+        server.model_registry.clear()
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile([3.0], 95), 3.0)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+    def test_closed_loop_against_fake_backend(self):
+        fake = FakeOllama(ttft=0, tps=10000)
+        fake_http = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.ASGITransport(app=fake.app))
+        transport = httpx.ASGITransport(app=server.app)
+        with patch.object(ollama, "_http", fake_http), patch.object(server, "graph", None):
+            summary = asyncio.run(loadtest.run_load(
+                SCENARIO, "http://backend", mode="closed", users=2, duration=0.3, transport=transport,
+            ))
+
+        endpoints = summary["endpoints"]
+        self.assertEqual(set(endpoints), {"/models", "/expand", "/analyze", "/analyze/batch"})
+        self.assertGreaterEqual(summary["journeys"], 2)
+        self.assertEqual(summary["errors"], 0)
+        # Every journey drills two levels below the root
+        self.assertEqual(endpoints["/expand"]["requests"], 3 * endpoints["/models"]["requests"])
+        self.assertIsNotNone(endpoints["/analyze"]["ttfb"]["p50"])
+        self.assertEqual(endpoints["/analyze/batch"]["requests"], endpoints["/models"]["requests"])
+        self.assertIsNotNone(endpoints["/analyze/batch"]["ttfb"]["p50"])
+        self.assertIsNone(endpoints["/expand"]["ttfb"])
+
+        with tempfile.TemporaryDirectory() as run_dir:
+            report = loadtest.write_report(summary, run_dir)
+            with open(report) as f:
+                text = f.read()
+        self.assertIn("| /analyze |", text)
+
+    def test_errors_are_counted_per_endpoint(self):
+        def handler(request):
+            return httpx.Response(500, text="boom")
+
+        metrics = loadtest.Metrics()
+
+        async def main():
+            async with httpx.AsyncClient(base_url="http://backend", transport=httpx.MockTransport(handler)) as http:
+                learner = loadtest.Learner(http, SCENARIO, metrics, loadtest.random.Random(0))
+                await learner.journey(SCENARIO["users"][0])
+
+        asyncio.run(main())
+        summary = metrics.summary()
+        self.assertEqual(summary["endpoints"]["/models"]["error_rate"], 1.0)
+        # A failed click leaves the learner on the same column, so it retries
+        self.assertEqual(summary["endpoints"]["/expand"]["top_errors"], [("HTTP 500", 3)])
+        self.assertEqual(summary["endpoints"]["/analyze"]["errors"], 2)
+        self.assertEqual(summary["error_rate"], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import unittest
+from unittest.mock import patch
+import httpx
+import server
+from fastapi.testclient import TestClient
+from metrics import Registry, HTTP_REQUESTS, OLLAMA_TTFT, OLLAMA_EVAL_COUNT, JSON_PARSE_FAILURES, EXPAND_FALLBACKS
+from ollama_client import ollama
+
+
+def sample(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        server.expand_cache.clear()
+        server.lesson_cache.clear()
+        server.model_registry.clear()
+
+    def test_text_format(self):
+        registry = Registry()
+        hits = registry.counter("hits_total", "Hits.", ("route",))
+        latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+        registry.collector(lambda: [("ratio", "gauge", "Ratio.", [({"cache": 'a"b'}, 0.5)])])
+        hits.labels("/x").inc()
+        hits.labels("/x").inc(2)
+        latency.labels("/x").observe(0.1)
+        latency.labels("/x").observe(3)
+
+        text = registry.render()
+        self.assertIn("# TYPE hits_total counter", text)
+        self.assertIn('hits_total{route="/x"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="/x",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/x",le="1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/x",le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_sum{route="/x"} 3.1', text)
+        self.assertIn('latency_seconds_count{route="/x"} 2', text)
+        self.assertIn('ratio{cache="a\\"b"} 0.5', text)
+
+    def test_routes_upstream_and_failures_are_recorded(self):
+        def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": [{"name": "primary"}, {"name": "backup"}]})
+            payload = json.loads(request.content)
+            if payload["stream"]:
+                return httpx.Response(200, text="\n".join(json.dumps(c) for c in [
+                    {"response": "Hello", "done": False},
+                    {"response": "", "done": True, "eval_count": 40, "eval_duration": 2_000_000_000,
+                     "prompt_eval_count": 12},
+                ]) + "\n")
+            if payload["model"] == "primary":
+                return httpx.Response(200, json={"response": "Sure! Here are some topics."})
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Sub", "desc": "d", "status": "concept"}]}'
+            })
+
+        route = HTTP_REQUESTS.labels("/expand", "POST", "200").value
+        ttft = OLLAMA_TTFT.labels("m").count
+        evals = OLLAMA_EVAL_COUNT.labels("m").sum
+        failures = JSON_PARSE_FAILURES.labels("expand").value
+        fallbacks = EXPAND_FALLBACKS.labels("failure").value
+
+        http = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.MockTransport(handler))
+        with patch.object(ollama, "_http", http), patch.object(server, "EXPAND_HEDGE_DELAY", 0):
+            client = TestClient(server.app)
+            client.post("/expand", json={"node": "T", "context": "C", "model": "primary", "temperature": 0.5})
+            client.post("/expand", json={"node": "T", "context": "C", "model": "primary", "temperature": 0.5})
+            client.post("/analyze", json={"node": "N", "context": "C", "model": "m", "mode": "explain"})
+            text = client.get("/metrics").text
+
+        self.assertEqual(HTTP_REQUESTS.labels("/expand", "POST", "200").value, route + 2)
+        self.assertEqual(OLLAMA_TTFT.labels("m").count, ttft + 1)
+        self.assertEqual(OLLAMA_EVAL_COUNT.labels("m").sum, evals + 40)
+        self.assertEqual(JSON_PARSE_FAILURES.labels("expand").value, failures + 1)
+        self.assertEqual(EXPAND_FALLBACKS.labels("failure").value, fallbacks + 1)
+
+        self.assertIn('omniweb_ollama_tokens_per_second_bucket{model="m",le="20"}', text)
+        self.assertIn('omniweb_http_request_duration_seconds_count{route="/analyze",method="POST"}', text)
+        # The second /expand was a cache hit; the stream has finished
+        self.assertGreater(sample(text, 'omniweb_cache_hit_ratio{cache="expand"}'), 0)
+        self.assertEqual(sample(text, 'omniweb_http_streams_in_flight{route="/analyze"}'), 0)
+        self.assertEqual(sample(text, 'omniweb_ollama_streams_in_flight{model="m"}'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
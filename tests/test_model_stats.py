@@ -0,0 +1,40 @@
+import unittest
+from model_stats import ModelStats, ConstraintStats
+
+
+class TestModelStats(unittest.TestCase):
+    def test_rank_prefers_reliable_then_fast(self):
+        stats = ModelStats()
+        stats.record("flaky", False, 1.0)
+        stats.record("flaky", True, 1.0)
+        stats.record("slow", True, 9.0)
+        stats.record("quick", True, 2.0)
+        self.assertEqual(stats.rank(["flaky", "slow", "quick", "unknown"]), ["quick", "slow", "flaky", "unknown"])
+
+    def test_latency_is_smoothed(self):
+        stats = ModelStats(alpha=0.5)
+        stats.record("m", True, 2.0)
+        stats.record("m", True, 4.0)
+        self.assertEqual(stats.latency("m"), 3.0)
+
+
+class TestConstraintStats(unittest.TestCase):
+    def test_retries_avoided_against_free_form_baseline(self):
+        stats = ConstraintStats()
+        for ok in (True, False, True, False):
+            stats.record("expand", False, ok)
+        for ok in (True, True, True, False):
+            stats.record("expand", True, ok)
+        expand = stats.stats()["expand"]
+        self.assertEqual(expand["free"]["failure_rate"], 0.5)
+        self.assertEqual(expand["constrained"]["retries"], 1)
+        self.assertEqual(expand["retries_avoided"], 1.0)
+
+    def test_no_estimate_without_baseline(self):
+        stats = ConstraintStats()
+        stats.record("quiz", True, True)
+        self.assertIsNone(stats.stats()["quiz"]["retries_avoided"])
+
+
+if __name__ == '__main__':
+    unittest.main()
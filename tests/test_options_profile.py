@@ -0,0 +1,71 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import benchmark_tune
+from options_profile import OptionsProfile
+
+
+class TestOptionsProfile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "tuned_options.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data):
+        with open(self.path, "w") as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+
+    def test_load_keeps_tunable_options_only(self):
+        self.write({"models": {"llama3": {
+            "expand": {"num_ctx": 2048, "num_batch": "512", "temperature": 0.1},
+            "other": {"num_ctx": 1},
+        }}})
+        profile = OptionsProfile(self.path)
+        self.assertTrue(profile.load())
+        self.assertEqual(profile.models, {"llama3:latest": {"expand": {"num_ctx": 2048, "num_batch": 512}}})
+        base = {"temperature": 0.7, "num_ctx": 4096}
+        self.assertEqual(profile.apply("llama3:latest", "expand", base),
+                         {"temperature": 0.7, "num_ctx": 2048, "num_batch": 512})
+        self.assertIs(profile.apply("llama3", "lesson", base), base)
+
+    def test_missing_or_broken_profile_means_defaults(self):
+        profile = OptionsProfile(self.path)
+        self.assertFalse(profile.load())
+        self.assertIsNone(profile.error)
+
+        self.write("{not json")
+        self.assertFalse(profile.load())
+        self.assertIsNotNone(profile.error)
+        self.assertEqual(profile.apply("llama3", "expand", {"num_ctx": 4096}), {"num_ctx": 4096})
+
+    def test_tuner_keeps_quality_and_merges_profile(self):
+        baseline = {"options": {"num_ctx": 4096}, "pass_rate": 1.0, "duration": 2.0, "ttft": 0.5,
+                    "tokens_per_second": 20}
+        faster_but_broken = dict(baseline, options={"num_predict": 128}, pass_rate=0.5, duration=0.5)
+        faster = dict(baseline, options={"num_ctx": 2048}, duration=1.5)
+        failed = {"options": {"num_batch": 64}, "error": "boom", "pass_rate": 0.0}
+        best = benchmark_tune.pick_best("expand", baseline, [faster_but_broken, faster, failed], tolerance=0.0)
+        self.assertEqual(best["options"], {"num_ctx": 2048})
+        self.assertIs(benchmark_tune.pick_best("expand", baseline, [faster_but_broken], 0.0), baseline)
+
+        self.write({"models": {"mistral:latest": {"lesson": {"num_batch": 256}}}})
+        benchmark_tune.write_profile(self.path, {"llama3:latest": {"expand": {"best": best}}})
+        profile = OptionsProfile(self.path)
+        profile.load()
+        self.assertEqual(profile.models["llama3:latest"], {"expand": {"num_ctx": 2048}})
+        self.assertEqual(profile.models["mistral:latest"], {"lesson": {"num_batch": 256}})
+
+    def test_candidates_drop_unset_options(self):
+        space = {"num_ctx": [None, 2048], "num_batch": [512]}
+        self.assertEqual(benchmark_tune.candidates(space, grid=True, samples=1, seed=0),
+                         [{"num_batch": 512}, {"num_ctx": 2048, "num_batch": 512}])
+        self.assertEqual(len(benchmark_tune.candidates(space, grid=False, samples=1, seed=0)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
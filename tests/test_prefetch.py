@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+from models import ExpandRequest
+from prefetch import Prefetcher, predict_child_request
+
+
+def children(*names):
+    return {"children": [{"name": n, "desc": "d", "status": "concept"} for n in names]}
+
+
+def key_fn(req):
+    return (req.node, req.context, tuple(req.recent_nodes))
+
+
+class TestPrefetch(unittest.TestCase):
+    def test_predict_child_request_matches_frontend(self):
+        req = ExpandRequest(node="Physics", context="Physics", model="m", temperature=0.5, session_id="s")
+        child = predict_child_request(req, "Optics", ["Optics", "Mechanics"], ["Physics"])
+        self.assertEqual(child.context, "Physics > Optics")
+        self.assertEqual(child.recent_nodes, ["Optics", "Mechanics", "Physics"])
+        self.assertEqual(child.session_id, "s")
+
+    def test_prefetches_children_within_width(self):
+        expanded = []
+
+        async def expand(req):
+            expanded.append(req.node)
+            return children(req.node + " 1")
+
+        async def main():
+            prefetcher = Prefetcher(expand, key_fn, width=2, depth=1)
+            prefetcher.start()
+            req = ExpandRequest(node="Root", context="Root", model="m", temperature=0.5, session_id="s")
+            prefetcher.schedule(req, children("A", "B", "C"))
+            await prefetcher._queue.join()
+            await prefetcher.stop()
+
+        asyncio.run(main())
+        self.assertEqual(expanded, ["A", "B"])
+
+    def test_waits_for_live_requests(self):
+        expanded = []
+
+        async def expand(req):
+            expanded.append(req.node)
+            return children()
+
+        async def main():
+            prefetcher = Prefetcher(expand, key_fn, idle_poll=0.01)
+            prefetcher.start()
+            req = ExpandRequest(node="Root", context="Root", model="m", temperature=0.5, session_id="s")
+            with prefetcher.live_request():
+                prefetcher.schedule(req, children("A"))
+                await asyncio.sleep(0.05)
+                self.assertEqual(expanded, [])
+            await prefetcher._queue.join()
+            await prefetcher.stop()
+
+        asyncio.run(main())
+        self.assertEqual(expanded, ["A"])
+
+    def test_navigation_cancels_other_prefetches(self):
+        started = []
+        finished = []
+
+        async def expand(req):
+            started.append(req.node)
+            await asyncio.sleep(0.05)
+            finished.append(req.node)
+            return children()
+
+        async def main():
+            prefetcher = Prefetcher(expand, key_fn, workers=2)
+            prefetcher.start()
+            req = ExpandRequest(node="Root", context="Root", model="m", temperature=0.5, session_id="s")
+            prefetcher.schedule(req, children("A", "B", "C"))
+            await asyncio.sleep(0.01)
+            keep = key_fn(predict_child_request(req, "A", ["A", "B", "C"], ["Root"]))
+            prefetcher.navigate("s", keep=keep)
+            await prefetcher._queue.join()
+            await prefetcher.stop()
+
+        asyncio.run(main())
+        self.assertEqual(started, ["A", "B"])
+        self.assertEqual(finished, ["A"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from scheduler import Scheduler, Priority, QueueFull, QueueTimeout
+
+
+class TestScheduler(unittest.TestCase):
+    def test_releases_in_priority_order(self):
+        order = []
+
+        async def job(scheduler, name, priority):
+            async with scheduler.slot("m", priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            scheduler = Scheduler(default_limit=1)
+            first = asyncio.ensure_future(job(scheduler, "first", Priority.LESSON))
+            await asyncio.sleep(0)
+            waiting = [
+                asyncio.ensure_future(job(scheduler, "prefetch", Priority.PREFETCH)),
+                asyncio.ensure_future(job(scheduler, "random", Priority.RANDOM)),
+                asyncio.ensure_future(job(scheduler, "expand", Priority.EXPAND)),
+            ]
+            await asyncio.gather(first, *waiting)
+            return scheduler.stats()
+
+        stats = asyncio.run(main())
+        self.assertEqual(order, ["first", "expand", "random", "prefetch"])
+        self.assertEqual(stats["models"]["m:latest"]["active"], 0)
+        self.assertEqual(stats["wait_seconds"]["expand"]["count"], 1)
+
+    def test_promote_moves_queued_work_ahead(self):
+        order = []
+
+        async def job(scheduler, name, priority, key=None):
+            async with scheduler.slot("m", priority, key=key):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            scheduler = Scheduler(default_limit=1)
+            tasks = [asyncio.ensure_future(job(scheduler, "busy", Priority.EXPAND))]
+            await asyncio.sleep(0)
+            tasks.append(asyncio.ensure_future(job(scheduler, "random", Priority.RANDOM)))
+            tasks.append(asyncio.ensure_future(job(scheduler, "prefetch", Priority.PREFETCH, key="k")))
+            await asyncio.sleep(0)
+            scheduler.promote("k", Priority.EXPAND)
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        self.assertEqual(order, ["busy", "prefetch", "random"])
+
+    def test_queue_full_and_timeout(self):
+        async def main():
+            scheduler = Scheduler(default_limit=1, max_queue=1, max_wait=0.02)
+            async with scheduler.slot("m", Priority.EXPAND):
+                waiter = asyncio.ensure_future(scheduler.slot("m", Priority.EXPAND).__aenter__())
+                await asyncio.sleep(0)
+                with self.assertRaises(QueueFull):
+                    scheduler.admit("m")
+                with self.assertRaises(QueueTimeout):
+                    await waiter
+            self.assertTrue(scheduler.is_idle("m"))
+            return scheduler.stats()
+
+        stats = asyncio.run(main())
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+
+    def test_tagged_and_untagged_names_share_a_queue(self):
+        scheduler = Scheduler(default_limit=4, limits={"llama3": 1, "gpt-oss:120b": 2})
+        self.assertEqual(scheduler._queue("llama3:latest").limit, 1)
+        self.assertIs(scheduler._queue("llama3"), scheduler._queue("llama3:latest"))
+        self.assertEqual(scheduler._queue("gpt-oss:120b").limit, 2)
+
+        async def main():
+            async with scheduler.slot("llama3", Priority.EXPAND):
+                return scheduler.is_idle("llama3:latest")
+
+        self.assertFalse(asyncio.run(main()))
+        self.assertEqual(list(scheduler.stats()["models"]), ["llama3:latest", "gpt-oss:120b"])
+
+
+if __name__ == '__main__':
+    unittest.main()
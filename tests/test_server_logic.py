@@ -1,142 +1,740 @@
+import json
+import time
+import asyncio
+import sqlite3
+import threading
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock
+import httpx
+import server
 from server import app
+from ollama_client import ollama
+from scheduler import Scheduler
+from singleflight import StreamCancelled
+from graph import GraphStore
+from conversation import Transcripts
+from model_stats import PromptEvalStats
+from models import AnalysisRequest, ExpandRequest, ExpandSiblingsRequest
+from options_profile import OptionsProfile
 from fastapi.testclient import TestClient
 
 client = TestClient(app)
 
+
+def mock_ollama(handler):
+    """Routes the shared Ollama client through an in-memory transport."""
+    http = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.MockTransport(handler))
+    return patch.object(ollama, "_http", http)
+
+
+def stream_body(*chunks):
+    return "\n".join(json.dumps(c) for c in chunks) + "\n"
+
 class TestServerLogic(unittest.TestCase):
-    @patch('server.requests.get')
-    def test_get_models_success(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "models": [
-                {"name": "llama3", "size": 4000000000},
-                {"name": "mistral", "size": 3000000000}
-            ]
-        }
-        mock_get.return_value = mock_response
+    def setUp(self):
+        server.expand_cache.clear()
+        server.lesson_cache.clear()
+        server.model_registry.clear()
+
+    def test_get_models_success(self):
+        def handler(request):
+            return httpx.Response(200, json={
+                "models": [
+                    {"name": "llama3", "size": 4000000000},
+                    {"name": "mistral", "size": 3000000000}
+                ]
+            })
 
-        response = client.get("/models")
+        with mock_ollama(handler):
+            response = client.get("/models")
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data["models"]), 2)
         # Sort order is by name, so llama3 first
         self.assertEqual(data["models"][0]["name"], "llama3")
 
-    @patch('server.requests.post')
-    def test_random_topic_success(self, mock_post):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {"response": "Quantum Computing"}
-        mock_post.return_value = mock_response
+    def test_random_topic_success(self):
+        def handler(request):
+            return httpx.Response(200, json={"response": "Quantum Computing"})
 
-        response = client.post("/random", json={"model": "llama3"})
+        with mock_ollama(handler):
+            response = client.post("/random", json={"model": "llama3"})
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()["topic"], "Quantum Computing")
 
-    @patch('server.requests.post')
-    def test_expand_node_success(self, mock_post):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
+    def test_expand_node_success(self):
         # Mock LLM returning valid JSON string
-        mock_response.json.return_value = {
-            "response": '{"children": [{"name": "Subtopic", "desc": "desc", "status": "concept"}]}'
-        }
-        mock_post.return_value = mock_response
-
-        response = client.post("/expand", json={
-            "node": "Topic",
-            "context": "Context",
-            "model": "llama3",
-            "temperature": 0.5,
-            "recent_nodes": []
-        })
+        def handler(request):
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Subtopic", "desc": "desc", "status": "concept"}]}'
+            })
+
+        with mock_ollama(handler):
+            response = client.post("/expand", json={
+                "node": "Topic",
+                "context": "Context",
+                "model": "llama3",
+                "temperature": 0.5,
+                "recent_nodes": []
+            })
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data["children"]), 1)
         self.assertEqual(data["children"][0]["name"], "Subtopic")
 
-    @patch('server.requests.post')
-    def test_expand_node_list_response(self, mock_post):
+    def test_expand_node_list_response(self):
         # Test that server now handles list response from LLM
-        mock_response = MagicMock()
-        mock_response.status_code = 200
         # Mock LLM returning JSON array string
-        mock_response.json.return_value = {
-            "response": '[{"name": "Subtopic List", "desc": "desc", "status": "concept"}]'
-        }
-        mock_post.return_value = mock_response
-
-        response = client.post("/expand", json={
-            "node": "Topic",
-            "context": "Context",
-            "model": "llama3",
-            "temperature": 0.5,
-            "recent_nodes": []
-        })
+        def handler(request):
+            return httpx.Response(200, json={
+                "response": '[{"name": "Subtopic List", "desc": "desc", "status": "concept"}]'
+            })
+
+        with mock_ollama(handler):
+            response = client.post("/expand", json={
+                "node": "Topic",
+                "context": "Context",
+                "model": "llama3",
+                "temperature": 0.5,
+                "recent_nodes": []
+            })
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data["children"]), 1)
         self.assertEqual(data["children"][0]["name"], "Subtopic List")
 
-    @patch('server.requests.get')
-    def test_get_models_missing_name(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
+    def test_get_models_missing_name(self):
         # One valid model, one missing name
-        mock_response.json.return_value = {
-            "models": [
-                {"name": "valid_model", "size": 100},
-                {"size": 200} # Missing name
-            ]
-        }
-        mock_get.return_value = mock_response
+        def handler(request):
+            return httpx.Response(200, json={
+                "models": [
+                    {"name": "valid_model", "size": 100},
+                    {"size": 200} # Missing name
+                ]
+            })
 
-        response = client.get("/models")
+        with mock_ollama(handler):
+            response = client.get("/models")
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data["models"]), 1)
         self.assertEqual(data["models"][0]["name"], "valid_model")
 
-    @patch('server.requests.post')
-    def test_analyze_invalid_mode(self, mock_post):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.iter_lines.return_value = [b'{"response": "chunk"}']
-        mock_post.return_value.__enter__.return_value = mock_response
+    def test_analyze_invalid_mode(self):
+        sent = []
+
+        def handler(request):
+            sent.append(json.loads(request.content))
+            return httpx.Response(200, text=stream_body({"response": "chunk"}))
 
         # Request with invalid mode
-        response = client.post("/analyze", json={
-            "node": "Node", "context": "Ctx", "model": "m", "mode": "invalid_mode"
-        })
+        with mock_ollama(handler):
+            response = client.post("/analyze", json={
+                "node": "Node", "context": "Ctx", "model": "m", "mode": "invalid_mode"
+            })
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "chunk")
 
         # Check that the prompt used corresponds to "explain"
-        call_args = mock_post.call_args
-        json_body = call_args[1]['json']
-        prompt = json_body['prompt']
+        prompt = sent[-1]['prompt']
         self.assertIn("Teach 'Node' to a beginner", prompt) # "explain" prompt
 
-    @patch('server.requests.post')
-    def test_analyze_case_insensitive_mode(self, mock_post):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.iter_lines.return_value = [b'{"response": "chunk"}']
-        mock_post.return_value.__enter__.return_value = mock_response
+    def test_analyze_case_insensitive_mode(self):
+        sent = []
+
+        def handler(request):
+            sent.append(json.loads(request.content))
+            return httpx.Response(200, text=stream_body({"response": "chunk"}))
 
         # Request with mixed case mode
-        response = client.post("/analyze", json={
-            "node": "Node", "context": "Ctx", "model": "m", "mode": "HiStOrY"
-        })
+        with mock_ollama(handler):
+            response = client.post("/analyze", json={
+                "node": "Node", "context": "Ctx", "model": "m", "mode": "HiStOrY"
+            })
         self.assertEqual(response.status_code, 200)
 
         # Check that the prompt is history prompt
-        call_args = mock_post.call_args
-        json_body = call_args[1]['json']
-        prompt = json_body['prompt']
+        prompt = sent[-1]['prompt']
         self.assertIn("You are a Historian", prompt)
 
+    def test_expand_node_fallback_model(self):
+        def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": [{"name": "llama3"}, {"name": "backup"}]})
+            payload = json.loads(request.content)
+            if payload["model"] == "llama3":
+                return httpx.Response(200, json={"response": "Sorry, I cannot do that."})
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Rescued", "desc": "d", "status": "concept"}]}'
+            })
+
+        with mock_ollama(handler):
+            response = client.post("/expand", json={
+                "node": "Topic", "context": "Context", "model": "llama3", "temperature": 0.5
+            })
+        self.assertEqual(response.json()["children"][0]["name"], "Rescued")
+
+    def test_expand_node_served_from_cache(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Cached", "desc": "d", "status": "concept"}]}'
+            })
+
+        body = {"node": "Topic", "context": "Context", "model": "llama3", "temperature": 0.5}
+        with mock_ollama(handler):
+            first = client.post("/expand", json=body)
+            second = client.post("/expand", json=body)
+            client.post("/expand", json={**body, "bypass_cache": True})
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(len(calls), 2)
+
+    def test_prefetch_after_regenerate_serves_the_next_click(self):
+        generated = []
+
+        def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": [{"name": "llama3"}]})
+            prompt = json.loads(request.content)["prompt"]
+            node = "Optics" if "Current Subject: Optics" in prompt else "Physics"
+            generated.append(node)
+            names = ["Lenses", "Mirrors"] if node == "Optics" else ["Optics", "Mechanics"]
+            return httpx.Response(200, json={"response": json.dumps(
+                {"children": [{"name": n, "desc": "d", "status": "concept"} for n in names]})})
+
+        with mock_ollama(handler), patch.object(server, "PREFETCH_ENABLED", True), \
+                patch.object(server.prefetcher, "width", 1), TestClient(app) as c:
+            # Regenerate sends a hotter temperature and skips the cache
+            c.post("/expand", json={"node": "Physics", "context": "Physics", "model": "llama3",
+                                    "temperature": 0.7, "bypass_cache": True, "session_id": "s"})
+            for _ in range(100):
+                if server.prefetcher.stats()["completed"]:
+                    break
+                time.sleep(0.01)
+            click = c.post("/expand", json={
+                "node": "Optics", "context": "Physics > Optics", "model": "llama3", "temperature": 0.5,
+                "recent_nodes": ["Optics", "Mechanics", "Physics"], "session_id": "s",
+            })
+        self.assertEqual(click.json()["children"][0]["name"], "Lenses")
+        # Only the prefetch generated Optics; the click never reached Ollama
+        self.assertEqual(generated[:2], ["Physics", "Optics"])
+        self.assertEqual(generated.count("Optics"), 1)
+
+    def test_analyze_replays_completed_stream(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, text=stream_body(
+                {"response": "Hello "}, {"response": "world"}, {"response": "", "done": True}
+            ))
+
+        body = {"node": "Node", "context": "Ctx", "model": "m", "mode": "explain"}
+        with mock_ollama(handler):
+            first = client.post("/analyze", json=body)
+            second = client.post("/analyze", json=body)
+        self.assertEqual(first.text, "Hello world")
+        self.assertEqual(second.text, "Hello world")
+        self.assertEqual(len(calls), 1)
+
+    def test_analyze_incomplete_stream_not_cached(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, text=stream_body({"response": "partial"}))
+
+        body = {"node": "Node", "context": "Ctx", "model": "m", "mode": "explain"}
+        with mock_ollama(handler):
+            client.post("/analyze", json=body)
+            client.post("/analyze", json=body)
+        self.assertEqual(len(calls), 2)
+
+    def test_cancelled_lesson_flight_errors_for_joined_client_and_is_not_cached(self):
+        async def body():
+            yield (json.dumps({"response": "Part one. "}) + "\n").encode()
+            await asyncio.sleep(10)
+            yield (json.dumps({"response": "Part two.", "done": True}) + "\n").encode()
+
+        def handler(request):
+            return httpx.Response(200, content=body())
+
+        lesson = AnalysisRequest(node="Node", context="Ctx", model="m", mode="explain")
+
+        async def read(out):
+            try:
+                async for chunk in server.lesson_text(lesson):
+                    out.append(chunk)
+            except StreamCancelled:
+                out.append("cancelled")
+
+        async def main():
+            leader, joined = [], []
+            tasks = [asyncio.ensure_future(read(leader)), asyncio.ensure_future(read(joined))]
+            await asyncio.sleep(0.05)
+            stream, = server.lesson_flight._streams.values()
+            stream.task.cancel()
+            await asyncio.gather(*tasks)
+            return leader, joined
+
+        with mock_ollama(handler):
+            leader, joined = asyncio.run(main())
+        self.assertEqual(joined, ["Part one. ", "cancelled"])
+        self.assertEqual(leader, joined)
+        self.assertIsNone(server.lesson_cache.get(server.lesson_cache_key(lesson)))
+
+    def test_analyze_quiz_not_cached_by_default(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, text=stream_body({"response": "{}", "done": True}))
+
+        body = {"node": "Node", "context": "Ctx", "model": "m", "mode": "quiz"}
+        with mock_ollama(handler):
+            client.post("/analyze", json=body)
+            client.post("/analyze", json=body)
+        self.assertEqual(len(calls), 2)
+
+    def test_expand_node_hedges_slow_primary(self):
+        async def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": [{"name": "llama3"}, {"name": "fast"}]})
+            payload = json.loads(request.content)
+            if payload["model"] == "llama3":
+                await asyncio.sleep(5)
+            children = [{"name": payload["model"], "desc": "d", "status": "concept"}]
+            return httpx.Response(200, json={"response": json.dumps({"children": children})})
+
+        with mock_ollama(handler), patch.object(server, "EXPAND_HEDGE_DELAY", 0.05):
+            response = client.post("/expand", json={
+                "node": "Topic", "context": "Context", "model": "llama3", "temperature": 0.5
+            })
+        self.assertEqual(response.json()["children"][0]["name"], "fast")
+
+    def test_models_report_quantization_and_loaded_state(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json={"models": [{"name": "llama3", "size_vram": 5}]})
+            return httpx.Response(200, json={"models": [
+                {"name": "llama3", "size": 100, "details": {"quantization_level": "Q4_0"}},
+                {"name": "mistral", "size": 100},
+            ]})
+
+        with mock_ollama(handler):
+            first = client.get("/models").json()
+            client.get("/models")
+        by_name = {m["name"]: m for m in first["models"]}
+        self.assertEqual(by_name["llama3"]["quantization"], "Q4_0")
+        self.assertTrue(by_name["llama3"]["loaded"])
+        self.assertFalse(by_name["mistral"]["loaded"])
+        # The second request is served from the registry snapshot
+        self.assertEqual(sorted(calls), ["/api/ps", "/api/tags"])
+
+    def test_expand_stream_emits_children_as_they_close(self):
+        tokens = ['Sure! {"children": [{"name": "Opt', 'ics", "desc": "d"}, {"name": "Topic", "desc": "d"}, ',
+                  '{"name": "Optics", "desc": "dup"}, {"name": "Waves", "desc": "d"}]}', ' Enjoy!']
+
+        def handler(request):
+            return httpx.Response(200, text=stream_body(*({"response": t} for t in tokens)))
+
+        body = {"node": "Physics", "context": "Physics", "model": "llama3", "temperature": 0.5,
+                "recent_nodes": ["Topic"]}
+        with mock_ollama(handler):
+            response = client.post("/expand/stream", json=body)
+            records = [json.loads(line) for line in response.text.splitlines()]
+            cached = client.post("/expand", json=body).json()
+
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        names = [r["child"]["name"] for r in records if r["type"] == "child"]
+        self.assertEqual(names, ["Optics", "Waves"])
+        self.assertEqual(records[-1]["type"], "done")
+        self.assertEqual([c["name"] for c in cached["children"]], ["Optics", "Waves"])
+
+    def test_expand_stream_falls_back_when_primary_chats(self):
+        def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": [{"name": "llama3"}, {"name": "backup"}]})
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json={"models": []})
+            payload = json.loads(request.content)
+            if payload["model"] == "llama3":
+                return httpx.Response(200, text=stream_body({"response": "I'd rather chat."}))
+            return httpx.Response(200, text=stream_body({"response": '[{"name": "Rescued"}]'}))
+
+        with mock_ollama(handler):
+            response = client.post("/expand/stream", json={
+                "node": "Topic", "context": "Context", "model": "llama3", "temperature": 0.5
+            })
+        records = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(records[0], {"type": "child", "child": {"name": "Rescued"}})
+        self.assertEqual(records[-1]["children"], [{"name": "Rescued"}])
+
+    def test_analyze_structured_history(self):
+        tokens = ['[{"year": 1905, "title": "Special', ' Relativity", "description": "Einstein."}, ',
+                  '{"year": "1915", "title": "Missing description"}, ',
+                  '{"year": "1915", "title": "General Relativity", "description": "Gravity."}]']
+
+        def handler(request):
+            chunks = [{"response": t} for t in tokens] + [{"response": "", "done": True}]
+            return httpx.Response(200, text=stream_body(*chunks))
+
+        body = {"node": "Relativity", "context": "Physics", "model": "m", "mode": "history", "structured": True}
+        with mock_ollama(handler):
+            response = client.post("/analyze", json=body)
+            raw = client.post("/analyze", json={**body, "structured": False})
+        records = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(records[0], {"type": "event", "event": {
+            "year": "1905", "title": "Special Relativity", "description": "Einstein."}})
+        self.assertEqual(records[1]["event"]["title"], "General Relativity")
+        self.assertEqual(records[-1], {"type": "done", "count": 2, "complete": True})
+        # The raw stream was cached by the structured request and replays verbatim
+        self.assertEqual(raw.text, "".join(tokens))
+
+    def test_analyze_structured_quiz_validates_questions(self):
+        doc = {"questions": [
+            {"question": "Q1", "options": ["a", "b", "c", "d"], "correct_index": 2, "explanation": "e"},
+            {"question": "Q2", "options": ["a", "b"], "correct_index": 0},
+            {"question": "Q3", "options": ["a", "b", "c", "d"], "correct_index": 4},
+        ]}
+
+        def handler(request):
+            return httpx.Response(200, text=stream_body({"response": json.dumps(doc)}, {"done": True}))
+
+        with mock_ollama(handler):
+            response = client.post("/analyze", json={
+                "node": "N", "context": "C", "model": "m", "mode": "quiz", "structured": True
+            })
+        records = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([r["type"] for r in records], ["question", "done"])
+        self.assertEqual(records[0]["question"]["correct_index"], 2)
+
+    def test_full_queue_returns_429(self):
+        def handler(request):
+            raise AssertionError("Ollama must not be called")
+
+        with mock_ollama(handler), patch.object(server, "scheduler", Scheduler(default_limit=0, max_queue=0)):
+            expand = client.post("/expand", json={
+                "node": "Topic", "context": "Context", "model": "llama3", "temperature": 0.5
+            })
+            analyze = client.post("/analyze", json={
+                "node": "Node", "context": "Ctx", "model": "m", "mode": "explain"
+            })
+        self.assertEqual(expand.status_code, 429)
+        self.assertEqual(analyze.status_code, 429)
+
+    def test_full_fallback_queue_does_not_drop_slow_primary(self):
+        async def handler(request):
+            await asyncio.sleep(0.5)
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Slow", "desc": "d", "status": "concept"}]}'
+            })
+
+        # The hedge fires after 50ms, but the backup's queue is full
+        scheduler = Scheduler(limits={"backup": 0}, max_queue=0)
+        names = AsyncMock(return_value=["primary", "backup"])
+        with mock_ollama(handler), patch.object(server, "scheduler", scheduler), \
+                patch.object(server.model_registry, "names", names), patch.object(server, "EXPAND_HEDGE_DELAY", 0.05):
+            response = client.post("/expand", json={
+                "node": "Topic", "context": "Context", "model": "primary", "temperature": 0.5
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["children"][0]["name"], "Slow")
+        self.assertEqual(scheduler.rejected, 1)
+
+    def test_analyze_upstream_error_is_streamed(self):
+        def handler(request):
+            return httpx.Response(500, text="boom")
+
+        with mock_ollama(handler):
+            response = client.post("/analyze", json={
+                "node": "Node", "context": "Ctx", "model": "m", "mode": "explain"
+            })
+        self.assertTrue(response.text.startswith("Error:"))
+
+    def test_structured_outputs_send_schema_format(self):
+        payloads = []
+
+        def handler(request):
+            payload = json.loads(request.content)
+            payloads.append(payload)
+            if payload["stream"]:
+                return httpx.Response(200, text=stream_body({"response": "[]", "done": True}))
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Sub", "desc": "d", "status": "concept"}]}'
+            })
+
+        with mock_ollama(handler), patch.object(server, "OLLAMA_STRUCTURED_OUTPUTS", True):
+            client.post("/expand", json={"node": "T", "context": "C", "model": "m", "temperature": 0.5})
+            client.post("/analyze", json={"node": "N", "context": "C", "model": "m", "mode": "quiz", "num_questions": 2})
+            client.post("/analyze", json={"node": "N", "context": "C", "model": "m", "mode": "explain"})
+        expand, quiz, explain = payloads
+        self.assertEqual(expand["format"]["properties"]["children"]["maxItems"], 5)
+        self.assertEqual(quiz["format"]["properties"]["questions"]["maxItems"], 2)
+        self.assertNotIn("format", explain)
+
+    def test_tuned_options_apply_per_model_and_purpose(self):
+        profile = OptionsProfile(None)
+        profile.models = {
+            "primary:latest": {"expand": {"num_ctx": 2048, "num_predict": 384}, "lesson": {"num_batch": 1024}},
+            "backup:latest": {"expand": {"num_thread": 8}},
+        }
+        payloads = []
+
+        def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": [{"name": "primary:latest"}, {"name": "backup:latest"}]})
+            payload = json.loads(request.content)
+            payloads.append(payload)
+            if payload["stream"]:
+                return httpx.Response(200, text=stream_body({"response": "Text", "done": True}))
+            if payload["model"] == "primary":
+                return httpx.Response(200, json={"response": "Sure! Here are some topics."})
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Sub", "desc": "d", "status": "concept"}]}'
+            })
+
+        with mock_ollama(handler), patch.object(server, "options_profile", profile), \
+                patch.object(server, "EXPAND_HEDGE_DELAY", 0):
+            client.post("/expand", json={"node": "T", "context": "C", "model": "primary", "temperature": 0.5})
+            client.post("/analyze", json={"node": "N", "context": "C", "model": "primary", "mode": "explain"})
+            req = ExpandRequest(node="T", context="C", model="primary", temperature=0.5)
+            self.assertEqual(server.expand_options(req, "unknown"), {"temperature": 0.5, "num_ctx": 4096})
+
+        primary, backup, lesson = payloads
+        self.assertEqual(primary["options"], {"temperature": 0.5, "num_ctx": 2048, "num_predict": 384})
+        # The fallback gets its own tuning, not the primary's
+        self.assertEqual(backup["options"], {"temperature": 0.5, "num_ctx": 4096, "num_thread": 8})
+        self.assertEqual(lesson["options"], {"temperature": 0.6, "num_batch": 1024})
+
+    def test_constraint_stats_count_each_generation(self):
+        def handler(request):
+            if request.url.path == "/api/tags":
+                return httpx.Response(200, json={"models": [{"name": "primary"}, {"name": "backup"}]})
+            if json.loads(request.content)["model"] == "primary":
+                return httpx.Response(200, json={"response": "Sure! Here are some topics."})
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Sub", "desc": "d", "status": "concept"}]}'
+            })
+
+        stats = server.ConstraintStats()
+        with mock_ollama(handler), patch.object(server, "constraint_stats", stats), \
+                patch.object(server, "OLLAMA_STRUCTURED_OUTPUTS", False):
+            # The primary's bad output and the fallback's good one, then one good generation
+            client.post("/expand", json={"node": "T", "context": "C", "model": "primary", "temperature": 0.5})
+            client.post("/expand", json={"node": "T2", "context": "C", "model": "backup", "temperature": 0.5})
+        free = stats.stats()["expand"]["free"]
+        self.assertEqual((free["requests"], free["first_try_ok"], free["retries"]), (3, 2, 1))
+
+    def test_constraint_stats_ignore_a_slow_primary_beaten_by_the_hedge(self):
+        async def handler(request):
+            if json.loads(request.content)["model"] == "primary":
+                await asyncio.sleep(1)
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Sub", "desc": "d", "status": "concept"}]}'
+            })
+
+        stats = server.ConstraintStats()
+        names = AsyncMock(return_value=["primary", "backup"])
+        with mock_ollama(handler), patch.object(server, "constraint_stats", stats), \
+                patch.object(server.model_registry, "names", names), patch.object(server, "EXPAND_HEDGE_DELAY", 0.05):
+            client.post("/expand", json={"node": "T", "context": "C", "model": "primary", "temperature": 0.5})
+        entry = stats.stats()["expand"]["free"]
+        self.assertEqual((entry["requests"], entry["retries"]), (1, 0))
+
+    def test_graph_store_serves_later_traversals(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            if request.url.path == "/api/generate" and not json.loads(request.content)["stream"]:
+                return httpx.Response(200, json={
+                    "response": '{"children": [{"name": "Optics", "desc": "d", "status": "concept"}]}'
+                })
+            return httpx.Response(200, text=stream_body({"response": "# Light"}, {"done": True}))
+
+        graph = GraphStore(":memory:")
+        body = {"node": "Light", "context": "Physics > Light", "model": "m", "temperature": 0.5}
+        lesson = {"node": "Light", "context": "Physics > Light", "model": "m", "mode": "explain"}
+        with mock_ollama(handler), patch.object(server, "graph", graph):
+            client.post("/expand", json=body)
+            client.post("/analyze", json=lesson)
+            # Simulate a restart: the in-memory caches are gone
+            server.expand_cache.clear()
+            server.lesson_cache.clear()
+            expanded = client.post("/expand", json=body)
+            taught = client.post("/analyze", json=lesson)
+            path = client.get("/graph/path", params={"context": "Physics > Light", "model": "m"})
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(expanded.json()["children"][0]["name"], "Optics")
+        self.assertEqual(taught.text, "# Light")
+        self.assertEqual([n["name"] for n in path.json()["path"]], ["Physics", "Light"])
+
+    def test_graph_store_calls_run_off_the_event_loop(self):
+        threads = []
+
+        class LockedGraph(GraphStore):
+            def children(self, *args):
+                threads.append(threading.get_ident())
+                return super().children(*args)
+
+            def record_expansion(self, *args):
+                threads.append(threading.get_ident())
+                raise sqlite3.OperationalError("database is locked")
+
+        def handler(request):
+            return httpx.Response(200, json={
+                "response": '{"children": [{"name": "Optics", "desc": "d", "status": "concept"}]}'
+            })
+
+        body = {"node": "Light", "context": "Physics > Light", "model": "m", "temperature": 0.5}
+
+        async def expand():
+            loop_thread = threading.get_ident()
+            data = await server.expand_children(ExpandRequest(**body))
+            return loop_thread, data
+
+        with mock_ollama(handler), patch.object(server, "graph", LockedGraph(":memory:")):
+            loop_thread, data = asyncio.run(expand())
+        # A failed write is logged, not raised
+        self.assertEqual(data["children"][0]["name"], "Optics")
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_chat_expansion_replays_parent_turn(self):
+        requests = []
+        replies = {
+            "Physics": '{"children": [{"name": "Light", "desc": "d", "status": "concept"}]}',
+            "Light": '{"children": [{"name": "Optics", "desc": "d", "status": "concept"}]}',
+        }
+
+        def handler(request):
+            payload = json.loads(request.content)
+            requests.append((request.url.path, payload))
+            node = payload["messages"][-1]["content"].splitlines()[0].split(": ")[1]
+            return httpx.Response(200, json={
+                "message": {"role": "assistant", "content": replies[node]},
+                "prompt_eval_count": 10, "prompt_eval_duration": 2000000,
+            })
+
+        stats = PromptEvalStats()
+        with mock_ollama(handler), patch.object(server, "EXPAND_CHAT_HISTORY", 4), \
+                patch.object(server, "transcripts", Transcripts(max_turns=4)), \
+                patch.object(server, "prompt_stats", stats):
+            client.post("/expand", json={"node": "Physics", "context": "Physics", "model": "m", "temperature": 0.5})
+            child = client.post("/expand", json={
+                "node": "Light", "context": "Physics > Light", "model": "m", "temperature": 0.5
+            })
+        self.assertEqual(child.json()["children"][0]["name"], "Optics")
+        path, payload = requests[1]
+        self.assertEqual(path, "/api/chat")
+        # system, parent's user turn, parent's raw reply, child's turn
+        self.assertEqual([m["role"] for m in payload["messages"]], ["system", "user", "assistant", "user"])
+        self.assertEqual(payload["messages"][2]["content"], replies["Physics"])
+        self.assertEqual(payload["messages"][0], requests[0][1]["messages"][0])
+        self.assertEqual(stats.stats()["chat"]["2"]["avg_prompt_eval_ms"], 2.0)
+
+    def test_ready_reports_warmup(self):
+        warmer = server.ModelWarmer(ollama, server.model_registry, ["llama3"])
+        with patch.object(server, "warmer", warmer):
+            self.assertEqual(client.get("/ready").status_code, 503)
+            warmer.ready = True
+            self.assertEqual(client.get("/ready").json()["models"]["llama3"]["state"], "cold")
+
+    def test_lesson_batch_multiplexes_modes(self):
+        def handler(request):
+            mode_text = "History" if "Historian" in json.loads(request.content)["prompt"] else "Explain"
+            chunks = [{"response": mode_text + " 1"}, {"response": " 2"}, {"response": "", "done": True}]
+            return httpx.Response(200, text=stream_body(*chunks))
+
+        body = {"node": "N", "context": "C", "model": "m"}
+        server.lesson_cache.set(server.lesson_cache_key(AnalysisRequest(**body, mode="eli5")), "Cached eli5")
+        with mock_ollama(handler):
+            response = client.post("/analyze/batch", json={**body, "modes": ["explain", "history", "eli5", "bogus"]})
+        records = [json.loads(line) for line in response.text.splitlines()]
+        text = {}
+        for r in records:
+            if r["type"] == "chunk":
+                text[r["mode"]] = text.get(r["mode"], "") + r["text"]
+        self.assertEqual(text, {"explain": "Explain 1 2", "history": "History 1 2", "eli5": "Cached eli5"})
+        self.assertEqual(records[-1], {"type": "end", "modes": ["explain", "history", "eli5"]})
+        done = {r["mode"]: r["cached"] for r in records if r["type"] == "done"}
+        self.assertEqual(done, {"explain": False, "history": False, "eli5": True})
+
+    def test_lesson_batch_background_fills_cache(self):
+        def handler(request):
+            return httpx.Response(200, text=stream_body({"response": "Lesson"}, {"response": "", "done": True}))
+
+        lesson = AnalysisRequest(node="N", context="C", model="m", mode="impact")
+        with mock_ollama(handler):
+            asyncio.run(server.warm_lesson(lesson))
+            response = client.post("/analyze/batch", json={
+                "node": "N", "context": "C", "model": "m", "modes": ["impact", "quiz"], "stream": False
+            })
+        self.assertEqual(asyncio.run(server.cached_lesson(lesson)), "Lesson")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"queued": [], "cached": ["impact"], "skipped": ["quiz"]})
+
+    def test_resolve_modes(self):
+        self.assertEqual(server.resolve_modes("all"), list(server.LESSON_MODES))
+        with patch.object(server, "LESSON_LIKELY_MODES", ["eli5", "explain"]):
+            self.assertEqual(server.resolve_modes("likely"), ["eli5", "explain"])
+        self.assertEqual(server.resolve_modes(["Quiz", "quiz", "nope"]), ["quiz"])
+
+    def sibling_handler(self, calls, delay=0):
+        def kids(prefix):
+            return [{"name": f"{prefix} {i}", "desc": "d", "status": "concept"} for i in range(5)]
+
+        async def handler(request):
+            calls.append(json.loads(request.content))
+            await asyncio.sleep(delay)
+            # "Waves" is left out, and "Heat" only repeats a sibling name
+            doc = {"siblings": {"optics": kids("Lens"), "Heat": [{"name": "Optics", "desc": "d", "status": "concept"}]}}
+            return httpx.Response(200, json={"response": json.dumps(doc)})
+        return handler
+
+    def test_sibling_batch_fills_expand_cache(self):
+        calls = []
+        body = {"node": "Physics", "context": "Physics", "model": "m", "temperature": 0.5,
+                "children": ["Optics", "Waves", "Heat"], "parent_column": ["Physics"]}
+        with mock_ollama(self.sibling_handler(calls)), patch.object(server, "OLLAMA_STRUCTURED_OUTPUTS", True):
+            response = client.post("/expand/siblings", json=body)
+            click = client.post("/expand", json={
+                "node": "Optics", "context": "Physics > Optics", "model": "m", "temperature": 0.5,
+                "recent_nodes": ["Optics", "Waves", "Heat", "Physics"],
+            })
+        result = response.json()
+        self.assertEqual(len(result["expanded"]["Optics"]), 5)
+        self.assertEqual(result["failed"], ["Waves", "Heat"])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0]["format"]["properties"]["siblings"]["required"], ["Optics", "Waves", "Heat"])
+        # The click used the exact cache key the batch filled
+        self.assertEqual(click.json()["children"][0]["name"], "Lens 0")
+
+    def test_click_during_sibling_batch_waits_for_it(self):
+        calls = []
+        batch = ExpandSiblingsRequest(node="Physics", context="Physics", model="m", temperature=0.5,
+                                      children=["Optics", "Waves"])
+        click = ExpandRequest(node="Optics", context="Physics > Optics", model="m", temperature=0.5,
+                              recent_nodes=["Optics", "Waves"])
+
+        async def main():
+            task = asyncio.ensure_future(server.expand_siblings(batch))
+            await asyncio.sleep(0.01)
+            data = await server.expand_children(click)
+            await task
+            return data
+
+        with mock_ollama(self.sibling_handler(calls, delay=0.05)):
+            data = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(data["children"][0]["name"], "Lens 0")
+        self.assertEqual(server.sibling_batches, {})
+
 if __name__ == '__main__':
     unittest.main()
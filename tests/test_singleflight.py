@@ -0,0 +1,97 @@
+import asyncio
+import unittest
+from singleflight import SingleFlight, StreamFlight, StreamCancelled
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"children": []}
+
+        async def main():
+            flight = SingleFlight()
+            results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+            self.assertEqual(flight.in_flight(), 0)
+            return results
+
+        results = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+    def test_late_joiner_replays_stream(self):
+        starts = []
+
+        async def source():
+            starts.append(1)
+            for chunk in ["a", "b", "c"]:
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def consume(flight, delay):
+            await asyncio.sleep(delay)
+            return "".join([c async for c in flight.subscribe("k", source)])
+
+        async def main():
+            flight = StreamFlight()
+            return await asyncio.gather(consume(flight, 0), consume(flight, 0.015))
+
+        self.assertEqual(asyncio.run(main()), ["abc", "abc"])
+        self.assertEqual(len(starts), 1)
+
+    def test_upstream_error_reaches_every_subscriber(self):
+        async def source():
+            yield "a"
+            raise RuntimeError("boom")
+
+        async def consume(flight):
+            out = []
+            try:
+                async for c in flight.subscribe("k", source):
+                    out.append(c)
+            except RuntimeError as e:
+                out.append(str(e))
+            return out
+
+        async def main():
+            flight = StreamFlight()
+            return await asyncio.gather(consume(flight), consume(flight))
+
+        self.assertEqual(asyncio.run(main()), [["a", "boom"], ["a", "boom"]])
+
+    def test_cancelled_upstream_is_an_error_for_attached_subscribers(self):
+        starts = []
+
+        async def source():
+            starts.append(1)
+            yield "a"
+            await asyncio.sleep(10)
+            yield "b"
+
+        async def consume(flight, out):
+            try:
+                async for c in flight.subscribe("k", source):
+                    out.append(c)
+            except StreamCancelled:
+                out.append("cancelled")
+
+        async def main():
+            flight = StreamFlight()
+            leader, follower = [], []
+            tasks = [asyncio.ensure_future(consume(flight, leader)), asyncio.ensure_future(consume(flight, follower))]
+            await asyncio.sleep(0.01)
+            # The leader's generation is cancelled while the follower is still attached
+            flight._streams["k"].task.cancel()
+            await asyncio.gather(*tasks)
+            self.assertEqual(flight.in_flight(), 0)
+            return leader, follower
+
+        self.assertEqual(asyncio.run(main()), (["a", "cancelled"], ["a", "cancelled"]))
+        self.assertEqual(len(starts), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
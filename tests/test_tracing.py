@@ -0,0 +1,222 @@
+import io
+import os
+import json
+import asyncio
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+import httpx
+import server
+import tracing
+from fastapi.testclient import TestClient
+from ollama_client import ollama
+from scheduler import Scheduler, Priority
+from singleflight import SingleFlight, StreamFlight
+from tracing import TracingMiddleware, TraceWriter, read_traces
+
+
+def ollama_handler(request):
+    if request.url.path == "/api/tags":
+        return httpx.Response(200, json={"models": [{"name": "primary"}, {"name": "backup"}]})
+    payload = json.loads(request.content)
+    final = {"done": True, "load_duration": 1_500_000_000, "prompt_eval_count": 12,
+             "prompt_eval_duration": 200_000_000, "eval_count": 40, "eval_duration": 2_000_000_000}
+    if payload["stream"]:
+        return httpx.Response(200, text="\n".join(json.dumps(c) for c in [
+            {"response": "Hello", "done": False}, dict(final, response=""),
+        ]) + "\n")
+    if payload["model"] == "primary":
+        return httpx.Response(200, json=dict(final, response="Sure! Here are some topics."))
+    return httpx.Response(200, json=dict(
+        final, response='{"children": [{"name": "Sub", "desc": "d", "status": "concept"}]}'))
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        server.expand_cache.clear()
+        server.lesson_cache.clear()
+        server.model_registry.clear()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "traces.jsonl")
+        self.writer = TraceWriter(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        self.dir.cleanup()
+
+    def client(self, server_timing=False):
+        # The app's own middleware joins the trace this one opens
+        app = TracingMiddleware(server.app, writer=self.writer, server_timing=server_timing)
+        return TestClient(app)
+
+    def test_spans_cover_queue_attempts_ollama_and_parsing(self):
+        http = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.MockTransport(ollama_handler))
+        with patch.object(ollama, "_http", http), patch.object(server, "EXPAND_HEDGE_DELAY", 0):
+            body = {"node": "T", "context": "C", "model": "primary", "temperature": 0.5}
+            with self.client(server_timing=True) as client:
+                res = client.post("/expand", json=body, headers={"X-Trace-Id": "abc-123"})
+                cached = client.post("/expand", json=body)
+
+        self.assertEqual(res.headers["x-trace-id"], "abc-123")
+        self.assertIn("ollama-generate;dur=", res.headers["server-timing"])
+        self.assertIn("total;dur=", res.headers["server-timing"])
+
+        self.writer.flush()
+        first, second = read_traces(self.path)
+        self.assertEqual(first["trace_id"], "abc-123")
+        self.assertEqual((first["route"], first["status"], first["node"]), ("/expand", 200, "T"))
+        self.assertEqual(second["trace_id"], cached.headers["x-trace-id"])
+        self.assertEqual(second["cache"], "hit")
+
+        spans = first["spans"]
+        attempts = [s for s in spans if s["name"] == "expand.attempt"]
+        self.assertEqual([(a["model"], a["reason"], a["outcome"]) for a in attempts],
+                         [("primary", "primary", "failed"), ("backup", "failure", "ok")])
+        by_parent = {}
+        for s in spans:
+            by_parent.setdefault(s["parent"], []).append(s["name"])
+        self.assertEqual(by_parent[attempts[1]["id"]], ["queue", "ollama.generate", "parse"])
+        calls = [s for s in spans if s["name"] == "ollama.generate"]
+        self.assertEqual(calls[0]["load_ms"], 1500)
+        self.assertEqual(calls[0]["prompt_eval_ms"], 200)
+        self.assertEqual(calls[0]["eval_ms"], 2000)
+        self.assertEqual(calls[0]["eval_count"], 40)
+        parses = [s for s in spans if s["name"] == "parse"]
+        self.assertEqual(parses[0].get("outcome"), "failed")
+
+    def test_streamed_lesson_records_ttft_and_ollama_durations(self):
+        http = httpx.AsyncClient(base_url=ollama.base_url, transport=httpx.MockTransport(ollama_handler))
+        with patch.object(ollama, "_http", http):
+            with self.client() as client:
+                res = client.post("/analyze", json={"node": "N", "context": "C", "model": "m", "mode": "explain"})
+        self.assertEqual(res.text, "Hello")
+        self.assertNotIn("server-timing", res.headers)
+
+        self.writer.flush()
+        trace, = read_traces(self.path)
+        self.assertEqual(trace["mode"], "explain")
+        stream, = [s for s in trace["spans"] if s["name"] == "ollama.generate"]
+        self.assertEqual(stream["outcome"], "ok")
+        self.assertIn("ttft_ms", stream)
+        self.assertEqual(stream["load_ms"], 1500)
+
+    def test_spans_are_free_without_a_trace(self):
+        with tracing.span("noop") as span:
+            span["x"] = 1
+        tracing.record("noop", 0.1)
+        tracing.tag(node="T")
+        self.assertIsNone(tracing.current())
+
+        async def queued():
+            trace = tracing.Trace("t")
+            tracing._trace.set(trace)
+            async with Scheduler(default_limit=1).slot("m", Priority.EXPAND):
+                pass
+            return trace
+
+        trace = asyncio.run(queued())
+        self.assertEqual([(s["name"], s["model"], s["priority"]) for s in trace.spans], [("queue", "m", "expand")])
+
+    def test_shared_work_spans_reach_every_waiter(self):
+        async def work():
+            with tracing.span("ollama.generate", model="m"):
+                await asyncio.sleep(0.05)
+            return "done"
+
+        async def source():
+            with tracing.span("ollama.generate", model="m"):
+                for chunk in "abc":
+                    await asyncio.sleep(0.01)
+                    yield chunk
+
+        async def request(name, delay, call):
+            trace = tracing.Trace(name)
+            tracing._trace.set(trace)
+            await asyncio.sleep(delay)
+            with tracing.span("handler"):
+                try:
+                    await call()
+                except asyncio.CancelledError:
+                    pass
+            return trace
+
+        async def main():
+            flight, streams = SingleFlight(), StreamFlight()
+
+            async def read_one():
+                # Stops after the first chunk, like a client that disconnects
+                async for _ in streams.subscribe("k", source):
+                    break
+
+            async def read_all():
+                return [c async for c in streams.subscribe("k", source)]
+
+            leader = asyncio.ensure_future(request("leader", 0, lambda: flight.do("k", work)))
+            follower = asyncio.ensure_future(request("follower", 0.01, lambda: flight.do("k", work)))
+            await asyncio.sleep(0.02)
+            # The request that started the work goes away first
+            leader.cancel()
+            traces = [await follower]
+            traces += await asyncio.gather(request("reader", 0, read_one), request("watcher", 0.005, read_all))
+            return traces
+
+        follower, reader, watcher = asyncio.run(main())
+        for trace in (follower, watcher):
+            handler, generate = trace.spans
+            self.assertEqual((generate["name"], generate["model"]), ("ollama.generate", "m"))
+            self.assertEqual(generate["parent"], handler["id"])
+            self.assertIsNotNone(generate["duration_ms"])
+        # Times stay true to the follower's clock: the work began before it joined
+        self.assertLess(follower.spans[1]["start_ms"], follower.spans[0]["start_ms"])
+        # A reader that left early still sees the (then unfinished) work it joined
+        self.assertEqual(reader.spans[1]["name"], "ollama.generate")
+
+    def test_writes_happen_off_the_calling_thread(self):
+        threads = []
+        emit = self.writer._file.emit
+
+        def recording_emit(record):
+            threads.append(threading.get_ident())
+            emit(record)
+
+        with patch.object(self.writer._file, "emit", recording_emit):
+            self.writer.write({"trace_id": "t1"})
+            self.writer.flush()
+        self.assertEqual([t["trace_id"] for t in read_traces(self.path)], ["t1"])
+        self.assertNotIn(threading.get_ident(), threads)
+        self.writer.close()
+        self.writer.close()
+
+    def test_rotation_and_cli_summary(self):
+        writer = TraceWriter(os.path.join(self.dir.name, "small.jsonl"), max_bytes=400, backups=3)
+        for i in range(6):
+            writer.write({"trace_id": f"t{i}", "time": 0, "method": "POST", "route": "/expand", "status": 200,
+                          "duration_ms": 100.0 * (i + 1), "model": "m", "spans": [
+                              {"id": 1, "parent": None, "name": "queue", "start_ms": 0, "duration_ms": 10.0 * i},
+                              {"id": 2, "parent": None, "name": "ollama.generate", "start_ms": 1,
+                               "duration_ms": 50.0, "load_ms": 30.0, "eval_ms": 15.0},
+                          ]})
+        writer.close()
+        self.assertTrue(os.path.exists(writer.path + ".1"))
+        self.assertEqual([t["trace_id"] for t in read_traces(writer.path)][-1], "t5")
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(tracing.main([writer.path, "--top", "2", "--route", "/expand"]), 0)
+        lines = out.getvalue().splitlines()
+        self.assertIn("t5", lines[2])
+        self.assertIn("ollama.generate 50ms", lines[3])
+        self.assertIn("load_ms 30ms", lines[3])
+        self.assertIn("t4", lines[4])
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(tracing.main([writer.path, "--show", "t5"]), 0)
+            self.assertEqual(tracing.main([writer.path, "--show", "missing"]), 1)
+        self.assertIn("queue", out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -57,5 +57,13 @@ class TestUtils(unittest.TestCase):
         # The parser finds the first object and stops if it can properly balance
         self.assertEqual(robust_json_parser(text), '{"a": 1}')
 
+    def test_robust_json_parser_backslash_outside_string(self):
+        # A backslash skips the next character even outside a string, as the
+        # original scanner did: these closers never balance, so the rfind
+        # fallback takes everything up to the last one
+        self.assertEqual(robust_json_parser('[\\],\\}'), '[\\],\\}')
+        self.assertEqual(robust_json_parser('x {\\"a": [1]} \\} y'), '{\\"a": [1]} \\}')
+        self.assertEqual(robust_json_parser('{"a": "\\"}"} tail'), '{"a": "\\"}"}')
+
 if __name__ == '__main__':
     unittest.main()
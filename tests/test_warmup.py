@@ -0,0 +1,74 @@
+import json
+import asyncio
+import unittest
+import httpx
+from ollama_client import OllamaClient
+from registry import ModelRegistry
+from warmup import ModelWarmer
+
+
+class FakeOllama:
+    """Tags/ps/generate backed by a set of loaded models."""
+
+    def __init__(self, installed):
+        self.installed = installed
+        self.loaded = set()
+        self.generated = []
+
+    def handler(self, request):
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": n} for n in self.installed]})
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": [{"name": n} for n in self.loaded]})
+        payload = json.loads(request.content)
+        self.generated.append(payload)
+        self.loaded.add(payload["model"] if ":" in payload["model"] else payload["model"] + ":latest")
+        return httpx.Response(200, json={"response": "", "done": True})
+
+
+def make_warmer(fake, models, **client_kwargs):
+    client = OllamaClient(transport=httpx.MockTransport(fake.handler), **client_kwargs)
+    registry = ModelRegistry(client)
+    registry._vram_loaded = True
+    return ModelWarmer(client, registry, models, check_interval=3600), client
+
+
+class TestModelWarmer(unittest.TestCase):
+    def test_ready_after_warmup_with_keep_alive(self):
+        fake = FakeOllama(["llama3:latest", "big:120b"])
+
+        async def main():
+            warmer, client = make_warmer(fake, ["llama3", "big:120b"], keep_alive={"big:120b": -1},
+                                         default_keep_alive="30m")
+            self.assertFalse(warmer.ready)
+            warmer.start()
+            while not warmer.ready:
+                await asyncio.sleep(0.01)
+            stats = warmer.stats()
+            await warmer.stop()
+            await client.aclose()
+            return stats
+
+        stats = asyncio.run(main())
+        self.assertEqual([(p["model"], p["keep_alive"]) for p in fake.generated],
+                         [("llama3", "30m"), ("big:120b", -1)])
+        self.assertEqual(stats["models"]["llama3"]["state"], "warm")
+
+    def test_check_rewarms_evicted_models_only(self):
+        fake = FakeOllama(["llama3:latest", "other:7b"])
+        fake.loaded = {"other:7b"}
+
+        async def main():
+            warmer, client = make_warmer(fake, ["llama3", "other:7b", "missing"])
+            await warmer.check()
+            await client.aclose()
+            return warmer.stats()
+
+        stats = asyncio.run(main())
+        self.assertEqual([p["model"] for p in fake.generated], ["llama3"])
+        self.assertEqual(stats["models"]["llama3"]["rewarms"], 1)
+        self.assertEqual(stats["models"]["missing"]["state"], "cold")
+
+
+if __name__ == '__main__':
+    unittest.main()
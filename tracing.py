@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Per-request traces: every HTTP request gets a trace ID (X-Trace-Id, reused
+when the client sends one) and a tree of timed spans: scheduler queueing,
+cache lookups, each expansion attempt, JSON parsing and every Ollama call
+with the load/prompt_eval/eval durations Ollama reports.
+
+Finished traces go to a rotating JSONL file (TRACE_FILE) and, with
+TRACE_SERVER_TIMING=1, into a Server-Timing header. For streamed responses
+the header is sent before the body, so it covers the time to first byte.
+
+Spans are kept in a contextvar, so tasks started inside a request (hedged
+fallbacks) attach to it. Work shared by several requests (single-flight
+generations, shared streams) records into its own Shared trace instead,
+and every request that awaits it copies those spans into its own trace;
+they would otherwise belong to whichever request started the work and be
+lost once that request was written. With tracing off, span() costs one
+contextvar lookup.
+
+Traces are written by a background thread, so rotating the file or a slow
+disk never blocks the event loop.
+
+Usage (summarize the slowest traces):
+  python tracing.py traces.jsonl --top 10 --route /expand
+  python tracing.py traces.jsonl --show <trace_id>
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import argparse
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    __slots__ = ("trace_id", "started", "wall", "spans", "attrs", "_ids")
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        self.spans = []
+        self.attrs = {}
+        self._ids = 0
+
+    def add(self, name, start, duration, attrs):
+        self._ids += 1
+        span = {
+            "id": self._ids,
+            "parent": _span.get(),
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2) if duration is not None else None,
+        }
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+        return span
+
+    def timing(self):
+        """Server-Timing value: total milliseconds per span name, plus the request so far."""
+        totals = {}
+        for span in self.spans:
+            if span["duration_ms"] is not None:
+                totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration_ms"]
+        parts = [f"{name.replace('.', '-')};dur={ms:.1f}" for name, ms in totals.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def adopt(self, other):
+        """Copies another trace's spans in, under the current span, with ids and start times rebased."""
+        ids = {}
+        parent = _span.get()
+        offset = round((other.started - self.started) * 1000, 2)
+        for span in list(other.spans):
+            self._ids += 1
+            ids[span["id"]] = self._ids
+            self.spans.append(dict(span, id=self._ids, start_ms=round(span["start_ms"] + offset, 2),
+                                   parent=ids.get(span["parent"], parent)))
+
+
+def current():
+    return _trace.get()
+
+
+def trace_id():
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times the block as a child of the current span; yields its dict for more attributes."""
+    trace = _trace.get()
+    if trace is None:
+        yield {}
+        return
+    start = time.perf_counter()
+    record = trace.add(name, start, None, attrs)
+    token = _span.set(record["id"])
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        _span.reset(token)
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def record(name, duration, **attrs):
+    """Adds a span that already finished `duration` seconds after it started (ending now)."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter() - duration, duration, attrs)
+
+
+class Shared:
+    """
+    Spans of work that several requests wait on. The task doing the work
+    records into a private trace (run() or enter()); each request calls
+    adopt() once it is done with the work to copy the spans into its own.
+    """
+
+    def __init__(self):
+        self.trace = Trace("shared")
+
+    def enter(self):
+        """Records the rest of the current task into the shared trace."""
+        # A task runs in its own copy of the context, so this stays inside it
+        _trace.set(self.trace)
+        _span.set(None)
+
+    async def run(self, coro):
+        self.enter()
+        return await coro
+
+    def adopt(self):
+        trace = _trace.get()
+        if trace is not None and trace is not self.trace:
+            trace.adopt(self.trace)
+
+
+def tag(**attrs):
+    """Attributes of the whole request (node, model, mode...)."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def ollama_attrs(final):
+    """Ollama's own timings from a final response, in milliseconds."""
+    attrs = {}
+    for key in ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration"):
+        if final.get(key):
+            attrs[key.replace("_duration", "_ms")] = round(final[key] / 1e6, 2)
+    for key in ("prompt_eval_count", "eval_count"):
+        if final.get(key):
+            attrs[key] = final[key]
+    return attrs
+
+
+class TraceWriter:
+    """
+    Appends finished traces as JSON lines, rotating at max_bytes. write()
+    only queues the line; a listener thread does the file I/O.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backups=5):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._queue = queue.Queue()
+        self._file = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        self._file.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = QueueListener(self._queue, self._file)
+        self._listener.start()
+        self._logger = logging.getLogger(f"omniweb.traces.{path}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+        self._logger.addHandler(QueueHandler(self._queue))
+
+    def write(self, data):
+        self._logger.info(json.dumps(data, separators=(",", ":")))
+
+    def flush(self):
+        """Blocks until every queued trace is on disk."""
+        self._queue.join()
+        self._file.flush()
+
+    def close(self):
+        if self._listener is None:
+            return
+        # Stopping drains the queue first
+        self._listener.stop()
+        self._listener = None
+        for handler in list(self._logger.handlers):
+            self._logger.removeHandler(handler)
+        self._file.close()
+
+
+def _incoming_id(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"x-trace-id":
+            value = value.decode("latin-1").strip()
+            if 0 < len(value) <= 64 and all(c.isalnum() or c in "-_" for c in value):
+                return value
+    return None
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware: opens the request's trace, adds X-Trace-Id (and
+    Server-Timing) to the response and writes the trace when the last body
+    chunk has been sent. `sample_rate` thins what is written; every request
+    still gets an ID.
+    """
+
+    def __init__(self, app, writer=None, server_timing=False, sample_rate=1.0):
+        self.app = app
+        self.writer = writer
+        self.server_timing = server_timing
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _trace.get() is not None:
+            # Not HTTP, or a mounted app inside an already traced request
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(_incoming_id(scope) or uuid.uuid4().hex[:16])
+        state = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((b"x-trace-id", trace.trace_id.encode()))
+                if self.server_timing:
+                    headers.append((b"server-timing", trace.timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            if self.writer is not None and (self.sample_rate >= 1 or random.random() < self.sample_rate):
+                route = scope.get("route")
+                self.writer.write({
+                    "trace_id": trace.trace_id,
+                    "time": round(trace.wall, 3),
+                    "method": scope["method"],
+                    "route": getattr(route, "path", None) or scope["path"],
+                    "status": state["status"],
+                    "duration_ms": round((time.perf_counter() - trace.started) * 1000, 2),
+                    **trace.attrs,
+                    "spans": trace.spans,
+                })
+
+
+# ---------------------------------------------------------------------------
+# CLI
+
+
+def read_traces(path):
+    """Every trace in the file and its rotated backups (path.1, path.2, ...)."""
+    backups = 0
+    while os.path.exists(f"{path}.{backups + 1}"):
+        backups += 1
+    # Oldest first: path.N ... path.1, path
+    for name in [f"{path}.{n}" for n in range(backups, 0, -1)] + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def phases(trace):
+    """Milliseconds per top-level phase name (spans without a parent, plus Ollama's own durations)."""
+    totals = {}
+    for s in trace["spans"]:
+        if s.get("duration_ms") is None:
+            continue
+        if s["parent"] is None:
+            totals[s["name"]] = totals.get(s["name"], 0.0) + s["duration_ms"]
+        for key in ("load_ms", "prompt_eval_ms", "eval_ms"):
+            if key in s:
+                totals[key] = totals.get(key, 0.0) + s[key]
+    return totals
+
+
+def print_tree(trace):
+    print(f"{trace['trace_id']}  {trace['method']} {trace['route']}  {trace['status']}  {trace['duration_ms']:.0f}ms")
+    children = {}
+    for s in trace["spans"]:
+        children.setdefault(s["parent"], []).append(s)
+
+    def walk(parent, depth):
+        for s in children.get(parent, []):
+            extra = {k: v for k, v in s.items() if k not in ("id", "parent", "name", "start_ms", "duration_ms")}
+            duration = f"{s['duration_ms']:.1f}ms" if s["duration_ms"] is not None else "open"
+            details = " ".join(f"{k}={v}" for k, v in extra.items())
+            print(f"  {'  ' * depth}+{s['start_ms']:>8.1f}ms  {s['name']:<18} {duration:>10}  {details}")
+            walk(s["id"], depth + 1)
+
+    walk(None, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the slowest request traces")
+    parser.add_argument("file", help="Trace JSONL file (TRACE_FILE); rotated backups are read too")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--route", help="Only this route, e.g. /expand")
+    parser.add_argument("--since", type=float, help="Only traces from the last N minutes")
+    parser.add_argument("--show", metavar="TRACE_ID", help="Print one trace's span tree")
+    args = parser.parse_args(argv)
+
+    traces = list(read_traces(args.file))
+    if args.show:
+        for trace in traces:
+            if trace["trace_id"] == args.show:
+                print_tree(trace)
+                return 0
+        print(f"❌ Trace {args.show} not found")
+        return 1
+
+    if args.route:
+        traces = [t for t in traces if t["route"] == args.route]
+    if args.since:
+        cutoff = time.time() - args.since * 60
+        traces = [t for t in traces if t["time"] >= cutoff]
+    if not traces:
+        print("No traces found")
+        return 0
+
+    durations = sorted(t["duration_ms"] for t in traces)
+    pct = lambda p: durations[min(len(durations) - 1, int(p / 100 * len(durations)))]
+    print(f"🔎 {len(traces)} traces  p50 {pct(50):.0f}ms  p95 {pct(95):.0f}ms  p99 {pct(99):.0f}ms\n")
+
+    slowest = sorted(traces, key=lambda t: -t["duration_ms"])[:args.top]
+    for trace in slowest:
+        breakdown = ", ".join(f"{name} {ms:.0f}ms" for name, ms in
+                              sorted(phases(trace).items(), key=lambda kv: -kv[1]))
+        subject = " ".join(f"{k}={trace[k]}" for k in ("model", "node", "mode") if trace.get(k))
+        print(f"{trace['duration_ms']:>8.0f}ms  {trace['trace_id']}  {trace['method']} {trace['route']} "
+              f"{trace['status']}  {subject}")
+        if breakdown:
+            print(f"          {breakdown}")
+    print("\nDetails: python tracing.py FILE --show TRACE_ID")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,8 +3,7 @@ import json
 import shutil
 import subprocess
 import platform
-import requests
-from config import OLLAMA_BASE
+from json_stream import StreamingJSONParser
 
 def robust_json_parser(text):
     # Find the first brace/bracket
@@ -15,58 +14,21 @@ def robust_json_parser(text):
     if start_obj == -1 and start_arr == -1:
         return text
 
-    start = -1
-    if start_obj != -1 and start_arr != -1:
-        start = min(start_obj, start_arr)
-    elif start_obj != -1:
-        start = start_obj
-    elif start_arr != -1:
-        start = start_arr
+    start = min(i for i in (start_obj, start_arr) if i != -1)
 
-    stack = []
-    in_string = False
-    escape = False
-
-    for i in range(start, len(text)):
-        char = text[i]
-
-        if escape:
-            escape = False
-            continue
-
-        if char == '\\':
-            escape = True
-            continue
-
-        if char == '"':
-            in_string = not in_string
-            continue
+    # Fast path: valid JSON is decoded in C and ends exactly where the
+    # balanced scan below would stop
+    try:
+        _, end = json.JSONDecoder().raw_decode(text, idx=start)
+        return text[start:end]
+    except json.JSONDecodeError:
+        pass
 
-        if not in_string:
-            if char == '{':
-                stack.append('{')
-            elif char == '[':
-                stack.append('[')
-            elif char == '}':
-                if stack and stack[-1] == '{':
-                    stack.pop()
-                    if not stack:
-                        return text[start:i+1]
-            elif char == ']':
-                if stack and stack[-1] == '[':
-                    stack.pop()
-                    if not stack:
-                        return text[start:i+1]
-
-    # Fallback: if we didn't find a clean end, revert to the "last brace" strategy as a last resort
-    if start != -1:
-        try:
-            # Attempt to parse one valid JSON object starting from 'start'
-            # raw_decode returns (obj, end_index)
-            _, end = json.JSONDecoder().raw_decode(text, idx=start)
-            return text[start:end]
-        except json.JSONDecodeError:
-            pass
+    # Lenient path: scan to the balanced end of slightly broken JSON
+    parser = StreamingJSONParser(emit_items=False, decode_document=False)
+    parser.feed(text)
+    if parser.done:
+        return parser.document_text
 
     # Fallback to simple extraction if robust parsing fails
     # This might return invalid JSON if multiple objects exist, but it's a best effort
@@ -125,16 +87,6 @@ def get_gpu_vram():
     return None
 
 
-def get_available_models_list():
-    try:
-        res = requests.get(f"{OLLAMA_BASE}/api/tags", timeout=5)
-        if res.status_code == 200:
-            data = res.json()
-            return [m.get('name') for m in data.get('models', []) if m.get('name')]
-        return []
-    except Exception:
-        return []
-
 def filter_children_response(data, recent_nodes):
     """
     Validates and filters the JSON response for children nodes.
@@ -181,3 +133,52 @@ def filter_children_response(data, recent_nodes):
 
     data["children"] = valid_children
     return data
+
+
+def validate_timeline_event(item):
+    """
+    Normalizes one history-mode timeline event.
+    Requires non-empty year, title and description; the year may be numeric.
+    """
+    if not isinstance(item, dict):
+        return None
+
+    event = {}
+    for field in ("year", "title", "description"):
+        value = item.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        event[field] = value.strip()
+    return event
+
+
+def validate_quiz_question(item):
+    """
+    Normalizes one quiz question.
+    Requires a question, exactly 4 string options and a correct_index in 0-3.
+    """
+    if not isinstance(item, dict):
+        return None
+
+    question = item.get("question")
+    options = item.get("options")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(options, list) or len(options) != 4 or not all(isinstance(o, str) for o in options):
+        return None
+
+    correct_index = item.get("correct_index")
+    if isinstance(correct_index, str) and correct_index.strip().isdigit():
+        correct_index = int(correct_index)
+    if not isinstance(correct_index, int) or isinstance(correct_index, bool) or not 0 <= correct_index <= 3:
+        return None
+
+    explanation = item.get("explanation")
+    return {
+        "question": question.strip(),
+        "options": options,
+        "correct_index": correct_index,
+        "explanation": explanation.strip() if isinstance(explanation, str) else "",
+    }
@@ -0,0 +1,111 @@
+import time
+import asyncio
+
+from ollama_client import model_tag
+
+
+class _Warmth:
+    __slots__ = ("state", "load_seconds", "warmed_at", "rewarms", "error")
+
+    def __init__(self):
+        self.state = "cold"
+        self.load_seconds = None
+        self.warmed_at = None
+        self.rewarms = 0
+        self.error = None
+
+
+class ModelWarmer:
+    """
+    Keeps a configured set of models resident in Ollama.
+
+    On start() each model is loaded with an empty prompt, one at a time so
+    loads do not fight over VRAM. The client attaches the model's keep_alive
+    to that and every later request, since each request resets Ollama's
+    unload timer. Afterwards it watches /api/ps through the model registry
+    and reloads any model Ollama evicted, so users do not pay the 10-60 s
+    load on their next click.
+
+    `ready` turns true once the first warm-up pass finished, whether or not
+    every model loaded; per-model results are in stats().
+    """
+
+    def __init__(self, client, registry, models, check_interval=60.0, timeout=300):
+        self.client = client
+        self.registry = registry
+        self.models = list(models)
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.ready = not self.models
+        self._warmth = {m: _Warmth() for m in self.models}
+        self._task = None
+
+    def start(self):
+        if self.models:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def warm(self, model):
+        warmth = self._warmth[model]
+        warmth.state = "warming"
+        start = time.perf_counter()
+        try:
+            await self.client.generate({"model": model, "prompt": ""}, timeout=self.timeout)
+        except Exception as e:
+            warmth.state = "failed"
+            warmth.error = str(e)
+            print(f"❌ Warm-up of {model} failed: {e}")
+            return False
+        warmth.state = "warm"
+        warmth.error = None
+        warmth.load_seconds = round(time.perf_counter() - start, 2)
+        warmth.warmed_at = time.time()
+        print(f"♨️ {model} loaded in {warmth.load_seconds}s")
+        return True
+
+    async def _run(self):
+        for model in self.models:
+            await self.warm(model)
+        self.ready = True
+        # The warm-up loads changed what is resident
+        await self.registry.refresh()
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    async def check(self):
+        """Reloads configured models that /api/ps no longer lists."""
+        await self.registry.refresh()
+        if self.registry.last_error is not None or self.registry.ps_error is not None:
+            # No reliable view of what is loaded; do not reload blindly
+            return
+        installed = set(await self.registry.names())
+        for model in self.models:
+            name = model_tag(model) if model_tag(model) in installed else model
+            if name not in installed or self.registry.is_loaded(name):
+                # Not pulled (nothing to load) or still resident
+                continue
+            print(f"🧊 {model} was evicted. Re-warming...")
+            self._warmth[model].rewarms += 1
+            await self.warm(model)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "models": {
+                model: {
+                    "state": w.state,
+                    "keep_alive": self.client.keep_alive_for(model),
+                    "load_seconds": w.load_seconds,
+                    "warmed_at": w.warmed_at,
+                    "rewarms": w.rewarms,
+                    "error": w.error,
+                }
+                for model, w in self._warmth.items()
+            },
+        }